@@ -1,4 +1,10 @@
-from typing import Sequence
+from typing import Sequence, NamedTuple
+from contextlib import contextmanager
+from collections import OrderedDict
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import numpy as np
 import h5py
@@ -6,8 +12,121 @@ import warnings
 import hdf5plugin
 import re
 import dask.array as da
+from .resample import TCFResampled
+from .statistics import _slab_statistics, merge_statistics, _sidecar_path, _read_sidecar, _write_sidecar, ImageStatistics
+from .memory import get_memory_budget, get_buffer_pool
+from .dedup import DedupChunkStore, is_dedup_export, skeleton_path
 import warnings
 
+# reducers used by `TCFileAbstract.project`: (reduction along an axis, combination of partial results)
+_PROJECTIONS = {
+    'max': (np.max, np.maximum),
+    'min': (np.min, np.minimum),
+    'sum': (lambda data, axis: np.sum(data, axis=axis, dtype=np.float64), np.add),
+    'mean': (lambda data, axis: np.sum(data, axis=axis, dtype=np.float64), np.add),
+}
+
+# access profiles choosing the HDF5 raw data chunk cache from the chunk layout of a dataset
+_ACCESS_PROFILES = ('full-volume', 'z-slab', 'random-patch')
+_MAX_CHUNK_CACHE_NBYTES = 1024 * 2**20
+_MAX_OPEN_DATASETS = 4
+
+def _next_prime(n:int) -> int:
+    is_prime = lambda k: k > 1 and all(k % d for d in range(2, int(k ** 0.5) + 1))
+    while not is_prime(n):
+        n += 1
+    return n
+
+def _access_profile(profile:str, chunks, shape, itemsize:int) -> dict:
+    '''
+    Return
+    ------
+    settings : dict
+        rdcc_nbytes, rdcc_nslots and rdcc_w0 of a dataset for the access profile
+        * 'full-volume': whole images are read at once. A chunk is never revisited.
+        * 'z-slab': images are read slab by slab along the first axis.
+          A whole row of chunks is kept so that each chunk is decompressed once.
+        * 'random-patch': small regions are read at random.
+          As many chunks as possible are kept, regardless of whether they were fully read.
+    '''
+    if profile not in _ACCESS_PROFILES:
+        raise ValueError(f'Unsupported profile: Supported profiles are {_ACCESS_PROFILES}')
+    chunk_nbytes = int(np.prod(chunks)) * itemsize
+    chunk_counts = [-(-size // chunk) for size, chunk in zip(shape, chunks)]
+    if profile == 'full-volume':
+        nchunks, w0 = 1, 1.0
+    elif profile == 'z-slab':
+        nchunks, w0 = int(np.prod(chunk_counts[1:])), 1.0
+    else:
+        nchunks, w0 = int(np.prod(chunk_counts)), 0.0
+    nchunks = max(min(nchunks, _MAX_CHUNK_CACHE_NBYTES // chunk_nbytes), 1)
+    return {
+        'rdcc_nbytes': nchunks * chunk_nbytes,
+        'rdcc_nslots': _next_prime(100 * nchunks),
+        'rdcc_w0': w0,
+    }
+
+# remote files are read in large blocks kept in an LRU cache, so that the many small metadata
+# lookups and chunk reads of HDF5 turn into a few large range requests
+_REMOTE_BLOCK_SIZE = 8 * 2**20
+_REMOTE_CACHE_TYPE = 'blockcache'
+
+def _is_fileobj(tcfname) -> bool:
+    return hasattr(tcfname, 'read') and hasattr(tcfname, 'seek')
+
+def _is_url(tcfname) -> bool:
+    return isinstance(tcfname, str) and '://' in tcfname
+
+def _open_url(url:str, storage_options = None):
+    '''
+    Open a fsspec URL as a file object. `block_size` and `cache_type` in storage_options tune the block cache.
+    '''
+    try:
+        import fsspec
+    except ImportError as e:
+        raise ImportError('fsspec is required to read TCF files from URLs. Install it with "pip install fsspec"') from e
+    storage_options = dict(storage_options or {})
+    block_size = storage_options.pop('block_size', _REMOTE_BLOCK_SIZE)
+    cache_type = storage_options.pop('cache_type', _REMOTE_CACHE_TYPE)
+    fs, path = fsspec.core.url_to_fs(url, **storage_options)
+    return fs.open(path, 'rb', block_size=block_size, cache_type=cache_type)
+
+def _open_h5(tcfname, live = False, storage_options = None, **kwargs):
+    '''
+    Open a TCF file for reading.
+
+    Paramters
+    ---------
+    tcfname : str or file object
+        local path, fsspec URL or file object opened in binary mode.
+        A deduplicated export directory opens its skeleton file.
+
+    Return
+    ------
+    tcf_io : h5py.File
+    fileobj : file object or None
+        file object opened here that must be closed after tcf_io
+    '''
+    if _is_fileobj(tcfname):
+        return h5py.File(tcfname, 'r', **kwargs), None
+    if is_dedup_export(tcfname):
+        tcfname = skeleton_path(tcfname)
+    if _is_url(tcfname):
+        fileobj = _open_url(tcfname, storage_options)
+    elif live:
+        # HDF5 shares the metadata of every handle of a file opened by name in a process, and
+        # cannot refresh groups, so appended data would stay invisible until all of them are closed.
+        # A file object gives an independent handle that sees the current state of the file when reopened,
+        # and takes no file lock that would block the acquisition software.
+        fileobj = open(tcfname, 'rb')
+    else:
+        return h5py.File(tcfname, 'r', **kwargs), None
+    try:
+        return h5py.File(fileobj, 'r', **kwargs), fileobj
+    except BaseException:
+        fileobj.close()
+        raise
+
 def TCFile(tcfname:str, imgtype, channel=0):
     warnings.warn(
         "TCFile function is deprecated and will be removed by the end of 2026. "
@@ -17,14 +136,38 @@ def TCFile(tcfname:str, imgtype, channel=0):
         DeprecationWarning,
         stacklevel=2
     )
+    return _create_reader(tcfname, imgtype, channel)
+
+def file_identity(tcfname, storage_options = None) -> tuple:
+    '''
+    Return
+    ------
+    identity : tuple or None
+        (absolute path or URL, size, modification time) of the file.
+        It changes whenever the file is rewritten, so it can key caches of derived data.
+        None for file objects, whose identity is unknown.
+    '''
+    if _is_fileobj(tcfname):
+        return None
+    if _is_url(tcfname):
+        import fsspec
+        fs, path = fsspec.core.url_to_fs(tcfname, **{k: v for k, v in (storage_options or {}).items()
+                                                     if k not in ('block_size', 'cache_type')})
+        info = fs.info(path)
+        modified = next((info[k] for k in ('mtime', 'LastModified', 'last_modified', 'ETag', 'etag', 'created') if k in info), None)
+        return (tcfname, info.get('size'), str(modified))
+    stat = os.stat(tcfname)
+    return (os.path.abspath(tcfname), stat.st_size, stat.st_mtime_ns)
+
+def _create_reader(tcfname:str, imgtype, channel=0, **kwargs):
     if imgtype == '3D':
-        return TCFileRI3D(tcfname)
+        return TCFileRI3D(tcfname, **kwargs)
     if imgtype == '2DMIP':
-        return TCFileRI2DMIP(tcfname)
+        return TCFileRI2DMIP(tcfname, **kwargs)
     if imgtype == 'BF':
-        return TCFileBF(tcfname)
+        return TCFileBF(tcfname, **kwargs)
     if imgtype == '3DFL':
-        return TCFileFL3D(tcfname, channel)
+        return TCFileFL3D(tcfname, channel, **kwargs)
     raise ValueError('Unsupported imgtype: Supported imgtypes are "3D", "2DMIP", "BF", and "3DFL"')
 
 class TCFileAbstract(Sequence):
@@ -45,17 +188,44 @@ class TCFileAbstract(Sequence):
         (unit: μm) resolution of data. It represents unit resolution per pixel
     dt : float
         (unit: s) Time steps of data. Zero if it is single shot data
-    tcfname : str
+    tcfname : str or file object
+    pool : TCFProcessPool or None
+        process pool decoding the reads of `read`. None decodes in the calling process
+    profile : str or None
+        access profile tuning the HDF5 chunk cache. See `__init__`
+    live : bool
+        whether the file is followed while it is being written. See `refresh`
     '''
     imgtype = None
     data_ndim = None
 
-    def __init__(self, tcfname:str):
+    def __init__(self, tcfname:str, pool = None, profile = None, rdcc_nbytes = None, rdcc_nslots = None,
+                 rdcc_w0 = None, page_buf_size = None, live = False, storage_options = None):
         '''
         Paramters
         ---------
-        tcfname : str
-            location of the target TCF file
+        tcfname : str or file object
+            location of the target TCF file: a local path, a fsspec URL (e.g. 'http://...', 'memory://...')
+            or a file object opened in binary mode
+        pool : TCFProcessPool or None
+            process pool decoding the reads of `read`
+        profile : str or None
+            'full-volume', 'z-slab' or 'random-patch'.
+            The HDF5 chunk cache of each dataset is sized from its chunk shape for the access pattern.
+        rdcc_nbytes, rdcc_nslots, rdcc_w0 : int, int, float or None
+            HDF5 raw data chunk cache settings. They override the ones chosen by profile.
+        page_buf_size : int or None
+            HDF5 page buffer size. It only takes effect on files written with paged aggregation.
+        live : bool
+            follow an ongoing acquisition with `refresh` and `watch`.
+            The file is opened without file locks, independently of other handles of this process.
+        storage_options : dict or None
+            options of the fsspec filesystem for URLs.
+            `block_size` (default 8 MiB) and `cache_type` (default 'blockcache') tune the read cache.
+
+        With a profile, chunk cache or page buffer settings, the file is kept open so that the cache is reused
+        between reads. Call `close` to release it. Otherwise a local file is opened on each read, so that
+        it is not kept locked against writers.
 
         Raises
         ------
@@ -65,22 +235,112 @@ class TCFileAbstract(Sequence):
         assert isinstance(self.imgtype, str), 'imgtype should be specified by maintainer. Contact authors'
         assert isinstance(self.data_ndim, int), 'data_ndim should be specified by maintainer. Contact authors'
 
+        if profile is not None and profile not in _ACCESS_PROFILES:
+            raise ValueError(f'Unsupported profile: Supported profiles are {_ACCESS_PROFILES}')
         self.tcfname = tcfname
-        with h5py.File(tcfname) as tcf_io:
+        self.pool = pool
+        self.profile = profile
+        self._chunk_cache = {name: value for name, value in
+                             (('rdcc_nbytes', rdcc_nbytes), ('rdcc_nslots', rdcc_nslots), ('rdcc_w0', rdcc_w0))
+                             if value is not None}
+        self._file_kwargs = dict(self._chunk_cache)
+        if page_buf_size is not None:
+            self._file_kwargs['page_buf_size'] = page_buf_size
+        self.live = live
+        self.storage_options = storage_options
+        # a local file opened by name is locked by HDF5 while open: it is kept open only for the configured caches
+        self._keep_handle = (profile is not None or bool(self._file_kwargs) or live
+                             or _is_fileobj(tcfname) or _is_url(tcfname))
+        # to open other image types of the same file the same way
+        self._reader_kwargs = dict(profile = profile, rdcc_nbytes = rdcc_nbytes, rdcc_nslots = rdcc_nslots, rdcc_w0 = rdcc_w0,
+                                   page_buf_size = page_buf_size, live = live, storage_options = storage_options)
+        self._output_dtype = None
+        self._refreshed_identity = None
+        self._timepoint_attrs = {}
+        self._tile_placements = {}
+        self._init_handle()
+        with self._open() as tcf_io:
             assert 'Data' in tcf_io, 'The given file is not TCF file'
             assert self.imgtype in tcf_io['Data'], 'The current imgtype is not supported in this file'
             # load attributes
             self.format_version = self.get_attr(tcf_io, '/', 'FormatVersion')
             if not isinstance(self.format_version, str):
                 self.format_version = self.format_version.decode('UTF-8')
+            self._load_data_info(tcf_io)
+            if live:
+                self.length = self._count_available(tcf_io, 0)
+
+    def _load_data_info(self, tcf_io):
+        '''
+        Load the attributes of the image type group
+        '''
+        data_info_path = f'/Data/{self.imgtype}'
+        get_data_info_attr = lambda attr_name: self.get_attr(tcf_io, data_info_path, attr_name, default = 0)
 
-            data_info_path = f'/Data/{self.imgtype}'
-            get_data_info_attr = lambda attr_name: self.get_attr(tcf_io, data_info_path, attr_name, default = 0)
+        self.data_shape = list(get_data_info_attr(f'Size{axis}') for axis in  ('Z', 'Y', 'X')[3-self.data_ndim:])
+        self.data_resolution = list(get_data_info_attr(f'Resolution{axis}') for axis in  ('Z', 'Y', 'X')[3-self.data_ndim:])
+        self.length = get_data_info_attr('DataCount')
+        self.dt = 0 if self.length == 1 else get_data_info_attr('TimeInterval')
 
-            self.data_shape = list(get_data_info_attr(f'Size{axis}') for axis in  ('Z', 'Y', 'X')[3-self.data_ndim:])
-            self.data_resolution = list(get_data_info_attr(f'Resolution{axis}') for axis in  ('Z', 'Y', 'X')[3-self.data_ndim:])
-            self.length = get_data_info_attr('DataCount')
-            self.dt = 0 if self.length == 1 else get_data_info_attr('DataCount')
+    def _count_available(self, tcf_io, start:int) -> int:
+        '''
+        Return the number of consecutive images written in the file, assuming the first `start` ones exist.
+        DataCount may be updated before or after the data by the acquisition software, so the entries themselves are checked.
+        '''
+        length = start
+        while self._data_path(length) in tcf_io:
+            length += 1
+        return length
+
+    def refresh(self) -> range:
+        '''
+        Update the reader with the images appended since the last refresh.
+        Nothing is read unless the size or modification time of the file changed.
+        Otherwise the file is reopened and only the attributes of the image type group and the new entries are read.
+
+        Return
+        ------
+        new_keys : range
+            indices of the new images
+        '''
+        old_length = self.length
+        identity = file_identity(self.tcfname, self.storage_options)
+        if identity is not None and identity == self._refreshed_identity:
+            return range(old_length, old_length)
+        with self._lock:
+            self.close()
+            with self._open() as tcf_io:
+                self._load_data_info(tcf_io)
+                self.length = self._count_available(tcf_io, old_length)
+            self._refreshed_identity = identity
+        return range(old_length, self.length)
+
+    def watch(self, poll_interval = 1.0, timeout = None, start = None):
+        '''
+        Yield the indices of images as they are written.
+
+        Parameters
+        ----------
+        poll_interval : float
+            (unit: s) waiting time between two refreshes
+        timeout : float or None
+            (unit: s) stop after no new image appeared for this long. None waits forever
+        start : int or None
+            first index to yield. None yields only the images appended from now on
+        '''
+        key = self.length if start is None else start
+        last_update = time.monotonic()
+        while True:
+            if key >= self.length:
+                self.refresh()
+            if key < self.length:
+                yield from range(key, self.length)
+                key = self.length
+                last_update = time.monotonic()
+                continue
+            if timeout is not None and time.monotonic() - last_update >= timeout:
+                return
+            time.sleep(poll_interval)
 
     def copy(self, output_file_path, compression_opt = {}):
         """
@@ -119,7 +379,7 @@ class TCFileAbstract(Sequence):
                     group_out_sub = group_out.create_group(key)
                     recursively_copy_and_compress(item_in, group_out_sub)
 
-        with h5py.File(self.tcfname, 'r') as file_in:
+        with self._open() as file_in:
             with h5py.File(output_file_path, 'w') as file_out:
                 recursively_copy_and_compress(file_in, file_out)
 
@@ -161,78 +421,698 @@ class TCFileAbstract(Sequence):
         if key < -length or key >= length:
             raise IndexError(f'{self.__class__} index out of range')
         key = (key + length) % length
-        data_path = f'/Data/{self.imgtype}/{key:06d}'
+        data_path = self._data_path(key)
         return data_path
 
+    def _data_path(self, key:int) -> str:
+        return f'/Data/{self.imgtype}/{key:06d}'
+
+    def _init_handle(self):
+        self._handle = None
+        self._handle_pid = None
+        self._fileobj = None
+        self._open_datasets = OrderedDict()
+        self._lock = threading.RLock()
+        # chunk caches of the access profile are charged to the memory budget
+        self._dataset_nbytes = {}
+        self._memory = None
+        # chunks of the image datasets of a deduplicated export
+        self._dedup = None
+        # reader of /Data/2DMIP reused by `project`
+        self._mip = None
+
+    @contextmanager
+    def _open(self):
+        '''
+        Return the TCF file opened for reading.
+        A kept handle is opened once per process. Otherwise the file is opened for this access only.
+        '''
+        if not self._keep_handle:
+            with self._lock:
+                if self._dedup is None and is_dedup_export(self.tcfname):
+                    self._dedup = DedupChunkStore.open(self.tcfname)
+            tcf_io, fileobj = _open_h5(self.tcfname, self.live, self.storage_options, **self._file_kwargs)
+            try:
+                yield tcf_io
+            finally:
+                tcf_io.close()
+                if fileobj is not None:
+                    fileobj.close()
+            return
+        with self._lock:
+            if self._handle is None or self._handle_pid != os.getpid() or not self._handle.id.valid:
+                self._close_datasets()
+                self._handle, self._fileobj = _open_h5(self.tcfname, self.live, self.storage_options, **self._file_kwargs)
+                self._handle_pid = os.getpid()
+                if is_dedup_export(self.tcfname):
+                    self._dedup = DedupChunkStore.open(self.tcfname)
+            tcf_io = self._handle
+        yield tcf_io
+
+    def _get_object(self, tcf_io, data_path:str):
+        '''
+        Return the HDF5 object at data_path.
+        Recently used datasets of the kept handle stay open with the chunk cache of the access profile,
+        because HDF5 discards the chunk cache of a dataset when it is closed.
+        '''
+        if tcf_io is not self._handle:
+            obj = tcf_io[data_path]
+            return obj if self._dedup is None else self._dedup.wrap(data_path, obj)
+        with self._lock:
+            obj = self._open_datasets.get(data_path)
+            if obj is not None:
+                self._open_datasets.move_to_end(data_path)
+                return obj
+            obj = tcf_io[data_path]
+            if not isinstance(obj, h5py.Dataset):
+                return obj
+            if self.profile is not None and obj.chunks is not None:
+                settings = _access_profile(self.profile, obj.chunks, obj.shape, obj.dtype.itemsize)
+                settings.update(self._chunk_cache)
+                # an already open dataset would be shared by HDF5 together with its default chunk cache
+                obj = None
+                dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+                dapl.set_chunk_cache(settings['rdcc_nslots'], settings['rdcc_nbytes'], settings['rdcc_w0'])
+                obj = h5py.Dataset(h5py.h5d.open(tcf_io.id, data_path.encode(), dapl))
+                if self._memory is None:
+                    self._memory = get_memory_budget().register('HDF5 chunk caches', self._evict_datasets, priority=1)
+                self._dataset_nbytes[data_path] = settings['rdcc_nbytes']
+                self._memory.charge(settings['rdcc_nbytes'])
+            if self._dedup is not None:
+                obj = self._dedup.wrap(data_path, obj)
+            self._open_datasets[data_path] = obj
+            while len(self._open_datasets) > _MAX_OPEN_DATASETS:
+                self._pop_dataset()
+            return obj
+
+    def _pop_dataset(self) -> int:
+        '''
+        Close the least recently used dataset. Return the size of the chunk cache released.
+        '''
+        data_path, _ = self._open_datasets.popitem(last=False)
+        nbytes = self._dataset_nbytes.pop(data_path, 0)
+        if nbytes:
+            self._memory.release(nbytes)
+        return nbytes
+
+    def _close_datasets(self):
+        while self._open_datasets:
+            self._pop_dataset()
+
+    def _evict_datasets(self, nbytes:int) -> int:
+        '''
+        Close datasets until nbytes of chunk caches are released, when asked by the memory budget.
+        Nothing is released while the reader is busy.
+        '''
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            freed = 0
+            while freed < nbytes and self._open_datasets:
+                freed += self._pop_dataset()
+            return freed
+        finally:
+            self._lock.release()
+
+    def close(self):
+        '''
+        Close the kept file handle. It is reopened on the next read.
+        '''
+        with self._lock:
+            self._close_datasets()
+            if self._handle is not None and self._handle_pid == os.getpid():
+                self._handle.close()
+                if self._fileobj is not None:
+                    self._fileobj.close()
+            if self._dedup is not None:
+                self._dedup.close()
+            if self._mip is not None:
+                self._mip.close()
+            self._handle = None
+            self._fileobj = None
+            self._dedup = None
+            self._mip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def _normalize_region(self, region) -> tuple:
+        '''
+        Return
+        ------
+        region : tuple[slice]
+            one slice per axis of a single image. Missing axes or None select the whole axis.
+
+        Raises
+        ------
+        TypeError
+            If region is not composed of slices
+        '''
+        if region is None:
+            region = ()
+        if isinstance(region, slice):
+            region = (region,)
+        region = tuple(slice(None) if r is None else r for r in region)
+        if len(region) > self.data_ndim:
+            raise IndexError(f'{self.__class__} region has {len(region)} axes, but data has {self.data_ndim} axes')
+        if not all(isinstance(r, slice) for r in region):
+            raise TypeError(f'{self.__class__} region must be composed of slices')
+        region = region + (slice(None),) * (self.data_ndim - len(region))
+        return tuple(slice(*r.indices(size)) for r, size in zip(region, self.data_shape))
+
+    def _read_region(self, tcf_io, key:int, region:tuple) -> np.ndarray:
+        '''
+        Read a normalized region of a single image from an opened TCF file.
+        Subclasses override this to decode raw data into a desired format.
+        '''
+        return self._get_object(tcf_io, self.get_data_location(key))[region]
+
+    def read(self, key:int, region = None) -> np.ndarray:
+        '''
+        Read a sub-region of a single image. Only the HDF5 chunks intersecting the region are decoded.
+
+        Parameters
+        ----------
+        key : int
+            index of the image
+        region : tuple[slice] or None
+            (Z, Y, X) slices for 3D data and (Y, X) slices for 2D data. None reads the whole image.
+
+        Return
+        ------
+        data : numpy.ndarray
+            the same values as `self[key][region]`
+        '''
+        if self.pool is not None:
+            return self.pool.read(self, key, region)
+        self.get_data_location(key)
+        region = self._normalize_region(region)
+        with self._open() as tcf_io:
+            return self._read_region(tcf_io, key, region)
+
+    def _get_output_dtype(self, key:int) -> np.dtype:
+        '''
+        Return the data type returned by `read`. It is assumed to be identical for every image.
+        '''
+        if self._output_dtype is None:
+            with self._open() as tcf_io:
+                self._output_dtype = np.dtype(self._region_dtype(tcf_io, key))
+        return self._output_dtype
+
+    def _region_dtype(self, tcf_io, key:int):
+        return self._get_object(tcf_io, self.get_data_location(key)).dtype
+
+    def _get_tile_placements(self, tcf_io, key:int) -> list:
+        '''
+        Return the placements of the tiles of an image of the experimental tiled format, read once per image.
+        '''
+        data_path = self.get_data_location(key)
+        placements = self._tile_placements.get(data_path)
+        if placements is None:
+            placements = _tile_placements(self._get_object(tcf_io, data_path), self.data_ndim)
+            self._tile_placements[data_path] = placements
+        return placements
+
+    def _read_tiles(self, tcf_io, key:int, region:tuple) -> np.ndarray:
+        '''
+        Stitch a normalized region of an image of the experimental tiled format. See `_stitch_tiles`.
+        '''
+        group = self._get_object(tcf_io, self.get_data_location(key))
+        return _stitch_tiles(group, self._get_tile_placements(tcf_io, key), region)
+
+    def _lazy_tiles(self, tcf_io, key:int) -> da.Array:
+        '''
+        Return an image of the experimental tiled format as a dask array whose blocks are stitched on compute.
+        Blocks are as large as the tiles, so that each one reads few of them.
+        '''
+        placements = self._get_tile_placements(tcf_io, key)
+        chunks = tuple(min(max((p.last[axis] - p.offset[axis] + 1 for p in placements), default=size), size)
+                       for axis, size in enumerate(self.data_shape))
+        dtype = self._region_dtype(tcf_io, key)
+        return da.from_array(_LazyImage(self, key, dtype), chunks=chunks, meta=np.empty((0,) * self.data_ndim, dtype=dtype))
+
+    def __getstate__(self):
+        # a process pool and file handles cannot be sent to other processes
+        state = self.__dict__.copy()
+        state['pool'] = None
+        for name in ('_handle', '_handle_pid', '_fileobj', '_open_datasets', '_lock', '_dataset_nbytes', '_memory', '_dedup', '_mip'):
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_handle()
+
+    def _iter_slabs(self, tcf_io, key:int, region:tuple):
+        '''
+        Split region into slabs along the first axis that are aligned to the HDF5 chunks,
+        so that each chunk is decoded once while streaming.
+        '''
+        obj = self._get_object(tcf_io, self.get_data_location(key))
+        first = region[0]
+        if not (isinstance(obj, h5py.Dataset) and obj.chunks is not None and first.step == 1):
+            yield region
+            return
+        thickness = obj.chunks[0]
+        boundaries = [first.start] + list(range((first.start // thickness + 1) * thickness, first.stop, thickness)) + [first.stop]
+        for start, stop in zip(boundaries[:-1], boundaries[1:]):
+            yield (slice(start, stop, 1),) + region[1:]
+
+    def project(self, key = None, axis = 'z', op = 'max', region = None, workers = None, use_stored = True) -> np.ndarray:
+        '''
+        Project image(s) along a spatial axis while streaming chunk-aligned slabs,
+        so that a whole volume is never held in memory.
+
+        Parameters
+        ----------
+        key : int or None
+            index of the image. None projects every image.
+        axis : str
+            'z', 'y' or 'x' ('y' or 'x' for 2D data)
+        op : str
+            'max', 'min', 'mean' or 'sum'
+        region : tuple[slice] or None
+            sub-region to project. See `read`
+        workers : int or None
+            number of threads decoding slabs in parallel
+        use_stored : bool
+            reuse `/Data/2DMIP` for a Z maximum projection of `/Data/3D` if it matches the request
+
+        Return
+        ------
+        data : numpy.ndarray
+            projected image, or (T, ...) stacked images if key is None.
+            'sum' and 'mean' are computed in float64.
+
+        Raises
+        ------
+        ValueError
+            If axis or op is unsupported
+        '''
+        axes = ('z', 'y', 'x')[3-self.data_ndim:]
+        if axis not in axes:
+            raise ValueError(f'Unsupported axis: Supported axes are {axes}')
+        if op not in _PROJECTIONS:
+            raise ValueError(f'Unsupported op: Supported ops are {tuple(_PROJECTIONS)}')
+        axis = axes.index(axis)
+        keys = range(len(self)) if key is None else [key]
+        for k in keys:
+            self.get_data_location(k)
+        region = self._normalize_region(region)
+
+        if use_stored and op == 'max' and axis == 0 and self._stored_mip_matches(region):
+            mip = self._stored_mip()
+            projections = [mip.read(k, region[1:]) for k in keys]
+            return projections[0] if key is not None else np.stack(projections)
+
+        reduce, combine = _PROJECTIONS[op]
+        with self._open() as tcf_io, ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = [(k, slab) for k in keys for slab in self._iter_slabs(tcf_io, k, region)]
+            read_slab = (lambda job: self.read(*job)) if self.pool is not None else (lambda job: self._read_region(tcf_io, *job))
+            partials = executor.map(lambda job: reduce(read_slab(job), axis=axis), jobs)
+            projections = {}
+            for (k, _), partial in zip(jobs, partials):
+                if k not in projections:
+                    projections[k] = [partial]
+                elif axis == 0:
+                    projections[k][0] = combine(projections[k][0], partial)
+                else:
+                    projections[k].append(partial)
+        projections = [p[0] if axis == 0 else np.concatenate(p, axis=0) for p in projections.values()]
+        if op == 'mean':
+            count = len(range(region[axis].start, region[axis].stop, region[axis].step))
+            projections = [p / count for p in projections]
+        return projections[0] if key is not None else np.stack(projections)
+
+    def statistics(self, key = None, bins = 1024, value_range = None, workers = None, use_stored = True, cache = True):
+        '''
+        Compute exact min/max/mean/std and a fixed-bin histogram per image while streaming chunk-aligned slabs.
+
+        Parameters
+        ----------
+        key : int or None
+            index of the image. None computes the statistics of every image.
+        bins : int
+            number of histogram bins
+        value_range : tuple[float] or None
+            histogram range. Values outside of it are counted in the outer bins.
+            None takes the stored RIMin/RIMax of RI data (if use_stored), otherwise the range of the
+            stored data type, otherwise the range of the data found by a first pass.
+        workers : int or None
+            number of threads decoding slabs in parallel
+        use_stored : bool
+            use the stored RIMin/RIMax as histogram range, which avoids a pass over the data
+        cache : bool
+            keep the results in `<tcfname>.stats.json` next to a local file, so that later queries are instant.
+            The cache is discarded when the file changes.
+
+        Return
+        ------
+        statistics : ImageStatistics or list[ImageStatistics]
+            statistics of the image, or of every image if key is None. See `merge_statistics` to combine them.
+        '''
+        keys = range(len(self)) if key is None else [key]
+        keys = [int(self.get_data_location(k)[-6:]) for k in keys]
+        if value_range is None:
+            with self._open() as tcf_io:
+                if use_stored and self.imgtype in ('3D', '2DMIP'):
+                    group_path = f'/Data/{self.imgtype}'
+                    ri_range = (self.get_attr(tcf_io, group_path, 'RIMin'), self.get_attr(tcf_io, group_path, 'RIMax'))
+                    if None not in ri_range and ri_range[1] > ri_range[0]:
+                        value_range = ri_range
+                if value_range is None:
+                    value_range = self._value_range(tcf_io, keys[0])
+        if value_range is None:
+            extrema = self._map_slabs(keys, lambda data: (data.min(), data.max()) if data.size else (np.inf, -np.inf),
+                                      lambda partials: (min(p[0] for p in partials), max(p[1] for p in partials)), workers)
+            value_range = (min(lo for lo, _ in extrema.values()), max(hi for _, hi in extrema.values()))
+        value_range = tuple(float(v) for v in value_range)
+
+        sidecar = _sidecar_path(self.tcfname) if cache else None
+        name = f'{self._data_path(0)[:-7]}|bins={bins}|range={value_range}'
+        results = {}
+        if sidecar is not None:
+            identity = file_identity(self.tcfname)
+            cached = _read_sidecar(sidecar, identity).get(name, {})
+            results = {k: ImageStatistics.from_dict(cached[str(k)]) for k in keys if str(k) in cached}
+        missing = [k for k in keys if k not in results]
+        if missing:
+            computed = self._map_slabs(missing, lambda data: _slab_statistics(data, bins, value_range), merge_statistics, workers)
+            if sidecar is not None:
+                _write_sidecar(sidecar, identity, name, computed)
+            results.update(computed)
+        return results[keys[0]] if key is not None else [results[k] for k in keys]
+
+    def _map_slabs(self, keys, function, merge, workers = None) -> dict:
+        '''
+        Apply function to the chunk-aligned slabs of whole images in parallel, and merge the list of results per image.
+        '''
+        region = self._normalize_region(None)
+        with self._open() as tcf_io, ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = [(k, slab) for k in keys for slab in self._iter_slabs(tcf_io, k, region)]
+            read_slab = (lambda job: self.read(*job)) if self.pool is not None else (lambda job: self._read_region(tcf_io, *job))
+            partials = executor.map(lambda job: function(read_slab(job)), jobs)
+            results = {}
+            for (k, _), partial in zip(jobs, partials):
+                results.setdefault(k, []).append(partial)
+        return {k: merge(p) for k, p in results.items()}
+
+    def _value_range(self, tcf_io, key:int):
+        '''
+        Return the range of the values `read` can return given the stored data type, or None if it is unbounded.
+        '''
+        obj = self._get_object(tcf_io, self.get_data_location(key))
+        if isinstance(obj, h5py.Dataset) and np.issubdtype(obj.dtype, np.integer):
+            info = np.iinfo(obj.dtype)
+            return (float(info.min), float(info.max) + 1)
+        return None
+
+    def _stored_mip(self):
+        '''
+        Return the reader of `/Data/2DMIP`, opened once with the options of this reader and closed with it.
+        '''
+        with self._lock:
+            if self._mip is None:
+                self._mip = TCFileRI2DMIP(self.tcfname, self.pool, **self._reader_kwargs)
+            return self._mip
+
+    def _stored_mip_matches(self, region:tuple) -> bool:
+        '''
+        Check whether `/Data/2DMIP` holds the Z maximum projection of the requested region.
+        '''
+        if self.imgtype != '3D' or region[0] != slice(0, self.data_shape[0], 1):
+            return False
+        with self._open() as tcf_io:
+            if '2DMIP' not in tcf_io['Data']:
+                return False
+            get_mip_attr = lambda attr_name: self.get_attr(tcf_io, '/Data/2DMIP', attr_name, default = 0)
+            return get_mip_attr('DataCount') == self.length and \
+                [get_mip_attr('SizeY'), get_mip_attr('SizeX')] == list(self.data_shape[1:])
+
     def asdask(self) -> np.ndarray:
         dask_arrays = [self.__getitem__(i, array_type='dask') for i in range(len(self))]
         rst = da.stack(dask_arrays)
         return rst
 
+    def get_timepoint_attrs(self, names = None) -> dict:
+        '''
+        Read attributes of every image (e.g. PositionX/Y/Z/C, Time, RecordingTime, RIMin/RIMax) into columns.
+        Attributes are read with low-level HDF5 calls straight into the columns and cached,
+        so only images appended since the last call (see `refresh`) are read again.
+
+        Paramters
+        ---------
+        names : sequence of str or None
+            attribute names. None reads every attribute of the first image.
+
+        Return
+        ------
+        attrs : dict[str, numpy.ndarray]
+            read-only array of length `len(self)` per attribute. Byte strings are decoded to str.
+            Images without the attribute get NaN, 0 or '' depending on its type.
+
+        Raises
+        ------
+        KeyError
+            If no image has one of the attributes
+        '''
+        with self._lock, self._open() as tcf_io:
+            if names is None:
+                names = list(tcf_io[self._data_path(0)].attrs) if self.length > 0 else []
+            outdated = [name for name in names
+                        if len(self._timepoint_attrs.get(name, ())) < self.length]
+            if outdated:
+                self._read_timepoint_attrs(tcf_io, outdated)
+            return {name: self._timepoint_attrs[name][:self.length] for name in names}
+
+    def _read_timepoint_attrs(self, tcf_io, names:list):
+        start = min(len(self._timepoint_attrs.get(name, ())) for name in names)
+        count = self.length - start
+        columns = {}
+        # memory types of numeric columns, which HDF5 converts into without further checks
+        mtypes = {}
+        encoded_names = [(name, name.encode()) for name in names]
+        for i, key in enumerate(range(start, self.length)):
+            oid = h5py.h5o.open(tcf_io.id, self._data_path(key).encode())
+            for name, encoded_name in encoded_names:
+                try:
+                    aid = h5py.h5a.open(oid, encoded_name)
+                except KeyError:
+                    continue
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = np.full(count, _missing_value(aid.dtype), dtype=aid.dtype)
+                    if column.dtype.kind in 'biuf':
+                        mtypes[name] = h5py.h5t.py_create(column.dtype)
+                if name in mtypes:
+                    try:
+                        aid.read(column[i:i + 1], mtypes[name])
+                        continue
+                    except TypeError:
+                        # not a single value
+                        pass
+                value = np.empty(aid.shape, dtype=aid.dtype)
+                aid.read(value)
+                if value.dtype.kind == 'S' and value.dtype.itemsize > column.dtype.itemsize:
+                    # a longer string than the previous ones
+                    column = columns[name] = column.astype(value.dtype)
+                column[i] = value.flat[0] if value.size > 0 else _missing_value(column.dtype)
+
+        for name in names:
+            cached = self._timepoint_attrs.get(name)
+            column = columns.get(name)
+            if column is None:
+                if cached is None:
+                    raise KeyError(f'No image has the attribute {name}')
+                column = np.full(count, _missing_value(cached.dtype), dtype=cached.dtype)
+            elif column.dtype.kind in 'SO':
+                column = np.array([v.decode('UTF-8') if isinstance(v, bytes) else v for v in column], dtype=str)
+            if cached is not None:
+                column = np.concatenate([cached[:start], column])
+            column.setflags(write=False)
+            self._timepoint_attrs[name] = column
+
+    def resampled(self, voxel_size, workers = None):
+        '''
+        Return a lazy view of the data resampled to voxel_size (unit: μm), e.g. isotropic voxels.
+        See `TCFResampled`.
+        '''
+        return TCFResampled(self, voxel_size, workers)
+
     @staticmethod
     def get_attr(tcf_io, path, attr_name, default = None):
         attr_value = tcf_io[path].attrs.get(attr_name, default = [default])[0]
         return attr_value
 
+def _missing_value(dtype:np.dtype):
+    '''
+    Return the value of images without an attribute of this type.
+    '''
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'fc':
+        return np.nan
+    if dtype.kind in 'SUO':
+        return b'' if dtype.kind == 'S' else ''
+    return 0
+
+def _read_scaled(obj:h5py.Dataset, region:tuple, divisor:float) -> np.ndarray:
+    '''
+    Return obj[region] / divisor in float32.
+    The raw data is read into a pooled buffer, so only the output is allocated per read.
+    '''
+    shape = tuple(len(range(*r.indices(size))) for r, size in zip(region, obj.shape))
+    if 0 in shape or any((r.step or 1) < 1 for r in region):
+        data = obj[region].astype(np.float32)
+        data /= divisor
+        return data
+    buffer_pool = get_buffer_pool()
+    raw = buffer_pool.acquire(shape, obj.dtype)
+    try:
+        obj.read_direct(raw, region)
+        return np.divide(raw, np.float32(divisor), dtype=np.float32)
+    finally:
+        buffer_pool.release(raw)
+
+class _TilePlacement(NamedTuple):
+    '''
+    Tile of the experimental tiled format. It covers the voxels offset to last (inclusive) of the image,
+    with one sample every `step` voxels along each axis.
+    '''
+    name: str
+    step: int
+    offset: tuple
+    last: tuple
+
+def _tile_placements(group:h5py.Group, ndim:int) -> list:
+    '''
+    Return the placement of every tile of an image of the experimental tiled format.
+    '''
+    axes = ('Z', 'Y', 'X')[3-ndim:]
+    placements = []
+    for name in sorted(group.keys()):
+        if not re.match(r'^TILE_\d+$', name):
+            continue
+        attrs = group[name].attrs
+        get_tile_attr = lambda attr_name: int(attrs.get(attr_name, [1])[0])
+        placements.append(_TilePlacement(name, max(get_tile_attr('SamplingStep'), 1),
+                                         tuple(get_tile_attr(f'DataIndexOffsetPoint{axis}') for axis in axes),
+                                         tuple(get_tile_attr(f'DataIndexLastPoint{axis}') for axis in axes)))
+    return placements
+
+def _read_tile(tile:h5py.Dataset, placement:_TilePlacement, lo:Sequence[int], hi:Sequence[int]) -> np.ndarray:
+    '''
+    Return the values of a tile at the voxels lo to hi (exclusive) of the image.
+    Only the samples covering them are read, and repeated along each axis if the tile is subsampled.
+    '''
+    step = placement.step
+    first = [(l - o) // step for l, o in zip(lo, placement.offset)]
+    stop = [(h - 1 - o) // step + 1 for h, o in zip(hi, placement.offset)]
+    samples = tile[tuple(slice(f, s) for f, s in zip(first, stop))]
+    if step == 1:
+        return samples
+    for axis, (l, h, o, f) in enumerate(zip(lo, hi, placement.offset, first)):
+        samples = np.take(samples, (np.arange(l, h) - o) // step - f, axis=axis)
+    return samples
+
+def _stitch_tiles(group:h5py.Group, placements:list, region:tuple) -> np.ndarray:
+    '''
+    Return a normalized region of a tiled image in float32. Overlapping tiles are averaged,
+    and voxels covered by no tile are 0. Only the tiles intersecting the region are read.
+    '''
+    bounds = [(r.start, r.stop) if r.step > 0 else (r.stop + 1, r.start + 1) for r in region]
+    shape = tuple(max(hi - lo, 0) for lo, hi in bounds)
+    total = np.zeros(shape, dtype=np.float32)
+    count = np.zeros(shape, dtype=np.uint16)
+    for placement in placements:
+        lo = [max(o, b) for o, (b, _) in zip(placement.offset, bounds)]
+        hi = [min(l + 1, e) for l, (_, e) in zip(placement.last, bounds)]
+        if any(l >= h for l, h in zip(lo, hi)):
+            continue
+        destination = tuple(slice(l - b, h - b) for l, h, (b, _) in zip(lo, hi, bounds))
+        total[destination] += _read_tile(group[placement.name], placement, lo, hi)
+        count[destination] += 1
+    np.divide(total, count, out=total, where=count > 1)
+    return total[tuple(slice(None, None, r.step) for r in region)]
+
+class _LazyImage:
+    '''
+    A single image read region by region through `TCFileAbstract.read`, wrapped by dask.
+    '''
+    def __init__(self, reader, key:int, dtype):
+        self.reader = reader
+        self.key = key
+        self.shape = tuple(reader.data_shape)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(dtype)
+
+    def __getitem__(self, region):
+        return self.reader.read(self.key, region)
+
 class TCFileRIAbstract(TCFileAbstract):
+    def _read_region(self, tcf_io, key: int, region: tuple) -> np.ndarray:
+        data_path = self.get_data_location(key)
+        obj = self._get_object(tcf_io, data_path)
+        if isinstance(obj, h5py.Group):
+            # experimental tiled format
+            # RI = data/1e3 + min_RI for uint8 data type (ScalarType True)
+            # RI = data/1e4          for uint16 data type (ScalarType False)
+            data = self._read_tiles(tcf_io, key, region)
+            if self.get_attr(tcf_io, data_path, 'ScalarType'):
+                data /= 1e3
+                data += self.get_attr(tcf_io, data_path, 'RIMin')
+            else:
+                data /= 1e4
+            return data
+        if self.format_version < '1.3':
+            # RI = data
+            return obj[region]
+        # RI = data/1e4
+        return _read_scaled(obj, region, 1e4)
+
+    def _region_dtype(self, tcf_io, key: int):
+        obj = self._get_object(tcf_io, self.get_data_location(key))
+        if isinstance(obj, h5py.Dataset) and self.format_version < '1.3':
+            return obj.dtype
+        return np.float32
+
+    def _value_range(self, tcf_io, key: int):
+        value_range = super()._value_range(tcf_io, key)
+        if value_range is not None and self.format_version >= '1.3':
+            return tuple(v / 1e4 for v in value_range)
+        return value_range
+
     def __getitem__(self, key: int, array_type = 'numpy') -> np.ndarray:
         if array_type == 'numpy':
             into_array = np.asarray
-            zeros = np.zeros
         elif array_type == 'dask':
             into_array = da.from_array
-            zeros = da.zeros
         else:
             raise TypeError('array_type must be either "numpy" or "dask"')
 
         data_path = self.get_data_location(key)
-        if self.format_version < '1.3':
-            # RI = data
-            data = into_array(h5py.File(self.tcfname)[data_path])
-        else:
-            try:
+        with self._open() as tcf_io:
+            obj = self._get_object(tcf_io, data_path)
+            if isinstance(obj, h5py.Group):
+                warnings.warn(("You use an experimental file format deprecated.\n"
+                               "Update your reconstruction program and rebuild TCF file."))
+                if array_type == 'dask':
+                    return self._lazy_tiles(tcf_io, key)
+                return self._read_region(tcf_io, key, self._normalize_region(None))
+            if self.format_version < '1.3':
+                # RI = data
+                data = into_array(obj)
+            elif array_type == 'numpy':
+                # RI = data/1e4 without full-volume temporaries
+                data = self._read_region(tcf_io, key, self._normalize_region(None))
+            else:
                 # RI = data/1e4
-                data = into_array(h5py.File(self.tcfname)[data_path])
+                data = into_array(obj)
                 data = data.astype(np.float32)
                 data /= 1e4
-            except:
-                warnings.warn(("You use an experimental file format deprecated.\n"
-                               "Update your reconstruction program and rebuild TCF file."))
-                if into_array == 'dask':
-                    raise ValueError('"dask" does not support this TCFile')
-                with h5py.File(self.tcfname) as tcf_io:
-                    get_data_attr = lambda attr_name: self.get_attr(tcf_io, data_path, attr_name)
-                    # RI = data/1e3 + min_RI for uint8 data type (ScalarType True)
-                    # RI = data/1e4          for uint16 data type (ScalarType False)
-                    is_uint8 = get_data_attr('ScalarType')
-                    if is_uint8:
-                        data_type = 'u1'
-                    else:
-                        data_type = 'u2'
-                    data = zeros(self.data_shape, dtype=data_type)
-                    tile_path_list = [ p for p in tcf_io[data_path].keys() if re.match(r'^TILE_\d+$', p)]
-                    tile_path_list.sort()
-                    for p in tile_path_list:
-                        tile_path = f'{data_path}/{p}'
-                        get_tile_attr = lambda attr_name: self.get_attr(tcf_io, tile_path, attr_name)
-                        sampling_step = get_tile_attr('SamplingStep')
-                        if sampling_step != 1:
-                            # what?! I don't know why... ask Tomocube
-                            continue
-
-                        offset = list(get_tile_attr(f'DataIndexOffsetPoint{axis}') for axis in ('Z', 'Y', 'X')[3-self.data_ndim:])
-                        last_idx = list(get_tile_attr(f'DataIndexLastPoint{axis}') for axis in ('Z', 'Y', 'X')[3-self.data_ndim:])
-                        mapping_range = tuple(slice(start,end + 1) for start, end in zip(offset, last_idx))
-                        valid_data_range = tuple(slice(0,end - start + 1) for start, end in zip(offset, last_idx))
-                        data[mapping_range] += into_array(h5py.File(self.tcfname)[tile_path])[valid_data_range]
-                    data = data.astype(np.float32)
-                    if is_uint8:
-                        min_RI = get_data_attr('RIMin')
-                        data /= 1e3
-                        data += min_RI
-                    else:
-                        data /= 1e4
-
         return data
 
 class TCFileRI3D(TCFileRIAbstract):
@@ -248,8 +1128,8 @@ class TCFileBF(TCFileAbstract):
     data_ndim = 2
     def __getitem__(self, key: int) -> np.ndarray:
         data_path = self.get_data_location(key)
-        with h5py.File(self.tcfname) as f:
-            data = f[data_path][()]
+        with self._open() as f:
+            data = self._get_object(f, data_path)[()]
         data = Image.fromarray(data, mode = 'RGB')
         return data
 
@@ -257,61 +1137,81 @@ class TCFileFL3D(TCFileAbstract):
     imgtype = '3DFL'
     data_ndim = 3
 
-    def __init__(self, tcfname: str, channel: int = 0):
+    def __init__(self, tcfname: str, channel: int = 0, **kwargs):
         self.channel = channel
-        super().__init__(tcfname)
-        with h5py.File(self.tcfname) as f:
+        super().__init__(tcfname, **kwargs)
+        with self._open() as f:
             self.max_channels = self.get_attr(f, f'/Data/{self.imgtype}', 'Channels')
 
-    def get_data_location(self, key: int) -> str:
-        length = len(self)
-        if not isinstance(key, int):
-            raise TypeError(f'{self.__class__} indices must be integer, not {type(key)}')
-        if key < -length or key >= length:
-            raise IndexError(f'{self.__class__} index out of range')
-        key = (key + length) % length
+    def on_ri_grid(self, voxel_size = None, workers = None):
+        '''
+        Return a lazy view of this channel resampled onto the grid of the RI tomograms.
+        The fields of view of FL and RI are aligned on their centers. Timepoints stay those of FL.
+
+        Paramters
+        ---------
+        voxel_size : float or sequence of float or None
+            (unit: μm) resample the RI grid itself to this voxel size. None keeps the RI resolution.
+        workers : int or None
+            See `TCFResampled`
+
+        Raises
+        ------
+        ValueError
+            If the file has no RI tomograms
+        '''
+        with self._open() as tcf_io:
+            if '3D' not in tcf_io['Data']:
+                raise ValueError('The file has no RI tomograms to align to')
+            get_ri_attr = lambda attr_name: self.get_attr(tcf_io, '/Data/3D', attr_name, default = 0)
+            ri_shape = [get_ri_attr(f'Size{axis}') for axis in ('Z', 'Y', 'X')]
+            ri_resolution = [get_ri_attr(f'Resolution{axis}') for axis in ('Z', 'Y', 'X')]
+        if voxel_size is None:
+            voxel_size = ri_resolution
+        elif np.ndim(voxel_size) == 0:
+            voxel_size = (voxel_size,) * 3
+        shape = [int(np.floor((size - 1) * res / vs + 1e-6)) + 1 for size, res, vs in zip(ri_shape, ri_resolution, voxel_size)]
+        # output voxel 0 lies at the corner of the RI field of view, whose center is the one of FL
+        origin = [(fl_size - 1) * fl_res / 2 - (ri_size - 1) * ri_res / 2
+                  for fl_size, fl_res, ri_size, ri_res in zip(self.data_shape, self.data_resolution, ri_shape, ri_resolution)]
+        return TCFResampled(self, voxel_size, workers, shape = shape, origin = origin)
+
+    def _data_path(self, key: int) -> str:
         # Build the path with the correct channel:
         return f'/Data/{self.imgtype}/CH{self.channel}/{key:06d}'
 
+    def _read_region(self, tcf_io, key: int, region: tuple) -> np.ndarray:
+        obj = self._get_object(tcf_io, self.get_data_location(key))
+        if isinstance(obj, h5py.Group):
+            data = self._read_tiles(tcf_io, key, region)
+            return np.rint(data, out=data).astype(self._region_dtype(tcf_io, key))
+        return obj[region]
+
+    def _region_dtype(self, tcf_io, key: int):
+        data_path = self.get_data_location(key)
+        obj = self._get_object(tcf_io, data_path)
+        if isinstance(obj, h5py.Group):
+            return np.uint8 if self.get_attr(tcf_io, data_path, 'ScalarType') else np.uint16
+        return obj.dtype
+
     def __getitem__(self, key: int, array_type='numpy') -> np.ndarray:
         if array_type == 'numpy':
             into_array = np.asarray
-            zeros = np.zeros
         elif array_type == 'dask':
             into_array = da.from_array
-            zeros = da.zeros
         else:
             raise TypeError('array_type must be either "numpy" or "dask"')
 
         data_path = self.get_data_location(key)
-        with h5py.File(self.tcfname, 'r') as f:
-            obj = f[data_path]
+        with self._open() as f:
+            obj = self._get_object(f, data_path)
             # If it's a dataset, do a direct read:
             if isinstance(obj, h5py.Dataset):
-                data = into_array(obj)
-                return data
-            # Otherwise, if it's a group, do tile stitching:
+                return into_array(obj)
+            # Otherwise, if it's a group, stitch the tiles:
             elif isinstance(obj, h5py.Group):
-                # Prepare for stitching:
-                get_data_attr = lambda attr_name: self.get_attr(f, data_path, attr_name)
-                is_uint8 = get_data_attr('ScalarType')
-                # Use proper numpy dtypes:
-                data_type = np.uint8 if is_uint8 else np.uint16
-                data = zeros(self.data_shape, dtype=data_type)
-                tile_path_list = [p for p in obj.keys() if re.match(r'^TILE_\d+$', p)]
-                tile_path_list.sort()
-                for tile in tile_path_list:
-                    tile_path = f'{data_path}/{tile}'
-                    get_tile_attr = lambda attr_name: self.get_attr(f, tile_path, attr_name)
-                    if get_tile_attr('SamplingStep') != 1:
-                        continue  # skip unsupported tiles
-                    # For each axis, get the tile’s placement info:
-                    offset = [get_tile_attr(f'DataIndexOffsetPoint{axis}') for axis in ('Z', 'Y', 'X')[3-self.data_ndim:]]
-                    last_idx = [get_tile_attr(f'DataIndexLastPoint{axis}') for axis in ('Z', 'Y', 'X')[3-self.data_ndim:]]
-                    mapping_range = tuple(slice(o, l + 1) for o, l in zip(offset, last_idx))
-                    valid_range = tuple(slice(0, l - o + 1) for o, l in zip(offset, last_idx))
-                    tile_data = into_array(f[tile_path])[valid_range]
-                    data[mapping_range] += tile_data
-                return data
+                if array_type == 'dask':
+                    return self._lazy_tiles(f, key)
+                return self._read_region(f, key, self._normalize_region(None))
             else:
                 raise TypeError("Unexpected HDF5 object type at data_path")
@@ -1,2 +1,12 @@
 from .TCFile_class import TCFile
-from .zarr_store import TCFZarrStore
\ No newline at end of file
+from .zarr_store import TCFZarrStore
+from .patch_sampler import TCFPatchSampler
+from .process_pool import TCFProcessPool
+from .batch import read_many, clear_reader_cache
+from .chunk_cache import DiskChunkCache
+from .statistics import ImageStatistics, merge_statistics
+from .export import export_subset
+from .preview import make_preview, generate_previews
+from .memory import MemoryBudget, BufferPool, get_memory_budget, get_buffer_pool, set_memory_limit
+from .server import TCFZarrServer
+from .integrity import create_manifest, verify
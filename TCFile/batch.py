@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Optional, Iterator, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from .TCFile_class import _create_reader, file_identity
+
+
+class ReadResult(NamedTuple):
+    """Result of a single file in `read_many`."""
+    index: int
+    path: str
+    data: Optional[np.ndarray]
+    error: Optional[BaseException]
+
+
+# readers of the most recently read files, opening their file on each read so that no file is kept locked
+_MAX_CACHED_READERS = 64
+_readers: 'OrderedDict[Tuple, object]' = OrderedDict()
+_reader_users: Dict[Tuple, int] = {}
+_readers_lock = threading.Lock()
+
+
+def _evict_readers():
+    """Close the least recently used readers beyond the capacity, skipping those being read."""
+    for key in list(_readers):
+        if len(_readers) <= _MAX_CACHED_READERS:
+            break
+        if not _reader_users.get(key):
+            _readers.pop(key).close()
+
+
+def clear_reader_cache():
+    """Close the readers cached by `read_many`, releasing their decoded-chunk caches."""
+    with _readers_lock:
+        for key in list(_readers):
+            if not _reader_users.get(key):
+                _readers.pop(key).close()
+
+
+@contextmanager
+def _cached_reader(identity: tuple, imgtype: str, channel: int):
+    """Yield a reader whose metadata were parsed once per file version."""
+    key = (identity, imgtype, channel)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is not None:
+            _readers.move_to_end(key)
+            _reader_users[key] = _reader_users.get(key, 0) + 1
+    if reader is None:
+        # opened outside the lock so that files are opened in parallel
+        created = _create_reader(identity[0], imgtype, channel)
+        with _readers_lock:
+            reader = _readers.setdefault(key, created)
+            _readers.move_to_end(key)
+            _reader_users[key] = _reader_users.get(key, 0) + 1
+        if reader is not created:
+            created.close()
+    try:
+        yield reader
+    finally:
+        with _readers_lock:
+            _reader_users[key] -= 1
+            if not _reader_users[key]:
+                del _reader_users[key]
+            _evict_readers()
+
+
+def _read_one(path: str, imgtype: str, channel: int, index: int, region, pool) -> np.ndarray:
+    with _cached_reader(file_identity(path), imgtype, channel) as reader:
+        if pool is not None:
+            return pool.read(reader, index, region)
+        return reader.read(index, region)
+
+
+def _iter_many(paths: List[str], imgtype: str, index: int, region, workers: Optional[int],
+               pool, channel: int) -> Iterator[ReadResult]:
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            executor.submit(_read_one, path, imgtype, channel, index, region, pool): (i, path)
+            for i, path in enumerate(paths)
+        }
+        for future in as_completed(futures):
+            i, path = futures[future]
+            error = future.exception()
+            yield ReadResult(i, path, None if error else future.result(), error)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def read_many(paths: Sequence[str], imgtype: str, index: int = 0, region=None,
+              workers: Optional[int] = None, pool=None, channel: int = 0, stack: bool = False):
+    """Read the same image (or region) from many TCF files in parallel.
+
+    Readers of the most recently read files are cached per file version, so metadata are parsed once even across calls.
+    They open their file on each read, so files are not kept locked after the call. `clear_reader_cache` closes them.
+    Failures of individual files are collected instead of aborting the batch.
+
+    Parameters
+    ----------
+    paths : list[str]
+        Paths to the TCF files
+    imgtype : str
+        '3D', '2DMIP', 'BF' or '3DFL'
+    index : int
+        Index of the image in every file
+    region : tuple[slice], optional
+        See `TCFileAbstract.read`
+    workers : int, optional
+        Number of threads opening and reading files
+    pool : TCFProcessPool, optional
+        Process pool decoding the data outside of the h5py global lock
+    channel : int
+        Fluorescence channel for '3DFL'
+    stack : bool
+        Return a stacked array instead of streaming results
+
+    Returns
+    -------
+    Iterator[ReadResult]
+        If stack is False, results in order of completion. ``error`` is set for failed files.
+    tuple[numpy.ndarray, dict[int, Exception]]
+        If stack is True, the (N, ...) stacked images and the errors by position in paths.
+        Images of failed files are filled with zeros.
+
+    Examples
+    --------
+    >>> for result in read_many(paths, '3D', 0, workers=16):
+    ...     if result.error is None:
+    ...         process(result.path, result.data)
+    >>> first_frames, errors = read_many(paths, '2DMIP', 0, stack=True)
+    """
+    paths = list(paths)
+    results = _iter_many(paths, imgtype, index, region, workers, pool, channel)
+    if not stack:
+        return results
+
+    stacked = None
+    errors: Dict[int, BaseException] = {}
+    for result in results:
+        if result.error is not None:
+            errors[result.index] = result.error
+            continue
+        if stacked is None:
+            stacked = np.zeros((len(paths),) + result.data.shape, dtype=result.data.dtype)
+        if result.data.shape != stacked.shape[1:]:
+            errors[result.index] = ValueError(
+                f'{result.path} has shape {result.data.shape}, expected {stacked.shape[1:]}')
+            continue
+        stacked[result.index] = result.data
+    if stacked is None:
+        stacked = np.zeros((len(paths),))
+    return stacked, errors
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+
+# temporary files being written, invisible to readers and to eviction
+_TMP_PREFIX = '.tmp-'
+
+
+class DiskChunkCache:
+    """Persistent directory of decoded chunks shared by sessions and processes.
+
+    Entries are files named by the hash of their key. They are written to a temporary file and
+    renamed into place, so concurrent readers never see partial entries. Reads refresh the
+    modification time of an entry, which orders the least recently used eviction that keeps the
+    directory under ``max_nbytes``.
+
+    Attributes
+    ----------
+    directory : str
+        Cache directory
+    max_nbytes : int
+        Size cap of the cache. Eviction brings the cache down to 90 % of it.
+    hits, misses : int
+        Lookups of this instance served from and missing in the cache
+
+    Examples
+    --------
+    >>> cache = DiskChunkCache('~/.cache/tcfile', max_nbytes=50 * 2**30)
+    >>> store = TCFZarrStore('data.TCF', chunk_cache=cache)
+    """
+
+    def __init__(self, directory: str, max_nbytes: int = 8 * 2**30):
+        """Initialize DiskChunkCache.
+
+        Parameters
+        ----------
+        directory : str
+            Cache directory. It is created if missing and may be shared by several processes.
+        max_nbytes : int
+            Size cap of the cache
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_nbytes = int(max_nbytes)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._nbytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Return the key of an entry identified by hashable parts, e.g. (file identity, chunk key)."""
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def _entries(self):
+        """Yield (path, size, mtime) of every entry."""
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.startswith(_TMP_PREFIX):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime_ns
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the entry of key, or None if it is not cached."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # evicted by another process meanwhile
+            pass
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes):
+        """Store value under key, evicting the least recently used entries beyond the size cap."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=_TMP_PREFIX, dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            try:
+                # an existing entry is replaced and no longer counts
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._nbytes += len(value) - replaced
+            over = self._nbytes > self.max_nbytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache holds 90 % of max_nbytes.
+
+        The size is recounted from the directory, which also accounts for entries of other processes.
+        """
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            nbytes = sum(size for _, size, _ in entries)
+            target = int(self.max_nbytes * 0.9)
+            for path, size, _ in entries:
+                if nbytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # in use on platforms that forbid removing open files
+                    continue
+                nbytes -= size
+            self._nbytes = nbytes
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._nbytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the entries known to this instance."""
+        return self._nbytes
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -0,0 +1,267 @@
+import hashlib
+import io
+import itertools
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import h5py
+import numpy as np
+
+from .integrity import _chunk_infos
+from .memory import get_memory_budget
+
+# layout of a deduplicated export directory
+_MANIFEST_NAME = 'manifest.json'
+_SKELETON_NAME = 'data.TCF'
+_CHUNKS_DIR = 'chunks'
+_MANIFEST_FORMAT = 1
+_HASH_ALGORITHM = 'sha256'
+_DECODED_CACHE_NBYTES = 256 * 2**20
+
+
+def is_dedup_export(path) -> bool:
+    """Return whether path is a directory written by `export_subset(..., format='dedup')`."""
+    return isinstance(path, (str, os.PathLike)) and os.path.isfile(os.path.join(path, _MANIFEST_NAME))
+
+
+def skeleton_path(path) -> str:
+    """Return the HDF5 file holding the attributes and the layout of a deduplicated export."""
+    return os.path.join(path, _SKELETON_NAME)
+
+
+class DedupChunkStore:
+    """Content-addressed chunks of a deduplicated export.
+
+    An export directory holds a skeleton TCF file with every group, attribute and small dataset, in
+    which the image datasets are created without any stored chunk. Their raw (still compressed) chunks
+    are stored once per content under ``chunks/``, named by their SHA-256, and ``manifest.json`` maps
+    every chunk of every image dataset to its content. Static parts of a timelapse are therefore stored
+    once. Readers open such a directory like a TCF file and reassemble the data transparently.
+
+    Attributes
+    ----------
+    directory : str
+        Export directory
+    datasets : dict[str, dict[str, list]]
+        [hash, filter mask] per chunk offset ('z,y,x') per dataset path
+    """
+
+    def __init__(self, directory, datasets: Optional[Dict[str, Dict[str, list]]] = None):
+        self.directory = os.fspath(directory)
+        self.datasets = {} if datasets is None else datasets
+        self._lock = threading.Lock()
+        self._scratch = None
+        self._decoders = {}
+        self._decoded: 'OrderedDict[Tuple, np.ndarray]' = OrderedDict()
+        self._decoded_nbytes = 0
+        self._memory = get_memory_budget().register('dedup decoded chunks', self._evict_decoded, priority=2)
+
+    @classmethod
+    def open(cls, directory) -> 'DedupChunkStore':
+        """Open the chunk store of an export directory.
+
+        Raises
+        ------
+        ValueError
+            If the manifest was written by another format or algorithm
+        """
+        with open(os.path.join(directory, _MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != _MANIFEST_FORMAT or manifest.get('algorithm') != _HASH_ALGORITHM:
+            raise ValueError(f'Unsupported manifest: format {manifest.get("format")}, algorithm {manifest.get("algorithm")}')
+        return cls(directory, manifest['datasets'])
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.directory, _CHUNKS_DIR, digest[:2], digest[2:])
+
+    def put(self, payload: bytes) -> str:
+        """Store a raw chunk unless the same content is already stored, and return its hash."""
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), 'rb') as f:
+            return f.read()
+
+    def add(self, path: str, dataset: h5py.Dataset):
+        """Store the chunks of a dataset as the content of the image dataset at path."""
+        refs = {}
+        for info in _chunk_infos(dataset.id):
+            filter_mask, payload = dataset.id.read_direct_chunk(info.chunk_offset)
+            refs[','.join(str(o) for o in info.chunk_offset)] = [self.put(payload), int(filter_mask)]
+        self.datasets[path] = refs
+
+    def write_manifest(self):
+        """Write the manifest atomically. The export is readable from then on."""
+        chunks = [ref[0] for refs in self.datasets.values() for ref in refs.values()]
+        unique = set(chunks)
+        manifest = {
+            'format': _MANIFEST_FORMAT,
+            'algorithm': _HASH_ALGORITHM,
+            'chunk_count': len(chunks),
+            'stored_chunk_count': len(unique),
+            'stored_nbytes': sum(os.path.getsize(self._chunk_path(digest)) for digest in unique),
+            'datasets': self.datasets,
+        }
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, os.path.join(self.directory, _MANIFEST_NAME))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def wrap(self, path: str, dataset):
+        """Return the dataset at path of the skeleton, reading its chunks from the store if it is an image."""
+        refs = self.datasets.get(path)
+        if refs is None or not isinstance(dataset, h5py.Dataset):
+            return dataset
+        return _DedupDataset(dataset, self, refs)
+
+    def _decode(self, dataset: h5py.Dataset, ref: list) -> np.ndarray:
+        """Decode a raw chunk through the filters of its dataset. Decoded chunks are kept in an LRU cache
+        keyed by content, so chunks shared between timepoints are decoded once."""
+        digest, filter_mask = ref
+        key = (digest, dataset.dtype.str, dataset.chunks)
+        with self._lock:
+            data = self._decoded.get(key)
+            if data is not None:
+                self._decoded.move_to_end(key)
+                return data
+            # HDF5 decodes a chunk written as is into a dataset of the same creation properties
+            signature = (dataset.dtype.str, dataset.chunks, repr(dataset._filters))
+            decoder = self._decoders.get(signature)
+            if decoder is None:
+                if self._scratch is None:
+                    self._scratch = h5py.File(io.BytesIO(), 'w')
+                decoder = h5py.Dataset(h5py.h5d.create(
+                    self._scratch.id, str(len(self._decoders)).encode(), dataset.id.get_type(),
+                    h5py.h5s.create_simple(dataset.chunks), dcpl=dataset.id.get_create_plist()))
+                self._decoders[signature] = decoder
+            decoder.id.write_direct_chunk((0,) * len(dataset.chunks), self.get(digest), filter_mask)
+            data = decoder[()]
+            data.setflags(write=False)
+            self._decoded[key] = data
+            self._decoded_nbytes += data.nbytes
+            self._memory.charge(data.nbytes)
+            while self._decoded_nbytes > _DECODED_CACHE_NBYTES and len(self._decoded) > 1:
+                self._pop_decoded()
+        return data
+
+    def _pop_decoded(self) -> int:
+        _, evicted = self._decoded.popitem(last=False)
+        self._decoded_nbytes -= evicted.nbytes
+        self._memory.release(evicted.nbytes)
+        return evicted.nbytes
+
+    def _evict_decoded(self, nbytes: int) -> int:
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            freed = 0
+            while freed < nbytes and self._decoded:
+                freed += self._pop_decoded()
+            return freed
+        finally:
+            self._lock.release()
+
+    def read(self, dataset: h5py.Dataset, refs: Dict[str, list], region: tuple) -> np.ndarray:
+        """Assemble a normalized region of an image dataset from its chunks."""
+        bounds = [(r.start, r.stop) if r.step > 0 else (r.stop + 1, r.start + 1) for r in region]
+        box = tuple(max(hi - lo, 0) for lo, hi in bounds)
+        fillvalue = dataset.fillvalue
+        data = np.full(box, fillvalue, dtype=dataset.dtype)
+        if 0 not in box:
+            chunk_ranges = [range(lo // c * c, hi, c) for (lo, hi), c in zip(bounds, dataset.chunks)]
+            for offset in itertools.product(*chunk_ranges):
+                ref = refs.get(','.join(str(o) for o in offset))
+                if ref is None:
+                    # never written: the fill value
+                    continue
+                chunk = self._decode(dataset, ref)
+                src = tuple(slice(max(lo - o, 0), min(hi - o, c)) for (lo, hi), o, c in zip(bounds, offset, dataset.chunks))
+                dst = tuple(slice(s.start + o - lo, s.stop + o - lo) for s, o, (lo, _) in zip(src, offset, bounds))
+                data[dst] = chunk[src]
+        # steps within the bounding box
+        return data[tuple(slice(None, None, r.step) for r in region)]
+
+    def close(self):
+        with self._lock:
+            while self._decoded:
+                self._pop_decoded()
+            self._decoders.clear()
+            if self._scratch is not None:
+                self._scratch.close()
+                self._scratch = None
+
+
+class _DedupDataset(h5py.Dataset):
+    """Image dataset of a skeleton file whose values are read from a `DedupChunkStore`.
+
+    Everything but the values (shape, dtype, chunks, attributes) is that of the skeleton dataset.
+    """
+
+    def __init__(self, dataset: h5py.Dataset, store: DedupChunkStore, refs: Dict[str, list]):
+        super().__init__(dataset.id)
+        self._store = store
+        self._refs = refs
+
+    def __getitem__(self, args):
+        if not isinstance(args, tuple):
+            args = (args,)
+        if any(arg is Ellipsis for arg in args):
+            i = next(i for i, arg in enumerate(args) if arg is Ellipsis)
+            args = args[:i] + (slice(None),) * (self.ndim - len(args) + 1) + args[i + 1:]
+        if len(args) > self.ndim or not all(isinstance(arg, (slice, int, np.integer)) for arg in args):
+            raise TypeError(f'{self.__class__.__name__} supports slices and integers only')
+        args = args + (slice(None),) * (self.ndim - len(args))
+        region, squeezed = [], []
+        for axis, (arg, size) in enumerate(zip(args, self.shape)):
+            if isinstance(arg, slice):
+                region.append(slice(*arg.indices(size)))
+                continue
+            index = int(arg) + size if arg < 0 else int(arg)
+            if not 0 <= index < size:
+                raise IndexError(f'Index ({arg}) out of range for axis {axis} of size {size}')
+            region.append(slice(index, index + 1, 1))
+            squeezed.append(axis)
+        data = self._store.read(self, self._refs, tuple(region))
+        return data.squeeze(axis=tuple(squeezed)) if squeezed else data
+
+    def read_direct(self, dest, source_sel=None, dest_sel=None):
+        dest[() if dest_sel is None else dest_sel] = self[() if source_sel is None else source_sel]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[()]
+        return data if dtype is None else data.astype(dtype)
+
+
+def _read_raw_chunk(dataset, offset: tuple) -> Tuple[int, bytes]:
+    """Return (filter mask, stored bytes) of the chunk at offset, from the chunk store for deduplicated datasets.
+
+    Raises
+    ------
+    KeyError
+        If the chunk of a deduplicated dataset was never written
+    """
+    if isinstance(dataset, _DedupDataset):
+        digest, filter_mask = dataset._refs[','.join(str(o) for o in offset)]
+        return filter_mask, dataset._store.get(digest)
+    return dataset.id.read_direct_chunk(offset)
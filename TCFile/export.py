@@ -0,0 +1,377 @@
+import io
+import itertools
+import math
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+import h5py
+import numpy as np
+
+from .TCFile_class import _create_reader, _is_fileobj, _tile_placements, _read_tile
+from .dedup import DedupChunkStore, skeleton_path, _read_raw_chunk
+from .process_pool import _worker_reader
+
+_IMGTYPES = ('3D', '2DMIP', 'BF', '3DFL')
+# names of the image types in exported OME-Zarr, as in TCFZarrStore
+_ZARR_GROUPS = {'3D': 'RI3D', '2DMIP': 'RI2DMIP', '3DFL': 'FL3D'}
+_ZARR_CHUNK_SIZE = (64, 256, 256)
+_FORMATS = ('tcf', 'ome-zarr', 'dedup')
+
+
+class _ExportPlan(NamedTuple):
+    '''Part of an image type to export.'''
+    reader: object
+    keys: List[int]
+    region: tuple
+    dt: float
+    channel: Optional[int]
+
+
+def _center_aligned_region(region: tuple, reference, reader) -> tuple:
+    '''Map a region of the reference grid onto the grid of reader, both fields of view sharing their center.'''
+    mapped = []
+    ndim = reader.data_ndim
+    for r, size_ref, res_ref, size, res in zip(region[-ndim:], reference.data_shape[-ndim:], reference.data_resolution[-ndim:],
+                                                reader.data_shape, reader.data_resolution):
+        shift = (size - 1) * res / 2 - (size_ref - 1) * res_ref / 2
+        start = math.floor((r.start * res_ref + shift) / res + 1e-6)
+        stop = math.ceil(((r.stop - 1) * res_ref + shift) / res - 1e-6) + 1
+        start, stop = min(max(start, 0), size - 1), min(max(stop, 1), size)
+        mapped.append(slice(start, max(stop, start + 1), 1))
+    return tuple(mapped)
+
+
+def _plan(tcf_path, imgtypes, time, region, channels, reader_kwargs) -> List[_ExportPlan]:
+    '''Select the timepoints and regions of every image type, aligned on the RI tomograms if present.'''
+    readers = {}
+    for imgtype in imgtypes:
+        try:
+            if imgtype == '3DFL':
+                first = _create_reader(tcf_path, imgtype, 0, **reader_kwargs)
+                readers[imgtype] = [first if ch == 0 else _create_reader(tcf_path, imgtype, ch, **reader_kwargs)
+                                    for ch in (range(first.max_channels) if channels is None else channels)]
+            else:
+                readers[imgtype] = [_create_reader(tcf_path, imgtype, **reader_kwargs)]
+        except (AssertionError, KeyError):
+            continue
+    if not readers:
+        raise ValueError(f'No requested image types found in {tcf_path}')
+
+    reference = (readers.get('3D') or next(iter(readers.values())))[0]
+    time = slice(None) if time is None else time
+    if isinstance(time, int):
+        time = slice(time, time + 1 if time != -1 else None)
+    reference_keys = list(range(len(reference))[time])
+    if not reference_keys:
+        raise ValueError('The time range selects no timepoint')
+    reference_region = reference._normalize_region(region)
+    if any(r.step != 1 for r in reference_region):
+        raise ValueError('region must be contiguous')
+    t_start, t_stop = min(reference_keys) * reference.dt, max(reference_keys) * reference.dt
+
+    plans = []
+    for imgtype, imgtype_readers in readers.items():
+        for reader in imgtype_readers:
+            channel = getattr(reader, 'channel', None)
+            if reader.imgtype == reference.imgtype:
+                plans.append(_ExportPlan(reader, reference_keys, reference_region,
+                                         reference.dt * abs(time.step or 1), channel))
+                continue
+            # timepoints of other image types are the ones within the selected time window
+            keys = [k for k in range(len(reader)) if t_start - 1e-6 <= k * reader.dt <= t_stop + 1e-6]
+            if not keys:
+                times = np.arange(len(reader)) * reader.dt
+                keys = [int(np.argmin(np.abs(times - t_start)))]
+            plans.append(_ExportPlan(reader, keys, _center_aligned_region(reference_region, reference, reader),
+                                     reader.dt, channel))
+    return plans
+
+
+def _copy_attributes(source, destination):
+    for attr_name in source.attrs:
+        destination.attrs[attr_name] = source.attrs[attr_name]
+
+
+def _read_slab(reader, data_path: str, region: tuple) -> np.ndarray:
+    '''Decode a slab of the stored values of a dataset in a worker process.'''
+    reader = _worker_reader(reader)
+    with reader._open() as tcf_io:
+        return reader._get_object(tcf_io, data_path)[region]
+
+
+def _decode_slabs(executor, reader, data_path: str, sources: List[tuple]) -> Iterator[np.ndarray]:
+    '''Yield slabs of a dataset in order while worker processes decode the next ones, a few at a time.'''
+    pending = deque()
+    for source in sources:
+        pending.append(executor.submit(_read_slab, reader, data_path, source))
+        if len(pending) >= 2 * executor._max_workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _copy_dataset_region(dataset, parent, name: str, region: tuple, compression_opt: Optional[dict], decode=None):
+    '''Copy a region of a dataset, streaming chunk-aligned slabs.
+
+    The filters of the source are kept unless compression_opt is given. If the region is aligned to
+    the chunks, they are copied as stored, without decompression. Otherwise decode, if given, maps the
+    source slabs to their values in order, e.g. from worker processes, and they are written here.
+    '''
+    shape = tuple(len(range(r.start, r.stop, r.step)) for r in region) + dataset.shape[len(region):]
+    region = region + tuple(slice(0, s, 1) for s in dataset.shape[len(region):])
+    chunks = dataset.chunks
+    if chunks is not None:
+        out_chunks = tuple(max(1, min(c, s)) for c, s in zip(chunks, shape))
+    if compression_opt is None:
+        dcpl = dataset.id.get_create_plist()
+        if chunks is not None:
+            dcpl.set_chunk(out_chunks)
+        space = h5py.h5s.create_simple(shape)
+        output = h5py.Dataset(h5py.h5d.create(parent.id, name.encode(), dataset.id.get_type(), space, dcpl=dcpl))
+    else:
+        output = parent.create_dataset(name, shape=shape, dtype=dataset.dtype,
+                                       chunks=out_chunks if chunks is not None else None, **compression_opt)
+    _copy_attributes(dataset, output)
+
+    if chunks is not None and compression_opt is None and out_chunks == chunks and \
+            all(r.step == 1 and r.start % c == 0 for r, c in zip(region, chunks)):
+        for offset in itertools.product(*(range(0, s, c) for s, c in zip(shape, chunks))):
+            source_offset = tuple(o + r.start for o, r in zip(offset, region))
+            try:
+                filter_mask, chunk = _read_raw_chunk(dataset, source_offset)
+            except (KeyError, OSError, RuntimeError):
+                # not allocated: the fill value is kept
+                continue
+            output.id.write_direct_chunk(offset, chunk, filter_mask)
+        return output
+
+    thickness = chunks[0] if chunks is not None else max(1, shape[0])
+    first = region[0]
+    starts = range(0, shape[0], thickness)
+    sources = [(slice(first.start + start * first.step, first.start + min(start + thickness, shape[0]) * first.step, first.step),) + region[1:]
+               for start in starts]
+    slabs = (dataset[source] for source in sources) if decode is None else decode(sources)
+    for start, slab in zip(starts, slabs):
+        output[start:start + len(slab)] = slab
+    return output
+
+
+def _copy_tiles_region(group, parent, name: str, region: tuple, axes: Sequence[str]):
+    '''Copy the tiles of the experimental tiled format intersecting a region, cropped to it.
+
+    Subsampled tiles are upsampled, since a crop may start within one of their samples.
+    '''
+    output = parent.create_group(name)
+    _copy_attributes(group, output)
+    for placement in _tile_placements(group, len(axes)):
+        tile = group[placement.name]
+        lo = [max(o, r.start) for o, r in zip(placement.offset, region)]
+        hi = [min(l + 1, r.stop) for l, r in zip(placement.last, region)]
+        if any(l >= h for l, h in zip(lo, hi)):
+            continue
+        tile_out = output.create_dataset(placement.name, data=_read_tile(tile, placement, lo, hi))
+        _copy_attributes(tile, tile_out)
+        if placement.step != 1:
+            tile_out.attrs['SamplingStep'] = np.array([1], dtype=tile.attrs['SamplingStep'].dtype)
+        for axis, l, h, r in zip(axes, lo, hi, region):
+            tile_out.attrs[f'DataIndexOffsetPoint{axis}'] = np.array([l - r.start])
+            tile_out.attrs[f'DataIndexLastPoint{axis}'] = np.array([h - 1 - r.start])
+
+
+def _export_tcf(plans: List[_ExportPlan], output_path: str, compression_opt: Optional[dict], workers: Optional[int],
+                copy_dataset=_copy_dataset_region):
+    '''Export to a TCF file. Worker processes decode the slabs that are not copied as stored, and this thread
+    writes them in order, as HDF5 files have a single writer.'''
+    executor = None
+    if workers is not None and workers > 1 and not _is_fileobj(plans[0].reader.tcfname):
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        _write_tcf(plans, output_path, compression_opt, executor, copy_dataset)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _write_tcf(plans: List[_ExportPlan], output_path: str, compression_opt: Optional[dict], executor, copy_dataset):
+    channels = {}
+    with plans[0].reader._open() as tcf_io, h5py.File(output_path, 'w') as tcf_out:
+        _copy_attributes(tcf_io, tcf_out)
+        if 'Info' in tcf_io:
+            tcf_io.copy(tcf_io['Info'], tcf_out, 'Info')
+        for plan in plans:
+            reader = plan.reader
+            group_path = f'/Data/{reader.imgtype}'
+            axes = ('Z', 'Y', 'X')[3 - reader.data_ndim:]
+            if group_path not in tcf_out:
+                group_out = tcf_out.create_group(group_path)
+                _copy_attributes(tcf_io[group_path], group_out)
+                for axis, r in zip(axes, plan.region):
+                    group_out.attrs[f'Size{axis}'] = np.array([len(range(r.start, r.stop, r.step))])
+                group_out.attrs['DataCount'] = np.array([len(plan.keys)])
+                group_out.attrs['TimeInterval'] = np.array([plan.dt if len(plan.keys) > 1 else 0.])
+            if plan.channel is not None:
+                # exported channels are renumbered from zero
+                channels[group_path] = channels.get(group_path, -1) + 1
+                tcf_out[group_path].attrs['Channels'] = np.array([channels[group_path] + 1])
+                parent = tcf_out.create_group(f'{group_path}/CH{channels[group_path]}')
+                _copy_attributes(tcf_io[f'{group_path}/CH{plan.channel}'], parent)
+            else:
+                parent = tcf_out[group_path]
+            for index, key in enumerate(plan.keys):
+                data_path = reader.get_data_location(key)
+                source = reader._get_object(tcf_io, data_path)
+                if isinstance(source, h5py.Group):
+                    _copy_tiles_region(source, parent, f'{index:06d}', plan.region, axes)
+                else:
+                    decode = None if executor is None else partial(_decode_slabs, executor, reader, data_path)
+                    copy_dataset(source, parent, f'{index:06d}', plan.region, compression_opt, decode)
+
+
+def _export_dedup(plans: List[_ExportPlan], output_path: str, compression_opt: Optional[dict], workers: Optional[int]):
+    '''Export to a directory holding a skeleton TCF file and the content-addressed chunks of its images.
+
+    Each image is first copied into an in-memory file, so that its chunks are encoded exactly as in a
+    TCF export, and then stored by content: identical chunks of consecutive timepoints are written once.
+    '''
+    os.makedirs(output_path, exist_ok=True)
+    store = DedupChunkStore(output_path)
+
+    def copy_dataset(dataset, parent, name, region, compression_opt, decode):
+        if dataset.chunks is None:
+            # too small to be worth deduplicating
+            _copy_dataset_region(dataset, parent, name, region, compression_opt, decode)
+            return
+        with h5py.File(io.BytesIO(), 'w') as scratch:
+            staged = _copy_dataset_region(dataset, scratch, name, region, compression_opt, decode)
+            # the skeleton keeps the layout and the filters of the image, without any chunk
+            space = h5py.h5s.create_simple(staged.shape)
+            output = h5py.Dataset(h5py.h5d.create(parent.id, name.encode(), staged.id.get_type(), space,
+                                                  dcpl=staged.id.get_create_plist()))
+            _copy_attributes(staged, output)
+            store.add(output.name, staged)
+
+    _export_tcf(plans, skeleton_path(output_path), compression_opt, workers, copy_dataset)
+    store.write_manifest()
+
+
+def _write_zarr_slab(array, selection: tuple, reader, key: int, region: tuple):
+    array[selection] = reader.read(key, region)
+
+
+def _export_zarr(plans: List[_ExportPlan], output_path: str, workers: Optional[int]):
+    import zarr
+
+    root = zarr.open_group(output_path, mode='w', zarr_format=2)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        jobs = []
+        for plan in plans:
+            reader = plan.reader
+            group_name = _ZARR_GROUPS[reader.imgtype]
+            if plan.channel is not None:
+                group_name = f'{group_name}/CH{plan.channel}'
+            group = root.require_group(group_name)
+            shape = tuple(len(range(r.start, r.stop, r.step)) for r in plan.region)
+            chunks = tuple(min(c, s) for c, s in zip(_ZARR_CHUNK_SIZE[3 - reader.data_ndim:], shape))
+            array = group.create_array('0', shape=(len(plan.keys),) + shape, chunks=(1,) + chunks,
+                                       dtype=reader._get_output_dtype(plan.keys[0]), fill_value=0)
+            axes = [{'name': 't', 'type': 'time', 'unit': 'second'}] + \
+                [{'name': axis, 'type': 'space', 'unit': 'micrometer'} for axis in ('z', 'y', 'x')[3 - reader.data_ndim:]]
+            group.attrs['multiscales'] = [{
+                'version': '0.4',
+                'axes': axes,
+                'datasets': [{
+                    'path': '0',
+                    'coordinateTransformations': [
+                        {'type': 'scale', 'scale': [float(plan.dt if plan.dt > 0 else 1.0)] +
+                         [float(res) for res in reader.data_resolution]},
+                        {'type': 'translation', 'translation': [float(plan.keys[0] * reader.dt)] +
+                         [float(r.start * res) for r, res in zip(plan.region, reader.data_resolution)]},
+                    ],
+                }],
+                'name': group_name,
+                'type': 'none',
+            }]
+            # slabs along the first axis cover whole zarr chunks, so that concurrent writes never share one
+            for index, key in enumerate(plan.keys):
+                for start in range(0, shape[0], chunks[0]):
+                    stop = min(start + chunks[0], shape[0])
+                    first = plan.region[0]
+                    source = (slice(first.start + start, first.start + stop),) + plan.region[1:]
+                    jobs.append(executor.submit(_write_zarr_slab, array, (index, slice(start, stop)), reader, key, source))
+        for job in jobs:
+            job.result()
+
+
+def export_subset(tcf_path, output_path: str, imgtypes: Optional[Sequence[str]] = None, time=None, region=None,
+                  channels: Optional[Sequence[int]] = None, format: Optional[str] = None, workers: Optional[int] = None,
+                  compression_opt: Optional[dict] = None, **reader_kwargs):
+    '''Export a time range and a region of a TCF file to a smaller TCF file or an OME-Zarr.
+
+    Only the hyperslabs (or tiles) intersecting the region are read, slab by slab, so memory stays bounded.
+    The region and the time range refer to the RI tomograms if the file has them. Other image types keep
+    the same field of view, both being aligned on their centers, and the timepoints within the same time window.
+
+    Parameters
+    ----------
+    tcf_path : str or file object
+        Path, fsspec URL or file object of the TCF file
+    output_path : str
+        Path of the exported file
+    imgtypes : list[str], optional
+        '3D', '2DMIP', 'BF' and/or '3DFL'. Defaults to every image type of the file
+    time : int or slice, optional
+        Timepoints to export, e.g. slice(0, 100, 10). Defaults to every timepoint
+    region : tuple[slice], optional
+        Contiguous (Z, Y, X) region to export. Defaults to the whole image
+    channels : list[int], optional
+        Fluorescence channels to export, renumbered from CH0. Defaults to every channel
+    format : str, optional
+        'tcf', 'ome-zarr' or 'dedup'. Defaults to 'ome-zarr' for a '.zarr' output_path, 'dedup' for a '.tcfd'
+        output_path and 'tcf' otherwise. A 'dedup' export is a directory in which identical chunks, e.g. the static
+        background of a slowly changing timelapse, are stored once. It is read like a TCF file
+    workers : int, optional
+        Number of threads reading and writing OME-Zarr chunks in parallel. For 'tcf' and 'dedup', number of
+        worker processes decoding the slabs that are not copied as stored chunks; they are written in order by
+        the calling thread. Defaults to decoding them in the calling thread
+    compression_opt : dict, optional
+        Compression of the TCF datasets, e.g. {'compression': 'gzip'}. Defaults to the filters of the source,
+        in which case chunks aligned with the region are copied without decompression
+    **reader_kwargs
+        pool, profile, storage_options, ... See `TCFileAbstract`
+
+    Raises
+    ------
+    ValueError
+        If no requested image type is found, the selection is empty or the format is unsupported
+
+    Examples
+    --------
+    >>> export_subset('data.TCF', 'cell.TCF', time=slice(0, 20, 2), region=(slice(10, 50), slice(300, 556), slice(300, 556)))
+    >>> export_subset('data.TCF', 'cell.zarr', imgtypes=['3D', '3DFL'], channels=[1], workers=8)
+    >>> export_subset('timelapse.TCF', 'timelapse.tcfd')
+    '''
+    if format is None:
+        suffix = os.path.splitext(os.fspath(output_path).rstrip('/'))[1].lower()
+        format = {'.zarr': 'ome-zarr', '.tcfd': 'dedup'}.get(suffix, 'tcf')
+    if format not in _FORMATS:
+        raise ValueError(f'Unsupported format: Supported formats are {_FORMATS}')
+    supported = tuple(_ZARR_GROUPS) if format == 'ome-zarr' else _IMGTYPES
+    imgtypes = supported if imgtypes is None else tuple(imgtypes)
+    if not set(imgtypes) <= set(supported):
+        raise ValueError(f'Unsupported imgtype: Supported imgtypes are {supported}')
+
+    plans = _plan(tcf_path, imgtypes, time, region, channels, reader_kwargs)
+    try:
+        if format == 'tcf':
+            _export_tcf(plans, output_path, compression_opt, workers)
+        elif format == 'dedup':
+            _export_dedup(plans, output_path, compression_opt, workers)
+        else:
+            _export_zarr(plans, output_path, workers)
+    finally:
+        for plan in plans:
+            plan.reader.close()
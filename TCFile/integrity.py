@@ -0,0 +1,351 @@
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import h5py
+import hdf5plugin  # noqa: F401 registers the compression filters of TCF files in the workers
+import numpy as np
+
+_MANIFEST_FORMAT = 1
+_HASH_ALGORITHM = 'blake2b-128'
+# contiguous datasets are hashed in slabs of this size
+_SLAB_NBYTES = 64 * 2**20
+# chunks of a dataset per job, so that a single large dataset is still verified in parallel
+_CHUNKS_PER_JOB = 64
+
+# per-process state of the workers: open files
+_worker_files: 'OrderedDict[str, h5py.File]' = OrderedDict()
+_MAX_WORKER_FILES = 8
+
+
+class VerificationProblem(NamedTuple):
+    """A defect found by `verify` or `create_manifest`.
+
+    ``kind`` is 'corrupt' (unreadable or undecodable data), 'truncated' (stored beyond the end of the
+    file), 'mismatch' (differs from the manifest), 'missing' (in the manifest but not in the file) or
+    'unexpected' (in the file but not in the manifest). ``chunk`` is the chunk offset, or None for
+    the dataset as a whole.
+    """
+    path: str
+    chunk: Optional[str]
+    kind: str
+    message: str
+
+
+class VerificationResult(NamedTuple):
+    """Result of `verify` or `create_manifest`."""
+    manifest: dict
+    problems: List[VerificationProblem]
+    nbytes: int
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+def _chunk_infos(dsid: h5py.h5d.DatasetID) -> list:
+    """Return the storage info of every allocated chunk of a dataset, in file order of the chunk index.
+
+    ``chunk_iter`` needs h5py 3.8 built against HDF5 1.12.3 or later. Otherwise chunks are queried one by one.
+    """
+    if hasattr(dsid, 'chunk_iter'):
+        infos = []
+        dsid.chunk_iter(infos.append)
+        return infos
+    return [dsid.get_chunk_info(index) for index in range(dsid.get_num_chunks())]
+
+
+def _worker_file(tcf_path: str) -> h5py.File:
+    tcf_io = _worker_files.get(tcf_path)
+    if tcf_io is None or not tcf_io.id.valid:
+        tcf_io = _worker_files[tcf_path] = h5py.File(tcf_path, 'r')
+    _worker_files.move_to_end(tcf_path)
+    while len(_worker_files) > _MAX_WORKER_FILES:
+        _worker_files.popitem(last=False)[1].close()
+    return tcf_io
+
+
+def _close_worker_files():
+    while _worker_files:
+        _worker_files.popitem()[1].close()
+
+
+def _chunk_key(offset: Sequence[int]) -> str:
+    return ','.join(str(o) for o in offset)
+
+
+def _hash_contiguous(dataset: h5py.Dataset) -> Tuple[str, int]:
+    """Hash the values of a dataset without chunks, streaming slabs along the first axis."""
+    digest = hashlib.blake2b(digest_size=16)
+    nbytes = 0
+    if dataset.shape is None:
+        return digest.hexdigest(), nbytes
+    if dataset.ndim == 0 or dataset.size == 0:
+        slabs = [()]
+    else:
+        rows = max(1, _SLAB_NBYTES // max(dataset.nbytes // dataset.shape[0], 1))
+        slabs = [slice(start, start + rows) for start in range(0, dataset.shape[0], rows)]
+    for slab in slabs:
+        data = np.asarray(dataset[slab])
+        content = repr(data.tolist()).encode() if data.dtype.hasobject else np.ascontiguousarray(data).tobytes()
+        digest.update(content)
+        nbytes += len(content)
+    return digest.hexdigest(), nbytes
+
+
+def _hash_job(tcf_path: str, dataset_path: str, part: int, nparts: int, decode: bool):
+    """Hash part of the chunks of a dataset from their raw (still compressed) bytes.
+
+    Returns
+    -------
+    hashes : dict[str, str]
+        Hash per chunk offset, or under '' for datasets without chunks
+    problems : list[VerificationProblem]
+    nbytes : int
+        Bytes read
+    """
+    hashes, problems, nbytes = {}, [], 0
+    try:
+        tcf_io = _worker_file(tcf_path)
+        dataset = tcf_io[dataset_path]
+        if dataset.chunks is None:
+            hashes[''], nbytes = _hash_contiguous(dataset)
+            return hashes, problems, nbytes
+        infos = _chunk_infos(dataset.id)
+    except Exception as e:
+        problems.append(VerificationProblem(dataset_path, None, 'corrupt', str(e)))
+        return hashes, problems, nbytes
+
+    file_size = os.path.getsize(tcf_path)
+    for info in infos[part::nparts]:
+        key = _chunk_key(info.chunk_offset)
+        if info.byte_offset is None or info.byte_offset + info.size > file_size:
+            problems.append(VerificationProblem(dataset_path, key, 'truncated',
+                                                f'chunk ends beyond the end of the file ({file_size} bytes)'))
+            continue
+        try:
+            filter_mask, raw = dataset.id.read_direct_chunk(info.chunk_offset)
+            if decode:
+                dataset[tuple(slice(o, o + c) for o, c in zip(info.chunk_offset, dataset.chunks))]
+        except Exception as e:
+            problems.append(VerificationProblem(dataset_path, key, 'corrupt', str(e)))
+            continue
+        digest = hashlib.blake2b(raw, digest_size=16)
+        digest.update(int(filter_mask).to_bytes(4, 'little'))
+        hashes[key] = digest.hexdigest()
+        nbytes += len(raw)
+    return hashes, problems, nbytes
+
+
+def _list_datasets(tcf_path: str) -> Dict[str, dict]:
+    """Return the layout of every dataset of a file, including the tiles of the tiled format."""
+    datasets = {}
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset):
+            datasets['/' + name] = {
+                'shape': None if obj.shape is None else list(obj.shape),
+                'dtype': obj.dtype.str,
+                'chunks': None if obj.chunks is None else list(obj.chunks),
+                'nchunks': obj.id.get_num_chunks() if obj.chunks is not None else 1,
+            }
+
+    with h5py.File(tcf_path, 'r') as tcf_io:
+        tcf_io.visititems(visit)
+    return datasets
+
+
+def _hash_file(tcf_path: str, workers: Optional[int], decode: bool, mp_context) -> VerificationResult:
+    tcf_path = os.fspath(tcf_path)
+    try:
+        datasets = _list_datasets(tcf_path)
+    except OSError as e:
+        # e.g. truncated files, whose superblock points beyond their end
+        return VerificationResult({}, [VerificationProblem('/', None, 'corrupt', str(e))], 0)
+
+    max_workers = workers or os.cpu_count() or 1
+    jobs = [
+        (tcf_path, path, part, nparts, decode)
+        for path, layout in datasets.items()
+        for nparts in [min(math.ceil(layout['nchunks'] / _CHUNKS_PER_JOB), max_workers) or 1]
+        for part in range(nparts)
+    ]
+    if max_workers == 1:
+        try:
+            results = [_hash_job(*job) for job in jobs]
+        finally:
+            _close_worker_files()
+    else:
+        if mp_context is None:
+            mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers, mp_context=mp_context) as executor:
+            results = list(executor.map(_hash_job, *zip(*jobs), chunksize=max(1, len(jobs) // (4 * max_workers))))
+
+    problems, nbytes = [], 0
+    for (_, path, _, _, _), (hashes, job_problems, job_nbytes) in zip(jobs, results):
+        datasets[path].setdefault('hashes', {}).update(hashes)
+        problems += job_problems
+        nbytes += job_nbytes
+    for layout in datasets.values():
+        del layout['nchunks']
+        layout['hashes'] = dict(sorted(layout.get('hashes', {}).items()))
+    manifest = {
+        'format': _MANIFEST_FORMAT,
+        'algorithm': _HASH_ALGORITHM,
+        'file': os.path.basename(tcf_path),
+        'size': os.path.getsize(tcf_path),
+        'datasets': datasets,
+    }
+    return VerificationResult(manifest, problems, nbytes)
+
+
+def _manifest_path(tcf_path) -> str:
+    return f'{os.fspath(tcf_path)}.manifest.json'
+
+
+def create_manifest(tcf_path, output_path: Optional[str] = None, workers: Optional[int] = None,
+                    decode: bool = True, mp_context=None) -> VerificationResult:
+    """Hash every chunk of a TCF file and write the checksum manifest, e.g. before archiving.
+
+    Every dataset is walked chunk by chunk. Chunks are read raw with `read_direct_chunk`, without
+    decompression, and hashed with BLAKE2b in a process pool. Datasets without chunks are hashed
+    by value. Tiles of the tiled format are datasets like any other.
+
+    Parameters
+    ----------
+    tcf_path : str
+        Path to the TCF file
+    output_path : str, optional
+        Location of the manifest. Defaults to '<tcf_path>.manifest.json'
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs. 1 hashes in the calling process
+    decode : bool
+        Also decompress every chunk, so that corrupt chunks are detected before they are recorded
+    mp_context : multiprocessing context, optional
+        Defaults to 'spawn', as forking a process with open HDF5 files is unsafe
+
+    Returns
+    -------
+    VerificationResult
+        The manifest and the defects found while reading. The manifest is written regardless,
+        and defective chunks are left out of it.
+    """
+    result = _hash_file(tcf_path, workers, decode, mp_context)
+    if not result.manifest:
+        return result
+    output_path = _manifest_path(tcf_path) if output_path is None else os.fspath(output_path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result.manifest, f, indent=1)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return result
+
+
+def verify(tcf_path, manifest: Union[str, dict, None] = None, workers: Optional[int] = None,
+           decode: bool = False, mp_context=None) -> VerificationResult:
+    """Verify a TCF file against its checksum manifest, e.g. after a transfer.
+
+    Chunks are hashed from their raw bytes as in `create_manifest`, so verification runs at disk
+    bandwidth. Changed, missing, additional, truncated and unreadable chunks and datasets are reported.
+
+    Parameters
+    ----------
+    tcf_path : str
+        Path to the TCF file
+    manifest : str or dict, optional
+        Manifest or its location. Defaults to '<tcf_path>.manifest.json'
+    workers, decode, mp_context :
+        See `create_manifest`
+
+    Returns
+    -------
+    VerificationResult
+        ``ok`` is True if the file matches the manifest
+
+    Raises
+    ------
+    FileNotFoundError
+        If the manifest does not exist
+    ValueError
+        If the manifest was made by another algorithm or format
+    """
+    if not isinstance(manifest, dict):
+        with open(_manifest_path(tcf_path) if manifest is None else manifest) as f:
+            manifest = json.load(f)
+    if manifest.get('format') != _MANIFEST_FORMAT or manifest.get('algorithm') != _HASH_ALGORITHM:
+        raise ValueError(f'Unsupported manifest: format {manifest.get("format")}, algorithm {manifest.get("algorithm")}')
+
+    result = _hash_file(tcf_path, workers, decode, mp_context)
+    if not result.manifest:
+        return result
+    problems = list(result.problems)
+    # chunks that could not be read are already reported
+    reported = {(problem.path, problem.chunk) for problem in problems}
+    expected, actual = manifest['datasets'], result.manifest['datasets']
+    for path in sorted(expected.keys() | actual.keys()):
+        if path not in actual:
+            problems.append(VerificationProblem(path, None, 'missing', 'dataset is missing'))
+            continue
+        if path not in expected:
+            problems.append(VerificationProblem(path, None, 'unexpected', 'dataset is not in the manifest'))
+            continue
+        layout = {k: v for k, v in actual[path].items() if k != 'hashes'}
+        expected_layout = {k: v for k, v in expected[path].items() if k != 'hashes'}
+        if layout != expected_layout:
+            problems.append(VerificationProblem(path, None, 'mismatch', f'layout {layout} instead of {expected_layout}'))
+            continue
+        hashes, expected_hashes = actual[path]['hashes'], expected[path]['hashes']
+        for key in sorted(expected_hashes.keys() | hashes.keys()):
+            if (path, key) in reported or (path, None) in reported:
+                continue
+            if key not in hashes:
+                problems.append(VerificationProblem(path, key, 'missing', 'chunk is missing'))
+            elif key not in expected_hashes:
+                problems.append(VerificationProblem(path, key, 'unexpected', 'chunk is not in the manifest'))
+            elif hashes[key] != expected_hashes[key]:
+                problems.append(VerificationProblem(path, key, 'mismatch', 'checksum differs from the manifest'))
+    return VerificationResult(result.manifest, problems, result.nbytes)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command line entry point: ``tcf-verify [--write] data.TCF [more.TCF ...]``. Exit status 1 on defects."""
+    parser = argparse.ArgumentParser(prog='tcf-verify', description='Verify TCF files against checksum manifests.')
+    parser.add_argument('paths', nargs='+', help='TCF files')
+    parser.add_argument('--write', action='store_true', help='write the manifests instead of verifying them')
+    parser.add_argument('--manifest', default=None, help='manifest location for a single file '
+                                                         '(default: <file>.manifest.json)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPUs)')
+    parser.add_argument('--decode', action='store_true', help='also decompress every chunk while verifying')
+    args = parser.parse_args(argv)
+    if args.manifest is not None and len(args.paths) > 1:
+        parser.error('--manifest requires a single file')
+
+    status = 0
+    for path in args.paths:
+        if args.write:
+            result = create_manifest(path, args.manifest, args.workers)
+        else:
+            try:
+                result = verify(path, args.manifest, args.workers, args.decode)
+            except (OSError, ValueError) as e:
+                print(f'{path}: {e}', file=sys.stderr)
+                status = 1
+                continue
+        for problem in result.problems:
+            chunk = '' if problem.chunk is None else f' [{problem.chunk}]'
+            print(f'{path}: {problem.kind}: {problem.path}{chunk}: {problem.message}')
+        print(f'{path}: {"OK" if result.ok else "FAILED"} ({result.nbytes / 2**20:.1f} MiB read)')
+        status = status or int(not result.ok)
+    return status
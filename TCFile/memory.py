@@ -0,0 +1,286 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _default_limit() -> Optional[int]:
+    """Half of the physical memory, or None if it is unknown."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class MemoryConsumer:
+    """Registration of a cache or buffer with a `MemoryBudget`.
+
+    Attributes
+    ----------
+    name : str
+        Name shown in `MemoryBudget.usage`
+    priority : int
+        Consumers of lower priority are evicted first
+    nbytes : int
+        Memory charged by the consumer
+    """
+
+    def __init__(self, budget: 'MemoryBudget', name: str, priority: int, evict: Optional[Callable[[int], int]]):
+        self.budget = budget
+        self.name = name
+        self.priority = priority
+        self.nbytes = 0
+        # the budget must not keep caches alive
+        if evict is None:
+            self._evict = None
+        elif hasattr(evict, '__self__'):
+            self._evict = weakref.WeakMethod(evict)
+        else:
+            self._evict = lambda: evict
+
+    def evict(self, nbytes: int) -> int:
+        """Ask the consumer to free nbytes. Return the number of bytes it released."""
+        evict = self._evict() if self._evict is not None else None
+        if evict is None:
+            return 0
+        return evict(nbytes) or 0
+
+    def charge(self, nbytes: int):
+        """Account nbytes of new memory, evicting other consumers beyond the limit."""
+        self.budget._charge(self, nbytes)
+
+    def release(self, nbytes: int):
+        """Account nbytes of freed memory."""
+        self.budget._charge(self, -nbytes)
+
+    def unregister(self):
+        self.budget._unregister(self)
+
+
+class MemoryBudget:
+    """Process-wide memory budget shared by caches, prefetchers and decode buffers.
+
+    Caches register as consumers and charge what they keep. Beyond the limit, consumers of the lowest
+    priority are asked to evict first. Their eviction callbacks must not block: a consumer that is
+    busy simply skips the request. Prefetchers reserve the memory of the data they produce ahead of
+    time, and block while the budget is exhausted (backpressure).
+
+    Attributes
+    ----------
+    limit : int or None
+        Memory limit in bytes. None disables eviction and backpressure
+
+    Examples
+    --------
+    >>> set_memory_limit(16 * 2**30)
+    >>> print(get_memory_budget().usage())
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self._consumers: List[MemoryConsumer] = []
+        self._reserved = 0
+        self._condition = threading.Condition()
+
+    def register(self, name: str, evict: Optional[Callable[[int], int]] = None, priority: int = 0) -> MemoryConsumer:
+        """Register a consumer.
+
+        Parameters
+        ----------
+        name : str
+            Name shown in `usage`
+        evict : callable, optional
+            ``evict(nbytes) -> freed`` asked to free memory. The consumer must release the freed memory
+            itself. Bound methods are referenced weakly, and the consumer is unregistered with their object.
+        priority : int
+            Consumers of lower priority are evicted first
+        """
+        consumer = MemoryConsumer(self, name, priority, evict)
+        with self._condition:
+            self._consumers.append(consumer)
+        if hasattr(evict, '__self__'):
+            # the memory of a cache is freed with it
+            weakref.finalize(evict.__self__, consumer.unregister)
+        return consumer
+
+    def _unregister(self, consumer: MemoryConsumer):
+        with self._condition:
+            if consumer in self._consumers:
+                self._consumers.remove(consumer)
+                self._condition.notify_all()
+
+    @property
+    def nbytes(self) -> int:
+        """Memory charged by every consumer and reserved by prefetchers."""
+        with self._condition:
+            return sum(consumer.nbytes for consumer in self._consumers) + self._reserved
+
+    def usage(self) -> Dict[str, int]:
+        """Return the memory charged per consumer name, and reserved by prefetchers."""
+        usage = defaultdict(int)
+        with self._condition:
+            for consumer in self._consumers:
+                usage[consumer.name] += consumer.nbytes
+            usage['reserved'] = self._reserved
+        return dict(usage)
+
+    def _charge(self, consumer: MemoryConsumer, nbytes: int):
+        with self._condition:
+            consumer.nbytes += nbytes
+            if nbytes < 0:
+                self._condition.notify_all()
+        if nbytes > 0:
+            self.evict(exclude=consumer)
+
+    def evict(self, exclude: Optional[MemoryConsumer] = None) -> int:
+        """Evict consumers by increasing priority until the limit is met. Return the number of bytes freed."""
+        if self.limit is None:
+            return 0
+        with self._condition:
+            excess = sum(consumer.nbytes for consumer in self._consumers) + self._reserved - self.limit
+            candidates = sorted((c for c in self._consumers if c is not exclude and c.nbytes > 0), key=lambda c: c.priority)
+        freed = 0
+        # callbacks are run without the lock, so that they may charge or release memory
+        for consumer in candidates:
+            if freed >= excess:
+                break
+            freed += consumer.evict(excess - freed)
+        return freed
+
+    def reserve(self, nbytes: int, timeout: Optional[float] = None) -> bool:
+        """Reserve memory for data produced ahead of time, waiting while the budget is exhausted.
+
+        A reservation is always granted when nothing else is reserved, so that progress is guaranteed.
+        Return whether it was granted before the timeout.
+        """
+        if self.limit is None:
+            with self._condition:
+                self._reserved += nbytes
+            return True
+        self.evict()
+        with self._condition:
+            granted = self._condition.wait_for(
+                lambda: self._reserved == 0 or
+                sum(c.nbytes for c in self._consumers) + self._reserved + nbytes <= self.limit,
+                timeout)
+            if granted:
+                self._reserved += nbytes
+            return granted
+
+    def unreserve(self, nbytes: int):
+        """Return reserved memory, e.g. once a prefetched batch is handed over."""
+        with self._condition:
+            self._reserved -= nbytes
+            self._condition.notify_all()
+
+
+class BufferPool:
+    """Pool of reusable arrays for decode outputs and temporaries, so that repeated reads of the
+    same shape do not churn the allocator. Idle buffers are charged to the memory budget and are
+    the first memory evicted.
+
+    The least recently released buffers are dropped beyond `max_buffers` or `max_idle_nbytes`, or
+    when the budget is exceeded. Arrays larger than `max_buffer_nbytes` (e.g. full volumes) are never pooled.
+    """
+
+    def __init__(self, budget: MemoryBudget, max_buffers_per_shape: int = 4, max_buffers: int = 32,
+                 max_idle_nbytes: int = 256 * 2**20, max_buffer_nbytes: int = 64 * 2**20):
+        self.max_buffers_per_shape = max_buffers_per_shape
+        self.max_buffers = max_buffers
+        self.max_idle_nbytes = max_idle_nbytes
+        self.max_buffer_nbytes = max_buffer_nbytes
+        # idle buffers per (shape, dtype), by increasing time of last release
+        self._free: 'OrderedDict[Tuple, List[np.ndarray]]' = OrderedDict()
+        self._count = 0
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._consumer = budget.register('buffer pool', self._evict, priority=-1)
+
+    def acquire(self, shape, dtype) -> np.ndarray:
+        """Return an uninitialized array, reused if possible. Give it back with `release`."""
+        key = (tuple(int(s) for s in shape), np.dtype(dtype).str)
+        with self._lock:
+            arrays = self._free.get(key)
+            if arrays:
+                array = arrays.pop()
+                if not arrays:
+                    del self._free[key]
+                self._count -= 1
+                self._nbytes -= array.nbytes
+                self._consumer.release(array.nbytes)
+                return array
+        return np.empty(key[0], dtype=key[1])
+
+    def release(self, array: np.ndarray):
+        """Give back an array obtained from `acquire`. It must not be used afterwards."""
+        if array.nbytes > self.max_buffer_nbytes:
+            return
+        key = (array.shape, array.dtype.str)
+        with self._lock:
+            arrays = self._free.setdefault(key, [])
+            if len(arrays) >= self.max_buffers_per_shape:
+                return
+            arrays.append(array)
+            self._free.move_to_end(key)
+            self._count += 1
+            self._nbytes += array.nbytes
+            dropped = self._drop(lambda _: self._count > self.max_buffers or self._nbytes > self.max_idle_nbytes)
+        self._consumer.charge(array.nbytes - dropped)
+        # the budget does not evict the consumer charging memory, so the pool gives way itself
+        budget = self._consumer.budget
+        if budget.limit is not None:
+            excess = budget.nbytes - budget.limit
+            if excess > 0:
+                self._evict(excess)
+
+    def _drop(self, exceeded: Callable[[int], bool]) -> int:
+        """Drop the least recently released buffers while exceeded(dropped bytes). Return the number of bytes dropped."""
+        dropped = 0
+        while self._free and exceeded(dropped):
+            key = next(iter(self._free))
+            arrays = self._free[key]
+            array = arrays.pop(0)
+            if not arrays:
+                del self._free[key]
+            self._count -= 1
+            self._nbytes -= array.nbytes
+            dropped += array.nbytes
+        return dropped
+
+    def clear(self) -> int:
+        """Drop the idle buffers. Return the number of bytes freed."""
+        with self._lock:
+            freed = self._drop(lambda _: True)
+        self._consumer.release(freed)
+        return freed
+
+    def _evict(self, nbytes: int) -> int:
+        with self._lock:
+            freed = self._drop(lambda dropped: dropped < nbytes)
+        self._consumer.release(freed)
+        return freed
+
+
+_budget = MemoryBudget(_default_limit())
+_buffer_pool = BufferPool(_budget)
+
+
+def get_memory_budget() -> MemoryBudget:
+    """Return the memory budget of this process."""
+    return _budget
+
+
+def get_buffer_pool() -> BufferPool:
+    """Return the buffer pool of this process."""
+    return _buffer_pool
+
+
+def set_memory_limit(limit: Optional[int]):
+    """Set the memory limit in bytes of this process. None disables it."""
+    _budget.limit = limit
+    _budget.evict()
+    with _budget._condition:
+        _budget._condition.notify_all()
@@ -0,0 +1,360 @@
+import itertools
+import math
+import queue
+import threading
+from collections import OrderedDict
+from typing import Optional, Iterator, Dict, List, Tuple, Sequence
+
+import h5py
+import numpy as np
+
+from .TCFile_class import _create_reader
+from .memory import get_memory_budget
+
+
+class TCFPatchSampler:
+    """Picklable dataset drawing small (T, Z, Y, X) patches from TCF files at chunk cost.
+
+    Patches of a batch are grouped by the HDF5 chunks they intersect. Each chunk is decoded
+    once, kept in a per-process LRU cache and shared by every patch touching it, so a patch
+    never costs a full volume decode.
+
+    The sampler can be used as a map-style dataset (``sampler[i]`` returns batch ``i``) or
+    iterated, in which case batches are decoded ahead of time by a background thread.
+    Cached chunks and prefetched batches are charged to the process memory budget: chunks are
+    evicted when other caches need memory, and prefetching waits while the budget is exhausted.
+    Batches are split between ``torch.utils.data.DataLoader`` workers when iterated in one.
+
+    Attributes
+    ----------
+    tcf_paths : list[str]
+        Paths to the TCF files
+    patch_shape : tuple[int]
+        Shape of a patch. The leading axis is time if it has one more axis than the data.
+    batch_size : int
+        Number of patches per batch
+    mode : str
+        'random' or 'grid'
+
+    Examples
+    --------
+    >>> sampler = TCFPatchSampler(['a.TCF', 'b.TCF'], (32, 64, 64), num_patches=1000, batch_size=8)
+    >>> batch = sampler[0]
+    >>> print(batch.shape)  # (8, 32, 64, 64)
+    >>> loader = torch.utils.data.DataLoader(sampler, batch_size=None, num_workers=4)
+    """
+
+    def __init__(self, tcf_paths: Sequence[str], patch_shape: Sequence[int], imgtype: str = '3D',
+                 channel: int = 0, mode: str = 'random', num_patches: Optional[int] = None,
+                 batch_size: int = 1, stride: Optional[Sequence[int]] = None, dtype=np.float32,
+                 seed: int = 0, cache_nbytes: int = 256 * 2**20, prefetch: int = 2):
+        """Initialize TCFPatchSampler.
+
+        Parameters
+        ----------
+        tcf_paths : list[str]
+            Paths to the TCF files
+        patch_shape : tuple[int]
+            (Z, Y, X) or (T, Z, Y, X) patch shape for 3D data, (Y, X) or (T, Y, X) for 2D data
+        imgtype : str
+            '3D', '2DMIP' or '3DFL'
+        channel : int
+            Fluorescence channel for '3DFL'
+        mode : str
+            'random' draws ``num_patches`` uniformly distributed patches.
+            'grid' visits every patch of a regular grid given by ``stride``.
+        num_patches : int, optional
+            Number of patches in 'random' mode
+        batch_size : int
+            Number of patches per batch
+        stride : tuple[int], optional
+            Grid spacing in 'grid' mode. Defaults to ``patch_shape``
+        dtype : numpy.dtype
+            Data type of the returned batches
+        seed : int
+            Seed of the random patch locations. Batch ``i`` is identical in every process.
+        cache_nbytes : int
+            Capacity of the per-process decoded chunk cache
+        prefetch : int
+            Number of batches decoded ahead while iterating
+
+        Raises
+        ------
+        ValueError
+            If the patch does not fit in the data or the mode is unsupported
+        """
+        if mode not in ('random', 'grid'):
+            raise ValueError('Unsupported mode: Supported modes are "random" and "grid"')
+        if imgtype not in ('3D', '2DMIP', '3DFL'):
+            raise ValueError('Unsupported imgtype: Supported imgtypes are "3D", "2DMIP", and "3DFL"')
+        if mode == 'random' and num_patches is None:
+            raise ValueError('num_patches is required in "random" mode')
+
+        self.tcf_paths = list(tcf_paths)
+        self.imgtype = imgtype
+        self.channel = channel
+        self.mode = mode
+        self.batch_size = int(batch_size)
+        self.dtype = np.dtype(dtype)
+        self.seed = seed
+        self.cache_nbytes = cache_nbytes
+        self.prefetch = prefetch
+        self._readers = [_create_reader(path, imgtype, channel) for path in self.tcf_paths]
+
+        ndim = self._readers[0].data_ndim
+        patch_shape = tuple(int(s) for s in patch_shape)
+        if len(patch_shape) == ndim:
+            self._has_time_axis = False
+            patch_shape = (1,) + patch_shape
+        elif len(patch_shape) == ndim + 1:
+            self._has_time_axis = True
+        else:
+            raise ValueError(f'patch_shape must have {ndim} or {ndim + 1} axes')
+        self.patch_shape = patch_shape[int(not self._has_time_axis):]
+        self._full_patch_shape = patch_shape
+
+        # number of valid patch origins per axis (T, Z, Y, X) for each file
+        self._origin_counts = []
+        for reader in self._readers:
+            counts = [size - p + 1 for size, p in zip([len(reader)] + list(reader.data_shape), patch_shape)]
+            if min(counts) < 1:
+                raise ValueError(f'patch_shape {patch_shape} does not fit in {reader.tcfname}')
+            self._origin_counts.append(counts)
+
+        if mode == 'grid':
+            stride = patch_shape if stride is None else tuple(int(s) for s in stride)
+            if len(stride) == ndim:
+                stride = (1,) + stride
+            self._grid = np.array([
+                (file_idx,) + origin
+                for file_idx, counts in enumerate(self._origin_counts)
+                for origin in itertools.product(*(range(0, c, s) for c, s in zip(counts, stride)))
+            ], dtype=np.int64)
+            self.num_patches = len(self._grid)
+        else:
+            self.num_patches = int(num_patches)
+            weights = np.array([np.prod(counts, dtype=np.float64) for counts in self._origin_counts])
+            self._file_weights = weights / weights.sum()
+
+        self._init_process_state()
+
+    def _init_process_state(self):
+        """Create the state that is private to a process: the chunk cache."""
+        self._cache: 'OrderedDict[Tuple, np.ndarray]' = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+        # chunks being decoded by a thread, set once they are cached
+        self._decoding: Dict[Tuple, threading.Event] = {}
+        self._memory = get_memory_budget().register('patch sampler chunks', self._evict_chunks, priority=2)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_cache', '_cache_size', '_lock', '_decoding', '_memory'):
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_process_state()
+
+    def __len__(self) -> int:
+        """Return the number of batches."""
+        return math.ceil(self.num_patches / self.batch_size)
+
+    def batch_locations(self, index: int) -> np.ndarray:
+        """Return the patch origins of a batch.
+
+        Returns
+        -------
+        numpy.ndarray[int64]
+            (B, 2 + ndim) array of (file index, t, z, y, x) origins
+        """
+        if index < -len(self) or index >= len(self):
+            raise IndexError(f'{self.__class__} index out of range')
+        index = (index + len(self)) % len(self)
+        start = index * self.batch_size
+        stop = min(start + self.batch_size, self.num_patches)
+        if self.mode == 'grid':
+            return self._grid[start:stop]
+
+        rng = np.random.default_rng((self.seed, index))
+        file_indices = rng.choice(len(self._readers), size=stop - start, p=self._file_weights)
+        origins = [
+            [file_idx] + [int(rng.integers(c)) for c in self._origin_counts[file_idx]]
+            for file_idx in file_indices
+        ]
+        return np.array(origins, dtype=np.int64).reshape(stop - start, -1)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """Return a batch of patches.
+
+        Returns
+        -------
+        numpy.ndarray
+            C-contiguous (B, *patch_shape) array in ``dtype``
+        """
+        locations = self.batch_locations(index)
+        batch = np.empty((len(locations),) + self._full_patch_shape, dtype=self.dtype)
+
+        # group the patches by the chunks they touch so that each chunk is decoded once
+        requests: Dict[Tuple, List[Tuple]] = {}
+        for b, (file_idx, t0, *origin) in enumerate(locations):
+            for dt in range(self._full_patch_shape[0]):
+                requests.setdefault((int(file_idx), int(t0) + dt), []).append((b, dt, origin))
+        for (file_idx, t), patches in sorted(requests.items()):
+            self._fill_patches(batch, file_idx, t, patches)
+
+        if not self._has_time_axis:
+            batch = batch[:, 0]
+        return batch
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """Iterate over batches while decoding the next ones in a background thread."""
+        indices = range(len(self))
+        try:
+            import torch.utils.data
+            worker_info = torch.utils.data.get_worker_info()
+        except ImportError:
+            worker_info = None
+        if worker_info is not None:
+            indices = indices[worker_info.id::worker_info.num_workers]
+
+        batches = queue.Queue(maxsize=max(self.prefetch, 1))
+        stop = threading.Event()
+        budget = get_memory_budget()
+        batch_nbytes = self.batch_size * int(np.prod(self._full_patch_shape)) * self.dtype.itemsize
+
+        def produce():
+            try:
+                for index in indices:
+                    # backpressure: wait for memory before decoding ahead
+                    while not budget.reserve(batch_nbytes, timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        budget.unreserve(batch_nbytes)
+                        return
+                    try:
+                        batch = self[index]
+                    except BaseException:
+                        budget.unreserve(batch_nbytes)
+                        raise
+                    batches.put((batch, None))
+            except Exception as e:
+                batches.put((None, e))
+            batches.put((None, StopIteration()))
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch, error = batches.get()
+                if isinstance(error, StopIteration):
+                    return
+                if error is not None:
+                    raise error
+                # the batch now belongs to the caller
+                budget.unreserve(batch_nbytes)
+                yield batch
+        finally:
+            stop.set()
+            while producer.is_alive() or not batches.empty():
+                try:
+                    batch, _ = batches.get_nowait()
+                    if batch is not None:
+                        budget.unreserve(batch_nbytes)
+                except queue.Empty:
+                    producer.join(0.01)
+
+    def close(self):
+        """Close file handles and drop cached chunks."""
+        with self._lock:
+            for reader in self._readers:
+                reader.close()
+            self._cache.clear()
+            self._memory.release(self._cache_size)
+            self._cache_size = 0
+
+    def _fill_patches(self, batch: np.ndarray, file_idx: int, t: int, patches: List[Tuple]):
+        """Copy the spatial part of every patch at timepoint t from cached chunks."""
+        reader = self._readers[file_idx]
+        patch_shape = self._full_patch_shape[1:]
+        with reader._open() as tcf_io:
+            dataset = reader._get_object(tcf_io, reader.get_data_location(t))
+            chunks = dataset.chunks if isinstance(dataset, h5py.Dataset) else None
+
+        if chunks is None:
+            # contiguous or tiled data: read the patch itself
+            for b, dt, origin in patches:
+                region = tuple(slice(o, o + p) for o, p in zip(origin, patch_shape))
+                batch[b, dt] = reader.read(t, region)
+            return
+
+        chunks = chunks[:len(patch_shape)]
+        for b, dt, origin in patches:
+            chunk_ranges = (range(o // c, (o + p - 1) // c + 1) for o, p, c in zip(origin, patch_shape, chunks))
+            for chunk_index in itertools.product(*chunk_ranges):
+                chunk_start = [i * c for i, c in zip(chunk_index, chunks)]
+                data = self._get_chunk(reader, file_idx, t, chunk_start, chunks)
+                overlap = [
+                    (max(o, s), min(o + p, s + n))
+                    for o, p, s, n in zip(origin, patch_shape, chunk_start, data.shape)
+                ]
+                dst = tuple(slice(lo - o, hi - o) for (lo, hi), o in zip(overlap, origin))
+                src = tuple(slice(lo - s, hi - s) for (lo, hi), s in zip(overlap, chunk_start))
+                batch[(b, dt) + dst] = data[src]
+
+    def _get_chunk(self, reader, file_idx: int, t: int, chunk_start: List[int], chunks: Tuple[int]) -> np.ndarray:
+        """Return a decoded chunk from the LRU cache, decoding it on a miss.
+
+        The chunk is decoded outside the lock, so the prefetch thread and the consumer decode in parallel.
+        A chunk being decoded by another thread is waited for rather than decoded twice.
+        """
+        key = (file_idx, t, tuple(chunk_start))
+        while True:
+            with self._lock:
+                data = self._cache.get(key)
+                if data is not None:
+                    self._cache.move_to_end(key)
+                    return data
+                decoding = self._decoding.get(key)
+                if decoding is None:
+                    self._decoding[key] = threading.Event()
+                    break
+            decoding.wait()
+
+        try:
+            region = tuple(
+                slice(s, min(s + c, size))
+                for s, c, size in zip(chunk_start, chunks, reader.data_shape)
+            )
+            data = reader.read(t, region)
+            with self._lock:
+                self._cache[key] = data
+                self._cache_size += data.nbytes
+                self._memory.charge(data.nbytes)
+                while self._cache_size > self.cache_nbytes and len(self._cache) > 1:
+                    self._pop_chunk()
+        finally:
+            with self._lock:
+                self._decoding.pop(key).set()
+        return data
+
+    def _pop_chunk(self) -> int:
+        """Drop the least recently used chunk. Return its size."""
+        _, evicted = self._cache.popitem(last=False)
+        self._cache_size -= evicted.nbytes
+        self._memory.release(evicted.nbytes)
+        return evicted.nbytes
+
+    def _evict_chunks(self, nbytes: int) -> int:
+        """Drop chunks until nbytes are released, when asked by the memory budget. Skipped while busy."""
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            freed = 0
+            while freed < nbytes and self._cache:
+                freed += self._pop_chunk()
+            return freed
+        finally:
+            self._lock.release()
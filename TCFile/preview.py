@@ -0,0 +1,201 @@
+import hashlib
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, NamedTuple, Optional, Sequence, Tuple
+
+import h5py
+import numpy as np
+from PIL import Image
+
+from .TCFile_class import _create_reader, file_identity
+
+# image types in order of preference: stored projections and bright field are cheap to read
+_PREVIEW_IMGTYPES = ('2DMIP', 'BF', '3D')
+
+
+class PreviewResult(NamedTuple):
+    """Result of a single file in `generate_previews`."""
+    index: int
+    path: str
+    output: Optional[str]
+    error: Optional[BaseException]
+
+
+def _block_reduce(data: np.ndarray, factor: int) -> np.ndarray:
+    """Downsample the first two axes by averaging factor x factor blocks."""
+    if factor <= 1:
+        return data
+    height, width = data.shape[0] // factor, data.shape[1] // factor
+    data = data[:height * factor, :width * factor]
+    blocks = data.reshape((height, factor, width, factor) + data.shape[2:])
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def _central_slab(reader, key: int) -> slice:
+    """Return the chunk-aligned Z slab around the center of a volume, so that other chunks are skipped."""
+    depth = reader.data_shape[0]
+    with reader._open() as tcf_io:
+        obj = reader._get_object(tcf_io, reader.get_data_location(key))
+        thickness = obj.chunks[0] if isinstance(obj, h5py.Dataset) and obj.chunks is not None else depth
+    start = (depth // 2) // thickness * thickness
+    return slice(start, min(start + thickness, depth))
+
+
+def make_preview(tcf_path, size: int = 256, index: int = 0, imgtype: Optional[str] = None,
+                 window: Optional[Tuple[float, float]] = None, **reader_kwargs) -> np.ndarray:
+    """Make an 8-bit preview of a TCF file from its cheapest image.
+
+    `/Data/2DMIP` is preferred, then `/Data/BF`. Otherwise the maximum projection of the central
+    chunk-aligned Z slab of `/Data/3D` is used, which only decodes the chunks of that slab.
+    Images are downsampled by block averaging.
+
+    Parameters
+    ----------
+    tcf_path : str or file object
+        Path, fsspec URL or file object of the TCF file
+    size : int
+        Maximum height and width of the preview
+    index : int
+        Timepoint of the preview
+    imgtype : str, optional
+        '2DMIP', 'BF' or '3D'. Defaults to the first one available in that order
+    window : tuple[float], optional
+        RI mapped to 0 and 255. Defaults to the stored RIMin/RIMax, otherwise the 0.5/99.5 percentiles
+
+    Returns
+    -------
+    numpy.ndarray[uint8]
+        (H, W) grayscale preview of RI, or (H, W, 3) RGB preview of BF
+
+    Raises
+    ------
+    ValueError
+        If the file has none of the image types
+    """
+    imgtypes = _PREVIEW_IMGTYPES if imgtype is None else (imgtype,)
+    for imgtype in imgtypes:
+        try:
+            reader = _create_reader(tcf_path, imgtype, **reader_kwargs)
+            break
+        except (AssertionError, KeyError):
+            continue
+    else:
+        raise ValueError(f'No image types for previews ({", ".join(imgtypes)}) found in {tcf_path}')
+
+    try:
+        if reader.imgtype == '3D':
+            data = reader.project(index, 'z', 'max', region=(_central_slab(reader, index),), use_stored=False)
+        else:
+            data = reader.read(index)
+        factor = math.ceil(max(data.shape[:2]) / size)
+        data = _block_reduce(data, factor)
+        if reader.imgtype == 'BF':
+            return np.clip(np.rint(data), 0, 255).astype(np.uint8)
+
+        if window is None:
+            with reader._open() as tcf_io:
+                group_path = f'/Data/{reader.imgtype}'
+                window = (reader.get_attr(tcf_io, group_path, 'RIMin'), reader.get_attr(tcf_io, group_path, 'RIMax'))
+            if None in window or window[1] <= window[0]:
+                window = tuple(np.percentile(data, (0.5, 99.5)))
+        low, high = window
+        scaled = (np.asarray(data, dtype=np.float32) - low) * (255 / max(high - low, 1e-12))
+        return np.clip(np.rint(scaled), 0, 255).astype(np.uint8)
+    finally:
+        reader.close()
+
+
+def _preview_output(path, output_dir: str, format: str, size: int, index: int, imgtype: Optional[str]) -> str:
+    """Return the cache location of the preview of the current version of a file."""
+    name = hashlib.sha256(repr((file_identity(path), size, index, imgtype)).encode()).hexdigest()[:32]
+    return os.path.join(output_dir, f'{name}.{format}')
+
+
+def _write_preview(path, output: str, format: str, size: int, index: int, imgtype: Optional[str]) -> str:
+    """Write the preview of a file atomically, and return its location."""
+    output_dir = os.path.dirname(output)
+    preview = make_preview(path, size, index, imgtype)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix=f'.{format}', dir=output_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if format == 'png':
+                Image.fromarray(preview).save(f, format='PNG')
+            else:
+                np.savez_compressed(f, preview=preview)
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return output
+
+
+def _iter_previews(paths, output_dir, format, size, index, imgtype, workers, mp_context) -> Iterator[PreviewResult]:
+    missing = []
+    for i, path in enumerate(paths):
+        try:
+            output = _preview_output(path, output_dir, format, size, index, imgtype)
+        except OSError as e:
+            yield PreviewResult(i, path, None, e)
+            continue
+        if os.path.exists(output):
+            yield PreviewResult(i, path, output, None)
+        else:
+            missing.append((i, path, output))
+    if not missing:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        futures = {
+            executor.submit(_write_preview, path, output, format, size, index, imgtype): (i, path)
+            for i, path, output in missing
+        }
+        for future in as_completed(futures):
+            i, path = futures[future]
+            error = future.exception()
+            yield PreviewResult(i, path, None if error else future.result(), error)
+
+
+def generate_previews(paths: Sequence[str], output_dir: str, format: str = 'png', size: int = 256, index: int = 0,
+                      imgtype: Optional[str] = None, workers: Optional[int] = None, mp_context=None) -> Iterator[PreviewResult]:
+    """Generate previews of many TCF files in a process pool.
+
+    Previews are cached in output_dir under names derived from the file identity (path, size and
+    modification time) and the preview settings, so only new or modified files are processed again.
+    Failures of individual files are collected instead of aborting the batch.
+
+    Parameters
+    ----------
+    paths : list[str]
+        Paths to the TCF files
+    output_dir : str
+        Directory of the previews. It is created if missing
+    format : str
+        'png' or 'npz' (array stored under 'preview')
+    size, index, imgtype :
+        See `make_preview`
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs
+    mp_context : multiprocessing context, optional
+        Defaults to 'spawn', as forking a process with open HDF5 files is unsafe
+
+    Returns
+    -------
+    Iterator[PreviewResult]
+        Cached previews first, then the others in order of completion.
+        ``output`` is the preview file, ``error`` is set for failed files.
+
+    Examples
+    --------
+    >>> for result in generate_previews(paths, 'thumbnails', workers=16):
+    ...     if result.error is None:
+    ...         lims.attach(result.path, result.output)
+    """
+    if format not in ('png', 'npz'):
+        raise ValueError('Unsupported format: Supported formats are "png" and "npz"')
+    os.makedirs(output_dir, exist_ok=True)
+    if mp_context is None:
+        mp_context = multiprocessing.get_context('spawn')
+    return _iter_previews(list(paths), output_dir, format, size, index, imgtype, workers, mp_context)
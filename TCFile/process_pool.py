@@ -0,0 +1,142 @@
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, List, Tuple, Any
+
+import numpy as np
+
+# per-process state of the workers: readers keeping their files and chunk caches open
+_worker_readers: 'OrderedDict[Tuple, Any]' = OrderedDict()
+_MAX_WORKER_READERS = 64
+
+
+def _worker_reader(reader):
+    """Return the reader of this worker process equivalent to a reader sent by the parent, keeping its file open."""
+    identity = (type(reader), reader.tcfname, getattr(reader, 'channel', None), reader.length,
+                reader.profile, tuple(sorted(reader._file_kwargs.items())))
+    reader = _worker_readers.setdefault(identity, reader)
+    _worker_readers.move_to_end(identity)
+    while len(_worker_readers) > _MAX_WORKER_READERS:
+        _worker_readers.popitem(last=False)[1].close()
+    return reader
+
+
+def _worker_read(reader, key: int, region: tuple, shm_name: str, shape: Tuple[int], dtype: str):
+    """Decode a region in a worker process and write it into the shared memory block."""
+    reader = _worker_reader(reader)
+    shm = SharedMemory(name=shm_name)
+    try:
+        with reader._open() as tcf_io:
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf)[...] = reader._read_region(tcf_io, key, region)
+    finally:
+        shm.close()
+
+
+class TCFProcessPool:
+    """Process pool decoding TCF regions outside of the h5py global lock.
+
+    h5py serializes every HDF5 call, so decompression in threads never uses more than one core.
+    Workers of this pool hold their own file handles and chunk caches, decode the requested regions and write
+    them into shared memory blocks allocated by the caller, so results are not pickled.
+
+    Attach the pool to readers or a store to route their reads through it.
+
+    Attributes
+    ----------
+    max_workers : int
+        Number of worker processes
+
+    Examples
+    --------
+    >>> with TCFProcessPool(8) as pool:
+    ...     tcfile = TCFileRI3D('data.TCF', pool=pool)
+    ...     data = tcfile.read(0)
+    ...     store = TCFZarrStore('data.TCF', pool=pool)
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, mp_context=None):
+        """Initialize TCFProcessPool.
+
+        Parameters
+        ----------
+        max_workers : int, optional
+            Number of worker processes. Defaults to the number of CPUs
+        mp_context : multiprocessing context, optional
+            Defaults to 'spawn', as forking a process with open HDF5 files is unsafe
+        """
+        if mp_context is None:
+            mp_context = multiprocessing.get_context('spawn')
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+        self.max_workers = self._executor._max_workers
+
+    def submit(self, reader, key: int, region=None) -> Future:
+        """Schedule a region read.
+
+        Parameters
+        ----------
+        reader : TCFileAbstract
+            Reader of an image type (BF is not supported)
+        key : int
+            Index of the image
+        region : tuple[slice], optional
+            See `TCFileAbstract.read`
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future resolving to the decoded numpy array
+        """
+        reader.get_data_location(key)
+        region = reader._normalize_region(region)
+        shape = tuple(len(range(r.start, r.stop, r.step)) for r in region)
+        dtype = reader._get_output_dtype(key)
+        result = Future()
+        if 0 in shape:
+            result.set_result(np.empty(shape, dtype=dtype))
+            return result
+
+        shm = SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+        try:
+            task = self._executor.submit(_worker_read, reader, key, region, shm.name, shape, dtype.str)
+        except BaseException:
+            # shut down or broken pool: the block would never be collected
+            shm.close()
+            shm.unlink()
+            raise
+
+        def collect(task):
+            try:
+                task.result()
+                data = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+                result.set_result(data)
+            except BaseException as e:
+                result.set_exception(e)
+            finally:
+                shm.close()
+                shm.unlink()
+
+        task.add_done_callback(collect)
+        return result
+
+    def read(self, reader, key: int, region=None) -> np.ndarray:
+        """Read a region in a worker process. See `submit`."""
+        return self.submit(reader, key, region).result()
+
+    def map(self, reader, keys, region=None) -> List[np.ndarray]:
+        """Read the same region of several images in parallel."""
+        futures = [self.submit(reader, key, region) for key in keys]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Shut down the worker processes."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        """Context manager entry."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.close()
+        return False
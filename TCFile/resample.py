@@ -0,0 +1,168 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+@lru_cache(maxsize=256)
+def _linear_plan(size_in: int, res_in: float, res_out: float, origin: float,
+                 start: int, stop: int, step: int) -> Tuple[np.ndarray, ...]:
+    '''
+    Return the linear interpolation weights of output samples [start:stop:step] along one axis.
+    Output sample i lies at origin + i * res_out in the physical coordinates of the source.
+
+    Return
+    ------
+    lo, hi : numpy.ndarray[intp]
+        source indices surrounding each output sample
+    weight : numpy.ndarray[float32]
+        weight of hi. lo gets 1 - weight
+    inside : numpy.ndarray[bool] or None
+        samples within the source. None if all of them are.
+    '''
+    positions = (origin + np.arange(start, stop, step) * res_out) / res_in
+    # tolerate rounding errors at the borders
+    inside = (positions > -1e-6) & (positions < size_in - 1 + 1e-6)
+    positions = np.clip(positions, 0, size_in - 1)
+    lo = np.minimum(np.floor(positions).astype(np.intp), size_in - 1)
+    hi = np.minimum(lo + 1, size_in - 1)
+    weight = (positions - lo).astype(np.float32)
+    inside = None if inside.all() else inside
+    for array in (lo, hi, weight, inside):
+        # shared by every caller of the cache
+        if array is not None:
+            array.setflags(write=False)
+    return lo, hi, weight, inside
+
+
+class TCFResampled:
+    '''
+    Lazy view of a TCF reader resampled to a target voxel size by linear interpolation.
+    Every read only decodes the source slabs surrounding the requested output region.
+    Samples are placed at multiples of the voxel size from `origin`, the first source voxel by default.
+    Samples outside of the source are zero.
+
+    Attributes
+    ----------
+    reader : TCFileAbstract
+        source reader. Other attributes (length, dt, tcfname, ...) are those of the reader.
+    voxel_size : tuple[float]
+        (unit: μm) target voxel size per axis
+    data_shape : list[int]
+        shape of single shot data after resampling
+    data_resolution : list[float]
+        (unit: μm) resolution after resampling, i.e. voxel_size
+    origin : tuple[float]
+        (unit: μm) position of the first sample relative to the first source voxel
+    workers : int or None
+        number of threads interpolating a read in parallel slabs
+    '''
+    def __init__(self, reader, voxel_size:Union[float, Sequence[float]], workers:Optional[int] = None,
+                 shape:Optional[Sequence[int]] = None, origin:Optional[Sequence[float]] = None):
+        '''
+        Paramters
+        ---------
+        reader : TCFileAbstract
+            reader of RI or FL data
+        voxel_size : float or sequence of float
+            (unit: μm) target voxel size. A single value gives isotropic voxels.
+        workers : int or None
+            number of threads. None uses one per CPU, 1 disables threads.
+        shape : sequence of int or None
+            shape of the resampled data. None covers the extent of the source.
+        origin : sequence of float or None
+            (unit: μm) position of the first sample relative to the first source voxel. None is zero.
+
+        Raises
+        ------
+        ValueError
+            If voxel_size or the resolution of the reader is not positive
+        '''
+        self.reader = reader
+        if np.ndim(voxel_size) == 0:
+            voxel_size = (voxel_size,) * reader.data_ndim
+        if len(voxel_size) != reader.data_ndim:
+            raise ValueError(f'voxel_size must have {reader.data_ndim} values')
+        self.voxel_size = tuple(float(v) for v in voxel_size)
+        if min(self.voxel_size) <= 0 or min(reader.data_resolution) <= 0:
+            raise ValueError('voxel_size and the resolution of the data must be positive')
+        self.workers = workers
+        self._shape = None if shape is None else [int(s) for s in shape]
+        self.origin = (0.,) * reader.data_ndim if origin is None else tuple(float(o) for o in origin)
+
+    def __getattr__(self, name):
+        if name == 'reader':
+            raise AttributeError(name)
+        return getattr(self.reader, name)
+
+    @property
+    def data_shape(self) -> list:
+        if self._shape is not None:
+            return list(self._shape)
+        return [int(np.floor((size - 1) * res / vs + 1e-6)) + 1
+                for size, res, vs in zip(self.reader.data_shape, self.reader.data_resolution, self.voxel_size)]
+
+    @property
+    def data_resolution(self) -> list:
+        return list(self.voxel_size)
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, key:int) -> np.ndarray:
+        return self.read(key)
+
+    def _get_output_dtype(self, key:int) -> np.dtype:
+        return np.dtype(np.float32)
+
+    def read(self, key:int, region = None) -> np.ndarray:
+        '''
+        Read a sub-region of a single resampled image.
+
+        Parameters
+        ----------
+        key : int
+            index of the image
+        region : tuple[slice] or None
+            slices in resampled coordinates. None reads the whole image.
+
+        Return
+        ------
+        data : numpy.ndarray[float32]
+        '''
+        if region is None:
+            region = ()
+        if isinstance(region, slice):
+            region = (region,)
+        region = tuple(region) + (slice(None),) * (self.reader.data_ndim - len(region))
+        region = tuple(slice(*r.indices(size)) for r, size in zip(region, self.data_shape))
+
+        # split the first axis into slabs interpolated in parallel
+        outputs = range(region[0].start, region[0].stop, region[0].step)
+        nslabs = min(self.workers or os.cpu_count() or 1, len(outputs))
+        if nslabs <= 1:
+            return self._read_region(key, region)
+        slabs = [outputs[i * len(outputs) // nslabs:(i + 1) * len(outputs) // nslabs] for i in range(nslabs)]
+        slab_regions = [(slice(slab.start, slab.stop, slab.step),) + region[1:] for slab in slabs]
+        with ThreadPoolExecutor(self.workers) as executor:
+            return np.concatenate(list(executor.map(lambda r: self._read_region(key, r), slab_regions)))
+
+    def _read_region(self, key:int, region:tuple) -> np.ndarray:
+        plans = [_linear_plan(int(size), float(res), vs, o, r.start, r.stop, r.step)
+                 for size, res, vs, o, r in zip(self.reader.data_shape, self.reader.data_resolution,
+                                                self.voxel_size, self.origin, region)]
+        shape = tuple(len(plan[0]) for plan in plans)
+        if 0 in shape or any(inside is not None and not inside.any() for _, _, _, inside in plans):
+            return np.zeros(shape, dtype=np.float32)
+        source_region = tuple(slice(int(lo.min()), int(hi.max()) + 1) for lo, hi, _, _ in plans)
+        data = np.asarray(self.reader.read(key, source_region), dtype=np.float32)
+        for axis, ((lo, hi, weight, inside), source) in enumerate(zip(plans, source_region)):
+            low = np.take(data, lo - source.start, axis=axis)
+            high = np.take(data, hi - source.start, axis=axis)
+            weight = weight.reshape((-1,) + (1,) * (data.ndim - axis - 1))
+            data = low + (high - low) * weight
+            if inside is not None:
+                data *= inside.reshape(weight.shape)
+        return data
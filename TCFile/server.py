@@ -0,0 +1,427 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .TCFile_class import file_identity
+from .zarr_store import TCFZarrStore
+
+# metadata documents gathered into the consolidated `.zmetadata`
+_METADATA_NAMES = ('.zgroup', '.zattrs', '.zarray')
+# smaller bodies are not worth compressing
+_MIN_COMPRESS_NBYTES = 256
+# the store is read-only, so request bodies are discarded. Larger ones are refused without being read
+_MAX_BODY_NBYTES = 64 * 2**10
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'Content-Length, Content-Range, Content-Encoding, ETag, Last-Modified',
+}
+
+
+class _Response:
+    def __init__(self, status: int, headers: Optional[Dict[str, str]] = None, body: bytes = b''):
+        self.status = status
+        self.headers = dict(_CORS_HEADERS)
+        self.headers.update(headers or {})
+        self.body = body
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Return whether the Accept-Encoding header allows gzip."""
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            q = re.search(r'q\s*=\s*([0-9.]+)', params)
+            return q is None or float(q.group(1)) > 0
+    return False
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the [start, stop) bytes of a single range request, or None if it cannot be satisfied.
+
+    Raises
+    ------
+    ValueError
+        If the header is not a single byte range, in which case it is ignored
+    """
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', value)
+    if match is None or match.group(1) == match.group(2) == '':
+        raise ValueError(value)
+    first, last = match.groups()
+    if first == '':
+        # suffix range: the last bytes
+        length = int(last)
+        return (max(size - length, 0), size) if length > 0 and size > 0 else None
+    start = int(first)
+    stop = size if last == '' else min(int(last) + 1, size)
+    if last != '' and int(last) < start:
+        raise ValueError(value)
+    return (start, stop) if start < size else None
+
+
+class TCFZarrServer:
+    """Serve `TCFZarrStore` instances over HTTP as Zarr v2 hierarchies, e.g. for napari or neuroglancer.
+
+    Each store is mounted at ``/<name>/`` and its keys are served as files, together with a consolidated
+    ``.zmetadata``. Requests are handled concurrently by asyncio, while HDF5 reads and compression run
+    in a thread pool. Responses support single byte ranges, ETag and Last-Modified validation (derived
+    from the file identity, so unchanged chunks are not decoded again for revalidation), gzip
+    compression when accepted by the client and CORS for browser viewers.
+
+    Attributes
+    ----------
+    stores : dict[str, TCFZarrStore]
+        Served stores by name
+    host : str
+        Address the server listens on
+    port : int
+        Port the server listens on. Assigned by the system once started if 0 was given
+
+    Examples
+    --------
+    >>> server = TCFZarrServer({'cell': TCFZarrStore('cell.TCF')}, host='0.0.0.0', port=8000)
+    >>> server.run()  # then zarr.open_group('http://host:8000/cell', mode='r')
+    """
+
+    def __init__(self, stores: Mapping[str, TCFZarrStore], host: str = '127.0.0.1', port: int = 8000,
+                 workers: Optional[int] = None, compresslevel: int = 6):
+        """Initialize TCFZarrServer.
+
+        Parameters
+        ----------
+        stores : dict[str, TCFZarrStore]
+            Stores by name. Names must not contain '/'
+        host : str
+            Address to listen on. '0.0.0.0' accepts remote viewers
+        port : int
+            Port to listen on. 0 picks a free port
+        workers : int, optional
+            Number of threads reading chunks. Defaults to that of `ThreadPoolExecutor`
+        compresslevel : int
+            gzip compression level of the responses
+
+        Raises
+        ------
+        ValueError
+            If a store name is invalid
+        """
+        for name in stores:
+            if not name or '/' in name:
+                raise ValueError(f'Invalid store name: {name!r}')
+        self.stores = dict(stores)
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.compresslevel = compresslevel
+        self._identities = {}
+        self._connections = {}
+        self._executor = None
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    def url(self, name: str) -> str:
+        """Return the URL of a served store."""
+        return f'http://{self.host}:{self.port}/{name}'
+
+    async def start(self):
+        """Start listening. Stores are served until `close`."""
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stop listening and wait for the pending reads. The stores are not closed."""
+        if self._server is not None:
+            self._server.close()
+            # idle keep-alive connections would otherwise outlive the server
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    def run(self):
+        """Serve until interrupted."""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    def start_background(self) -> 'TCFZarrServer':
+        """Serve from a daemon thread, e.g. in a notebook whose event loop is already running. See `stop`."""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        """Stop a server started by `start_background`."""
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+            self._loop = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                content_length = headers.get('content-length', '0')
+                body_nbytes = int(content_length) if content_length.isdigit() else 0
+                if body_nbytes <= _MAX_BODY_NBYTES:
+                    await reader.readexactly(body_nbytes)
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    method, response, keep_alive = 'GET', _Response(HTTPStatus.BAD_REQUEST), False
+                else:
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                    if body_nbytes > _MAX_BODY_NBYTES:
+                        # the unread body would be parsed as the next request, so the connection is closed
+                        response, keep_alive = _Response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE), False
+                    else:
+                        try:
+                            response = await self._respond(method, target, headers)
+                        except Exception:
+                            response = _Response(HTTPStatus.INTERNAL_SERVER_ERROR)
+                self._write_response(writer, method, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, method: str, response: _Response, keep_alive: bool):
+        status = HTTPStatus(response.status)
+        headers = dict(response.headers)
+        headers['Content-Length'] = str(len(response.body))
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        lines = [f'HTTP/1.1 {status.value} {status.phrase}'] + [f'{k}: {v}' for k, v in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(response.body)
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _respond(self, method: str, target: str, headers: Dict[str, str]) -> _Response:
+        if method == 'OPTIONS':
+            return _Response(HTTPStatus.NO_CONTENT, {
+                'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
+                'Access-Control-Allow-Headers': headers.get('access-control-request-headers', '*'),
+            })
+        if method not in ('GET', 'HEAD'):
+            return _Response(HTTPStatus.METHOD_NOT_ALLOWED, {'Allow': 'GET, HEAD, OPTIONS'})
+
+        name, _, key = unquote(urlsplit(target).path).strip('/').partition('/')
+        if not name:
+            body = json.dumps({'stores': sorted(self.stores)}).encode()
+            return _Response(HTTPStatus.OK, {'Content-Type': 'application/json'}, body)
+        store = self.stores.get(name)
+        if store is None:
+            return _Response(HTTPStatus.NOT_FOUND)
+
+        identity = await self._identity(name, store)
+        etag, last_modified = None, None
+        if identity is not None:
+            version = repr((identity, key, store._chunk_size, store.voxel_size, store.statistics))
+            etag = f'"{hashlib.sha256(version.encode()).hexdigest()[:32]}"'
+            if isinstance(identity[2], int):
+                last_modified = formatdate(identity[2] / 1e9, usegmt=True)
+            if self._not_modified(headers, etag, identity):
+                return _Response(HTTPStatus.NOT_MODIFIED, self._validators(etag, last_modified))
+
+        body = await self._run(self._get, store, key)
+        if body is None:
+            return _Response(HTTPStatus.NOT_FOUND)
+        if etag is None:
+            # file objects have no identity: validate the content itself
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            if self._not_modified(headers, etag, None):
+                return _Response(HTTPStatus.NOT_MODIFIED, self._validators(etag, last_modified))
+
+        response_headers = self._validators(etag, last_modified)
+        response_headers['Content-Type'] = 'application/json' if key.rpartition('/')[2] in _METADATA_NAMES + ('.zmetadata',) \
+            else 'application/octet-stream'
+        response_headers['Accept-Ranges'] = 'bytes'
+        response_headers['Vary'] = 'Accept-Encoding'
+
+        if 'range' in headers and headers.get('if-range', etag) == etag:
+            try:
+                byte_range = _parse_range(headers['range'], len(body))
+            except ValueError:
+                pass
+            else:
+                if byte_range is None:
+                    response_headers['Content-Range'] = f'bytes */{len(body)}'
+                    return _Response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, response_headers)
+                start, stop = byte_range
+                response_headers['Content-Range'] = f'bytes {start}-{stop - 1}/{len(body)}'
+                return _Response(HTTPStatus.PARTIAL_CONTENT, response_headers, body[start:stop])
+
+        if len(body) >= _MIN_COMPRESS_NBYTES and _accepts_gzip(headers.get('accept-encoding', '')):
+            body = await self._run(lambda data: gzip.compress(data, self.compresslevel, mtime=0), body)
+            response_headers['Content-Encoding'] = 'gzip'
+            # a representation of its own
+            response_headers['ETag'] = f'{etag[:-1]}-gzip"'
+        return _Response(HTTPStatus.OK, response_headers, body)
+
+    @staticmethod
+    def _validators(etag: str, last_modified: Optional[str]) -> Dict[str, str]:
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if last_modified is not None:
+            headers['Last-Modified'] = last_modified
+        return headers
+
+    @staticmethod
+    def _not_modified(headers: Dict[str, str], etag: str, identity: Optional[tuple]) -> bool:
+        if 'if-none-match' in headers:
+            tags = [tag.strip() for tag in headers['if-none-match'].split(',')]
+            return '*' in tags or any(tag.removeprefix('W/') in (etag, f'{etag[:-1]}-gzip"') for tag in tags)
+        if 'if-modified-since' in headers and identity is not None and isinstance(identity[2], int):
+            try:
+                since = parsedate_to_datetime(headers['if-modified-since']).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return identity[2] // 10**9 <= since
+        return False
+
+    async def _identity(self, name: str, store: TCFZarrStore) -> Optional[tuple]:
+        """Return the identity of the file of a store. A live file is picked up again when it changed."""
+        if name in self._identities and not store.live:
+            return self._identities[name]
+        try:
+            identity = await self._run(file_identity, store.tcf_path, store.storage_options)
+        except OSError:
+            identity = None
+        if name in self._identities and identity != self._identities[name]:
+            await self._run(store.refresh)
+        self._identities[name] = identity
+        return identity
+
+    @staticmethod
+    def _get(store: TCFZarrStore, key: str) -> Optional[bytes]:
+        if key == '.zmetadata':
+            return _consolidated_metadata(store)
+        if key.endswith('/.zgroup') and key[:-len('/.zgroup')] in _intermediate_groups(store):
+            return json.dumps({'zarr_format': 2}).encode()
+        try:
+            return store[key]
+        except (KeyError, IndexError, ValueError):
+            return None
+
+
+def _intermediate_groups(store: TCFZarrStore) -> set:
+    """Return the parents of nested groups, e.g. FL3D of FL3D/CH0, which clients expect to be groups."""
+    parents = set()
+    for group_name in store.available_groups:
+        parts = group_name.split('/')
+        parents.update('/'.join(parts[:i]) for i in range(1, len(parts)))
+    return parents - set(store.available_groups)
+
+
+def _consolidated_metadata(store: TCFZarrStore) -> bytes:
+    """Return the consolidated metadata of a store, so that viewers open it with a single request."""
+    keys = ['.zgroup', '.zattrs']
+    for group_name in store.available_groups:
+        keys += [f'{group_name}/.zgroup', f'{group_name}/.zattrs', f'{group_name}/0/.zarray']
+    metadata = {f'{group_name}/.zgroup': {'zarr_format': 2} for group_name in sorted(_intermediate_groups(store))}
+    for key in keys:
+        try:
+            metadata[key] = json.loads(store[key])
+        except KeyError:
+            continue
+    return json.dumps({'zarr_consolidated_format': 1, 'metadata': metadata}, indent=2).encode()
+
+
+def _store_names(paths: Sequence[str]) -> Dict[str, str]:
+    """Name the stores after their files, with a suffix for duplicates."""
+    names = {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path.rstrip('/')))[0] or 'data'
+        name, i = stem, 1
+        while name in names:
+            i += 1
+            name = f'{stem}-{i}'
+        names[name] = path
+    return names
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """Command line entry point: ``tcf-serve data.TCF [more.TCF ...] --port 8000``."""
+    parser = argparse.ArgumentParser(prog='tcf-serve', description='Serve TCF files as Zarr hierarchies over HTTP.')
+    parser.add_argument('paths', nargs='+', help='TCF files or fsspec URLs, served at /<file name>')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on (default: 8000)')
+    parser.add_argument('--workers', type=int, default=None, help='threads reading chunks')
+    parser.add_argument('--profile', choices=('full-volume', 'z-slab', 'random-patch'), default=None,
+                        help='HDF5 chunk cache access profile')
+    parser.add_argument('--chunk-cache', default=None, help='directory of a persistent chunk cache')
+    parser.add_argument('--voxel-size', type=float, default=None, help='serve isotropic voxels of this size in μm')
+    parser.add_argument('--fl-on-ri', action='store_true', help='add fluorescence resampled onto the RI grid')
+    parser.add_argument('--statistics', action='store_true', help='publish contrast limits from the statistics')
+    parser.add_argument('--live', action='store_true', help='follow ongoing acquisitions')
+    args = parser.parse_args(argv)
+
+    stores = {
+        name: TCFZarrStore(path, profile=args.profile, chunk_cache=args.chunk_cache, voxel_size=args.voxel_size,
+                           fl_on_ri=args.fl_on_ri, statistics=args.statistics, live=args.live)
+        for name, path in _store_names(args.paths).items()
+    }
+    server = TCFZarrServer(stores, args.host, args.port, args.workers)
+    for name in stores:
+        print(f'Serving {stores[name].tcf_path} at {server.url(name)}')
+    try:
+        server.run()
+    finally:
+        for store in stores.values():
+            store.close()
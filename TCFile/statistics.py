@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class ImageStatistics(NamedTuple):
+    """Exact summary statistics and a fixed-bin histogram of one or more images."""
+    count: int
+    min: float
+    max: float
+    mean: float
+    std: float
+    histogram: np.ndarray
+    bin_edges: np.ndarray
+
+    def percentile(self, q):
+        """Approximate percentile(s) q (0-100) by interpolating the cumulative histogram."""
+        cdf = np.concatenate([[0], np.cumsum(self.histogram)]) / max(self.count, 1)
+        values = np.interp(np.asarray(q, dtype=np.float64) / 100, cdf, self.bin_edges)
+        return np.clip(values, self.min, self.max)
+
+    def to_dict(self) -> dict:
+        return {
+            'count': int(self.count), 'min': float(self.min), 'max': float(self.max),
+            'mean': float(self.mean), 'std': float(self.std),
+            'histogram': self.histogram.tolist(), 'bin_edges': self.bin_edges.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, value: dict) -> 'ImageStatistics':
+        return cls(value['count'], value['min'], value['max'], value['mean'], value['std'],
+                   np.asarray(value['histogram'], dtype=np.int64), np.asarray(value['bin_edges'], dtype=np.float64))
+
+
+def _slab_statistics(data: np.ndarray, bins: int, value_range: Tuple[float, float]) -> ImageStatistics:
+    """Statistics of a slab. Values outside of value_range are counted in the outer bins."""
+    data = np.asarray(data).ravel()
+    bin_edges = np.linspace(value_range[0], value_range[1], bins + 1)
+    if data.size == 0:
+        return ImageStatistics(0, np.inf, -np.inf, 0., 0., np.zeros(bins, dtype=np.int64), bin_edges)
+    mean = data.mean(dtype=np.float64)
+    std = np.sqrt(np.mean(np.square(data - mean, dtype=np.float64)))
+    histogram, _ = np.histogram(np.clip(data, value_range[0], value_range[1]), bins=bins, range=value_range)
+    return ImageStatistics(data.size, float(data.min()), float(data.max()), float(mean), float(std),
+                           histogram.astype(np.int64), bin_edges)
+
+
+def merge_statistics(statistics: Sequence[ImageStatistics]) -> ImageStatistics:
+    """Merge the statistics of disjoint data sharing the same bin edges, e.g. every timepoint.
+
+    Means and variances are merged pairwise (Chan et al.), so the result is exact.
+    """
+    count, mean, m2 = 0, 0., 0.
+    for s in statistics:
+        if s.count == 0:
+            continue
+        total = count + s.count
+        delta = s.mean - mean
+        mean += delta * s.count / total
+        m2 += s.std ** 2 * s.count + delta ** 2 * count * s.count / total
+        count = total
+    return ImageStatistics(
+        count,
+        min(s.min for s in statistics),
+        max(s.max for s in statistics),
+        mean,
+        float(np.sqrt(m2 / count)) if count else 0.,
+        np.sum([s.histogram for s in statistics], axis=0, dtype=np.int64),
+        statistics[0].bin_edges,
+    )
+
+
+def _sidecar_path(tcfname) -> Optional[str]:
+    """Return the summary file stored next to a local TCF file, or None for URLs and file objects."""
+    if not isinstance(tcfname, (str, os.PathLike)) or '://' in str(tcfname):
+        return None
+    return f'{os.fspath(tcfname)}.stats.json'
+
+
+def _read_sidecar(path: str, identity: tuple) -> Dict[str, dict]:
+    """Return the cached entries of a summary file, or nothing if it belongs to another version of the file."""
+    try:
+        with open(path) as f:
+            content = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if content.get('identity') != list(identity):
+        return {}
+    return content.get('statistics', {})
+
+
+def _write_sidecar(path: str, identity: tuple, name: str, entries: Dict[int, ImageStatistics]):
+    """Add entries to a summary file. A read-only location silently disables the cache."""
+    statistics = _read_sidecar(path, identity)
+    statistics.setdefault(name, {}).update({str(k): s.to_dict() for k, s in entries.items()})
+    content = json.dumps({'identity': list(identity), 'statistics': statistics})
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(os.path.abspath(path)))
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,195 @@
+import os
+from typing import Dict, Optional, Tuple
+
+import h5py
+import numpy as np
+import xarray as xr
+from xarray.backends import BackendArray, BackendEntrypoint
+from xarray.core import indexing
+
+from .TCFile_class import TCFileRI3D, TCFileRI2DMIP, TCFileBF, TCFileFL3D, _is_fileobj
+
+# suffix of the dimensions of an image type whose grid differs from the one already named t/z/y/x
+_DIM_SUFFIXES = {'3D': 'ri', '2DMIP': 'ri', '3DFL': 'fl', 'BF': 'bf'}
+
+
+class TCFBackendArray(BackendArray):
+    """Lazy (T, ...) array of a TCF image type.
+
+    Outer indexers are mapped onto hyperslab reads of the timepoints they select,
+    so only the HDF5 chunks intersecting the selection are decoded.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.shape = (len(reader),) + tuple(int(s) for s in reader.data_shape)
+        if reader.imgtype == 'BF':
+            # RGB samples are stored along the last axis
+            self.shape = self.shape + (3,)
+        self.dtype = reader._get_output_dtype(0) if len(reader) else np.dtype(np.float32)
+
+    def __getitem__(self, key: indexing.ExplicitIndexer) -> np.ndarray:
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.OUTER, self._raw_indexing_method)
+
+    def _raw_indexing_method(self, key: tuple) -> np.ndarray:
+        """Read an outer selection given as one integer, slice or integer array per axis."""
+        ndim = self.reader.data_ndim
+        times = np.arange(self.shape[0])[key[0]]
+        # each spatial selection is read through the slice bounding it and refined in memory
+        region = []
+        selection = [0 if np.ndim(times) == 0 else slice(None)]
+        for k, size in zip(key[1:ndim + 1], self.shape[1:]):
+            if isinstance(k, slice):
+                region.append(slice(*k.indices(size)))
+                selection.append(slice(None))
+            elif np.ndim(k) == 0:
+                region.append(slice(int(k), int(k) + 1))
+                selection.append(0)
+            else:
+                k = np.asarray(k, dtype=np.int64)
+                start = int(k.min()) if k.size else 0
+                region.append(slice(start, int(k.max()) + 1 if k.size else start))
+                selection.append(k - start)
+        selection += list(key[ndim + 1:])
+
+        region = tuple(region)
+        data = np.stack([self.reader.read(int(t), region) for t in np.atleast_1d(times)])
+        # outer indexing, one axis at a time from the last one so that axis numbers stay valid
+        for axis in reversed(range(len(selection))):
+            k = selection[axis]
+            if isinstance(k, slice):
+                data = data[(slice(None),) * axis + (k,)]
+            else:
+                data = np.take(data, k, axis=axis)
+        return data
+
+
+def _chunks(reader) -> Optional[Tuple[int, ...]]:
+    """Return the HDF5 chunk shape of the first image, if it is chunked."""
+    if not len(reader):
+        return None
+    with reader._open() as tcf_io:
+        obj = reader._get_object(tcf_io, reader.get_data_location(0))
+        return obj.chunks if isinstance(obj, h5py.Dataset) else None
+
+
+def _open_readers(filename_or_obj, channels, reader_kwargs) -> Dict[str, object]:
+    """Open a reader per image type present in the file."""
+    readers = {}
+    for name, reader_class in (('RI3D', TCFileRI3D), ('RI2DMIP', TCFileRI2DMIP), ('BF', TCFileBF)):
+        try:
+            readers[name] = reader_class(filename_or_obj, **reader_kwargs)
+        except (AssertionError, KeyError):
+            pass
+    try:
+        reader = TCFileFL3D(filename_or_obj, channel=0, **reader_kwargs)
+    except (AssertionError, KeyError):
+        return readers
+    for ch in range(reader.max_channels) if channels is None else channels:
+        readers[f'FL3D_CH{ch}'] = reader if ch == 0 else TCFileFL3D(filename_or_obj, channel=ch, **reader_kwargs)
+    if channels is not None and 0 not in channels:
+        reader.close()
+    return readers
+
+
+def open_tcf_dataset(filename_or_obj, drop_variables=None, channels=None, **reader_kwargs) -> xr.Dataset:
+    """Open a TCF file as a lazily loaded xarray Dataset.
+
+    Every image type becomes a variable: RI3D (t, z, y, x), RI2DMIP (t, y, x), BF (t, y, x, rgb)
+    and FL3D_CH{n} (t, z, y, x). Coordinates are in seconds and micrometers.
+    Image types sharing a grid share their dimensions; the others get dimensions suffixed by
+    their modality (e.g. t_fl, z_fl).
+
+    Parameters
+    ----------
+    filename_or_obj : str or file object
+        Path, fsspec URL or file object of the TCF file
+    drop_variables : str or list[str], optional
+        Variables not to open
+    channels : list[int], optional
+        Fluorescence channels to open. Defaults to every channel
+    **reader_kwargs
+        pool, profile, rdcc_nbytes, rdcc_nslots, rdcc_w0, page_buf_size and storage_options.
+        See `TCFileAbstract`
+
+    Returns
+    -------
+    xarray.Dataset
+    """
+    if isinstance(drop_variables, str):
+        drop_variables = [drop_variables]
+    drop_variables = set(drop_variables or ())
+    readers = _open_readers(filename_or_obj, channels, reader_kwargs)
+    for name in drop_variables & set(readers):
+        readers.pop(name).close()
+    if not readers:
+        raise ValueError(f'No supported image types found in {filename_or_obj}')
+
+    coords: Dict[str, xr.Variable] = {}
+    variables: Dict[str, xr.Variable] = {}
+    for name, reader in readers.items():
+        axes = ('z', 'y', 'x')[3 - reader.data_ndim:]
+        axis_values = [('t', np.arange(len(reader)) * float(reader.dt), 's')]
+        axis_values += [(axis, np.arange(size) * float(resolution), 'um')
+                        for axis, size, resolution in zip(axes, reader.data_shape, reader.data_resolution)]
+        dims = []
+        for axis, values, units in axis_values:
+            dim = axis
+            if dim in coords and not np.array_equal(coords[dim].values, values):
+                dim = f'{axis}_{_DIM_SUFFIXES[reader.imgtype]}'
+            coords.setdefault(dim, xr.Variable(dim, values, {'units': units}))
+            dims.append(dim)
+        if reader.imgtype == 'BF':
+            dims.append('rgb')
+
+        array = TCFBackendArray(reader)
+        encoding = {}
+        chunks = _chunks(reader)
+        if chunks is not None:
+            encoding['preferred_chunks'] = dict(zip(dims, (1,) + tuple(chunks)))
+        attrs = {'imgtype': reader.imgtype}
+        if reader.imgtype in ('3D', '2DMIP'):
+            attrs['long_name'] = 'refractive index'
+        variables[name] = xr.Variable(dims, indexing.LazilyIndexedArray(array), attrs, encoding)
+
+    readers_list = list(readers.values())
+    format_version = readers_list[0].format_version
+    dataset = xr.Dataset(variables, coords=coords, attrs={'FormatVersion': format_version})
+    dataset.set_close(lambda: [reader.close() for reader in readers_list])
+    return dataset
+
+
+class TCFBackendEntrypoint(BackendEntrypoint):
+    """xarray backend of TCF files.
+
+    Examples
+    --------
+    >>> ds = xr.open_dataset('data.TCF', engine='tcf')
+    >>> ri = ds['RI3D'].sel(t=10.0, z=slice(5, 10)).load()
+    >>> ds = xr.open_dataset('data.TCF', engine='tcf', chunks={})  # dask arrays chunked like the file
+    """
+
+    description = 'Open TCF (Tomocube) files in xarray'
+    url = 'https://github.com/ehgus/TCFile'
+    open_dataset_parameters = ('filename_or_obj', 'drop_variables', 'channels', 'pool', 'profile',
+                               'rdcc_nbytes', 'rdcc_nslots', 'rdcc_w0', 'page_buf_size', 'storage_options')
+
+    def open_dataset(self, filename_or_obj, *, drop_variables=None, channels=None, pool=None, profile=None,
+                     rdcc_nbytes=None, rdcc_nslots=None, rdcc_w0=None, page_buf_size=None,
+                     storage_options=None) -> xr.Dataset:
+        """See `open_tcf_dataset`."""
+        if isinstance(filename_or_obj, os.PathLike):
+            filename_or_obj = os.fspath(filename_or_obj)
+        return open_tcf_dataset(filename_or_obj, drop_variables=drop_variables, channels=channels, pool=pool,
+                                profile=profile, rdcc_nbytes=rdcc_nbytes, rdcc_nslots=rdcc_nslots,
+                                rdcc_w0=rdcc_w0, page_buf_size=page_buf_size, storage_options=storage_options)
+
+    def guess_can_open(self, filename_or_obj) -> bool:
+        """Recognize the .TCF extension."""
+        if _is_fileobj(filename_or_obj):
+            return False
+        try:
+            return os.path.splitext(os.fspath(filename_or_obj))[1].lower() == '.tcf'
+        except TypeError:
+            return False
@@ -1,9 +1,12 @@
 import json
-import h5py
+import os
 import numpy as np
 from zarr.abc.store import Store
 from typing import Optional, Iterator, Dict, List, Tuple, Any
-from .TCFile_class import TCFileRI3D, TCFileFL3D
+from .TCFile_class import TCFileRI3D, TCFileFL3D, file_identity
+from .chunk_cache import DiskChunkCache
+from .statistics import merge_statistics
+from .memory import get_buffer_pool
 
 
 class TCFZarrStore(Store):
@@ -16,13 +19,26 @@ class TCFZarrStore(Store):
     Structure:
     - RI3D/: Refractive index 3D data as 4D array (TZYX)
     - FL3D/CH{n}/: Fluorescence 3D data, separate group per channel, 4D array (TZYX)
+    - FL3D_RI/CH{n}/: Fluorescence 3D data resampled onto the RI grid (opt-in, see `fl_on_ri`)
 
     Attributes
     ----------
-    tcf_path : str
-        Path to the TCF file
+    tcf_path : str or file object
+        Path, fsspec URL or file object of the TCF file
     available_groups : list[str]
         List of available Zarr groups
+    pool : TCFProcessPool or None
+        Process pool decoding the chunks
+    profile : str or None
+        HDF5 chunk cache access profile of the readers
+    live : bool
+        Whether the file is followed while it is being written. See `refresh`
+    chunk_cache : DiskChunkCache or None
+        Persistent cache of the chunks served by the store
+    voxel_size : tuple[float] or None
+        Voxel size of the resampled data served by the store
+    statistics : bool
+        Whether the OME omero window is computed from the data statistics
 
     Examples
     --------
@@ -35,15 +51,64 @@ class TCFZarrStore(Store):
     >>> print(ri_array.shape)  # (T, Z, Y, X)
     """
 
-    def __init__(self, tcf_path: str):
+    def __init__(self, tcf_path: str, pool=None, profile: Optional[str] = None,
+                 rdcc_nbytes: Optional[int] = None, rdcc_nslots: Optional[int] = None,
+                 rdcc_w0: Optional[float] = None, page_buf_size: Optional[int] = None, live: bool = False,
+                 storage_options: Optional[dict] = None, chunk_cache=None, voxel_size=None,
+                 fl_on_ri: bool = False, statistics: bool = False):
         """Initialize TCFZarrStore.
 
         Parameters
         ----------
-        tcf_path : str
-            Path to the TCF file
+        tcf_path : str or file object
+            Path, fsspec URL (e.g. 'http://...', 's3://...') or binary file object of the TCF file
+        pool : TCFProcessPool, optional
+            Process pool decoding the chunks outside of the h5py global lock.
+            The pool is not closed with the store.
+        profile : str, optional
+            'full-volume', 'z-slab' or 'random-patch'. Sizes the HDF5 chunk cache of each dataset
+            from its chunk shape. See `TCFileAbstract`
+        rdcc_nbytes, rdcc_nslots, rdcc_w0 : optional
+            HDF5 raw data chunk cache settings overriding the profile
+        page_buf_size : int, optional
+            HDF5 page buffer size for files written with paged aggregation
+        live : bool
+            Follow an ongoing acquisition. See `TCFileAbstract`
+        storage_options : dict, optional
+            Options of the fsspec filesystem for URLs, including `block_size` and `cache_type`
+            of the read cache. See `TCFileAbstract`
+        chunk_cache : DiskChunkCache or str, optional
+            Persistent cache, or its directory, keeping the chunks across sessions.
+            Entries are keyed by the file identity (path, size and modification time), so a rewritten
+            file never serves stale chunks. Disabled for file objects, whose identity is unknown.
+        voxel_size : float or tuple[float], optional
+            (Z, Y, X) voxel size in micrometers, or a single value for isotropic voxels.
+            Every group is then served resampled by linear interpolation, one chunk at a time,
+            and its OME scale reflects the new voxel size. See `TCFResampled`
+        fl_on_ri : bool
+            Add FL3D_RI/CH{n} groups serving every fluorescence channel resampled onto the RI grid
+            (or its resampled grid with voxel_size), chunk by chunk. See `TCFileFL3D.on_ri_grid`
+        statistics : bool
+            Publish the OME omero window of each group from the statistics of every timepoint: the exact
+            min/max and the 0.1/99.9 percentiles as contrast limits. They are computed on the first request
+            and cached next to the file. Otherwise the stored RIMin/RIMax are published when present.
+            See `TCFileAbstract.statistics`
         """
         self.tcf_path = tcf_path
+        self.pool = pool
+        self.profile = profile
+        self.live = live
+        self.storage_options = storage_options
+        self.statistics = statistics
+        if isinstance(chunk_cache, (str, os.PathLike)):
+            chunk_cache = DiskChunkCache(chunk_cache)
+        self.chunk_cache = chunk_cache
+        self._identity = file_identity(tcf_path, storage_options) if chunk_cache is not None else None
+        self._reader_kwargs = {
+            'pool': pool, 'profile': profile, 'rdcc_nbytes': rdcc_nbytes, 'rdcc_nslots': rdcc_nslots,
+            'rdcc_w0': rdcc_w0, 'page_buf_size': page_buf_size, 'live': live,
+            'storage_options': storage_options,
+        }
         self._tcfiles: Dict[str, Any] = {}
         self._metadata_cache: Dict[str, bytes] = {}
         self.available_groups: List[str] = []
@@ -51,33 +116,40 @@ class TCFZarrStore(Store):
         # Detect and initialize available image types
         self._initialize_tcfiles()
 
+        fl_on_ri_grid = {}
+        if fl_on_ri and 'RI3D' in self._tcfiles:
+            fl_on_ri_grid = {
+                f'FL3D_RI/{name.split("/")[-1]}': tcfile.on_ri_grid(voxel_size)
+                for name, tcfile in self._tcfiles.items() if name.startswith('FL3D/')
+            }
+        if voxel_size is not None:
+            self._tcfiles = {name: tcfile.resampled(voxel_size) for name, tcfile in self._tcfiles.items()}
+            voxel_size = self._tcfiles[self.available_groups[0]].voxel_size
+        self.voxel_size = voxel_size
+        self._tcfiles.update(fl_on_ri_grid)
+        self.available_groups.extend(fl_on_ri_grid)
+
         # Define chunk size (T, Z, Y, X)
         self._chunk_size = (1, 64, 256, 256)
 
     def _initialize_tcfiles(self):
         """Detect and initialize available TCFile instances."""
-        # Try to open RI3D
+        # Readers fail on missing image types. Probing through them instead of a separate handle
+        # avoids opening remote files once more.
         try:
-            with h5py.File(self.tcf_path, 'r') as f:
-                if '3D' in f.get('Data', {}):
-                    self._tcfiles['RI3D'] = TCFileRI3D(self.tcf_path)
-                    self.available_groups.append('RI3D')
+            self._tcfiles['RI3D'] = TCFileRI3D(self.tcf_path, **self._reader_kwargs)
+            self.available_groups.append('RI3D')
         except Exception:
             pass
 
         # Try to open FL3D with all available channels
         try:
-            with h5py.File(self.tcf_path, 'r') as f:
-                if '3DFL' in f.get('Data', {}):
-                    # Create first channel to get metadata
-                    tcfile_fl = TCFileFL3D(self.tcf_path, channel=0)
-                    max_channels = tcfile_fl.max_channels
-
-                    # Initialize all channels
-                    for ch in range(max_channels):
-                        group_name = f'FL3D/CH{ch}'
-                        self._tcfiles[group_name] = TCFileFL3D(self.tcf_path, channel=ch)
-                        self.available_groups.append(group_name)
+            # The first channel gives the number of channels
+            tcfile_fl = TCFileFL3D(self.tcf_path, channel=0, **self._reader_kwargs)
+            for ch in range(tcfile_fl.max_channels):
+                group_name = f'FL3D/CH{ch}'
+                self._tcfiles[group_name] = tcfile_fl if ch == 0 else TCFileFL3D(self.tcf_path, channel=ch, **self._reader_kwargs)
+                self.available_groups.append(group_name)
         except Exception:
             pass
 
@@ -170,10 +242,31 @@ class TCFZarrStore(Store):
                     'type': 'none'
                 }]
             }
+            omero = self._generate_omero_metadata(group_name, tcfile)
+            if omero is not None:
+                metadata['omero'] = omero
             return json.dumps(metadata).encode()
 
         raise KeyError(meta_type)
 
+    def _generate_omero_metadata(self, group_name: str, tcfile) -> Optional[Dict[str, Any]]:
+        """Generate the OME omero rendering settings of a group, if its value range is known."""
+        if self.statistics:
+            stats = merge_statistics(tcfile.statistics())
+            window = {'min': stats.min, 'max': stats.max}
+            window['start'], window['end'] = (float(v) for v in stats.percentile([0.1, 99.9]))
+        else:
+            with tcfile._open() as tcf_io:
+                group_path = f'/Data/{tcfile.imgtype}'
+                ri_min, ri_max = tcfile.get_attr(tcf_io, group_path, 'RIMin'), tcfile.get_attr(tcf_io, group_path, 'RIMax')
+            if ri_min is None or ri_max is None:
+                return None
+            window = {'min': float(ri_min), 'max': float(ri_max), 'start': float(ri_min), 'end': float(ri_max)}
+        return {
+            'channels': [{'label': group_name, 'color': 'FFFFFF', 'active': True, 'window': window}],
+            'rdefs': {'model': 'greyscale'},
+        }
+
     def _generate_array_metadata(self, group_name: str, array_name: str) -> bytes:
         """Generate array metadata (.zarray)."""
         if array_name != '0':
@@ -251,20 +344,19 @@ class TCFZarrStore(Store):
         x_start = x_idx * chunks[3]
         x_end = min(x_start + chunks[3], shape[3])
 
-        # Allocate output array
+        # Output array reused between chunks of the same shape
         chunk_shape = (t_end - t_start, z_end - z_start, y_end - y_start, x_end - x_start)
-        chunk_data = np.zeros(chunk_shape, dtype=np.float32)
-
-        # Read time slices
-        for t_offset, t in enumerate(range(t_start, t_end)):
-            # Get full 3D volume for this timepoint
-            volume_3d = tcfile[t]
+        buffer_pool = get_buffer_pool()
+        chunk_data = buffer_pool.acquire(chunk_shape, np.float32)
 
-            # Extract spatial chunk
-            spatial_chunk = volume_3d[z_start:z_end, y_start:y_end, x_start:x_end]
-            chunk_data[t_offset] = spatial_chunk
-
-        return chunk_data.tobytes(order='C')
+        # Read time slices, decoding only the HDF5 chunks intersecting the spatial chunk
+        region = (slice(z_start, z_end), slice(y_start, y_end), slice(x_start, x_end))
+        try:
+            for t_offset, t in enumerate(range(t_start, t_end)):
+                chunk_data[t_offset] = tcfile.read(t, region)
+            return chunk_data.tobytes(order='C')
+        finally:
+            buffer_pool.release(chunk_data)
 
     # Zarr Store Protocol Implementation (v3 API)
 
@@ -394,7 +486,14 @@ class TCFZarrStore(Store):
 
         # Chunk data
         if chunk_indices is not None:
-            return self._read_chunk(group_name, array_name, chunk_indices)
+            if self._identity is None:
+                return self._read_chunk(group_name, array_name, chunk_indices)
+            cache_key = DiskChunkCache.make_key(self._identity, key, self._chunk_size, self.voxel_size)
+            result = self.chunk_cache.get(cache_key)
+            if result is None:
+                result = self._read_chunk(group_name, array_name, chunk_indices)
+                self.chunk_cache.set(cache_key, result)
+            return result
 
         raise KeyError(key)
 
@@ -457,9 +556,40 @@ class TCFZarrStore(Store):
         """Return iterator over keys."""
         return iter(self)
 
+    def refresh(self) -> Dict[str, range]:
+        """Pick up timepoints appended to the file since the last refresh.
+
+        Only the metadata of groups whose shape or time step changed are invalidated.
+
+        Returns
+        -------
+        dict[str, range]
+            Indices of the new timepoints per group
+        """
+        info = lambda tcfile: (tcfile.length, list(tcfile.data_shape), tcfile.dt, list(tcfile.data_resolution))
+        old_info = {group_name: info(tcfile) for group_name, tcfile in self._tcfiles.items()}
+        # views of a group share the reader of the group, which is refreshed once
+        refreshed = {}
+        new_keys = {}
+        for group_name, tcfile in self._tcfiles.items():
+            reader = getattr(tcfile, 'reader', tcfile)
+            if id(reader) not in refreshed:
+                refreshed[id(reader)] = reader.refresh()
+            new_keys[group_name] = refreshed[id(reader)]
+            new_info = info(tcfile)
+            if new_info[:2] != old_info[group_name][:2]:
+                self._metadata_cache.pop(f'{group_name}/0/.zarray', None)
+            if new_info[2:] != old_info[group_name][2:] or (self.statistics and len(new_keys[group_name])):
+                self._metadata_cache.pop(f'{group_name}/.zattrs', None)
+        if self._identity is not None:
+            # chunks of the grown file are cached under its new identity
+            self._identity = file_identity(self.tcf_path, self.storage_options)
+        return new_keys
+
     def close(self):
         """Close all open file handles."""
-        # TCFile instances open/close HDF5 files per access, so no persistent handles to close
+        for tcfile in self._tcfiles.values():
+            tcfile.close()
         self._tcfiles.clear()
         self._metadata_cache.clear()
 
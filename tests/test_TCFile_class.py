@@ -1,6 +1,12 @@
 from . import SAMPLE_TCF_FILE
-from TCFile import TCFile
+from TCFile import TCFile, TCFZarrStore
+from TCFile.TCFile_class import TCFileRI3D, TCFileRI2DMIP, TCFileFL3D
 import numpy as np
+import pytest
+import shutil
+import h5py
+import io
+import os
 
 class TestTCFile:
 
@@ -26,3 +32,197 @@ class TestTCFile:
         tcfile = TCFile(SAMPLE_TCF_FILE,'3D')
         assert len(tcfile) == 10
         assert tcfile.dt >= 0
+
+    def test_read_region(self):
+        tcfile = TCFile(SAMPLE_TCF_FILE,'3D')
+        region = (slice(1, 5), slice(None), slice(2, 10, 2))
+        assert np.array_equal(tcfile.read(0, region), tcfile[0][region])
+
+    def test_project(self):
+        tcfile = TCFile(SAMPLE_TCF_FILE,'3D')
+        data = tcfile[0]
+        for axis_name, axis in zip(('z', 'y', 'x'), range(3)):
+            assert np.array_equal(tcfile.project(0, axis_name, 'max', use_stored=False), data.max(axis))
+            assert np.allclose(tcfile.project(0, axis_name, 'mean', workers=2), data.mean(axis))
+        region = (slice(2, 6), slice(1, 7), slice(None))
+        assert np.array_equal(tcfile.project(0, 'z', 'min', region=region), data[region].min(0))
+
+    def test_project_all(self):
+        tcfile = TCFile(SAMPLE_TCF_FILE,'3D')
+        projections = tcfile.project(axis='z', op='max')
+        assert projections.shape == (len(tcfile), *tcfile.data_shape[1:])
+        assert np.array_equal(projections[-1], tcfile[-1].max(0))
+
+    def test_access_profile(self):
+        reference = TCFile(SAMPLE_TCF_FILE,'3D')
+        for profile in ('full-volume', 'z-slab', 'random-patch'):
+            tcfile = TCFileRI3D(SAMPLE_TCF_FILE, profile=profile, rdcc_w0=0.5)
+            assert np.array_equal(tcfile.read(0, (slice(3, 4),)), reference[0][3:4])
+            with tcfile._open() as tcf_io:
+                dataset = tcfile._get_object(tcf_io, tcfile.get_data_location(0))
+                if dataset.chunks is not None:
+                    assert dataset.id.get_access_plist().get_chunk_cache()[2] == 0.5
+        with pytest.raises(ValueError):
+            TCFileRI3D(SAMPLE_TCF_FILE, profile='unknown')
+
+    def test_close(self):
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE, rdcc_nbytes=4 * 2**20)
+        data = tcfile.read(0)
+        tcfile.close()
+        assert np.array_equal(tcfile.read(0), data)
+        with tcfile:
+            assert np.array_equal(tcfile[0], data)
+
+    def test_writable_after_read(self, tmp_path):
+        tcfname = str(tmp_path / 'sample.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcfname)
+        tcfile = TCFileRI3D(tcfname)
+        tcfile[0]
+        store = TCFZarrStore(tcfname)
+        store['RI3D/0/0.0.0.0']
+        # readers without configured caches do not keep the file locked
+        with h5py.File(tcfname, 'r+') as tcf_io:
+            tcf_io['/'].attrs['Edited'] = 1
+        assert np.array_equal(tcfile[1], TCFileRI3D(SAMPLE_TCF_FILE)[1])
+
+    def test_refresh(self, tmp_path):
+        tcfname = str(tmp_path / 'live.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcfname)
+        tcfile = TCFileRI3D(tcfname, live=True)
+        length = len(tcfile)
+        with h5py.File(tcfname, 'r+') as tcf_io:
+            tcf_io.copy(tcf_io[f'/Data/3D/{length - 1:06d}'], f'/Data/3D/{length:06d}')
+            tcf_io['/Data/3D'].attrs['DataCount'] = np.array([length + 1])
+        assert list(tcfile.refresh()) == [length]
+        assert list(tcfile.refresh()) == []
+        assert np.array_equal(tcfile[length], tcfile[length - 1])
+        assert list(tcfile.watch(poll_interval=0.01, timeout=0.05, start=length - 1)) == [length - 1, length]
+
+    def test_remote(self):
+        fsspec = pytest.importorskip('fsspec')
+        with open(SAMPLE_TCF_FILE, 'rb') as f:
+            content = f.read()
+        fsspec.filesystem('memory').pipe('/remote.TCF', content)
+        data = TCFileRI3D(SAMPLE_TCF_FILE)[0]
+        assert np.array_equal(TCFileRI3D('memory://remote.TCF', storage_options={'block_size': 2**16})[0], data)
+        assert np.array_equal(TCFileRI3D(io.BytesIO(content))[0], data)
+
+    def test_remote_project(self):
+        fsspec = pytest.importorskip('fsspec')
+        with open(SAMPLE_TCF_FILE, 'rb') as f:
+            fsspec.filesystem('memory').pipe('/remote-mip.TCF', f.read())
+        storage_options = {'block_size': 2**16, 'cache_type': 'readahead'}
+        tcfile = TCFileRI3D('memory://remote-mip.TCF', storage_options=storage_options, profile='z-slab')
+        # the stored MIP is read with the options of the reader, by a reader kept across calls
+        assert np.array_equal(tcfile.project(0), TCFileRI2DMIP(SAMPLE_TCF_FILE)[0])
+        mip = tcfile._mip
+        assert mip.storage_options == storage_options and mip.profile == 'z-slab'
+        assert np.array_equal(tcfile.project(1), TCFileRI2DMIP(SAMPLE_TCF_FILE)[1])
+        assert tcfile._mip is mip
+        tcfile.close()
+        assert tcfile._mip is None and mip._handle is None
+
+    def test_resampled(self):
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE)
+        view = tcfile.resampled(0.3)
+        assert view.data_resolution == [0.3, 0.3, 0.3]
+        data, source = view[0], tcfile[0]
+        assert data.shape == tuple(view.data_shape)
+        # the second plane lies a third of the way from the first source plane to the second one
+        assert np.allclose(data[1, ::2, ::2], (source[0] * 2 / 3 + source[1] / 3)[::3, ::3], atol=1e-5)
+        region = (slice(10, 20), slice(5, 50, 3), slice(None, None, -1))
+        assert np.allclose(view.read(0, region), data[region])
+
+    def test_on_ri_grid(self):
+        tcfile = TCFileFL3D(SAMPLE_TCF_FILE, channel=1)
+        view = tcfile.on_ri_grid()
+        assert view.data_shape == list(TCFileRI3D(SAMPLE_TCF_FILE).data_shape)
+        data, source = view[0], tcfile[0].astype(np.float32)
+        # the sample has twice the RI sampling of FL with centered fields of view,
+        # so every other RI voxel lies a quarter of a FL voxel after a FL voxel
+        for axis in range(3):
+            source = np.moveaxis(source, axis, 0)
+            source = np.moveaxis(source[:-1] * 0.75 + source[1:] * 0.25, 0, axis)
+        assert np.allclose(data[1:-1:2, 1:-1:2, 1:-1:2], source, rtol=1e-5)
+        # outside of the FL field of view
+        assert data[0, 0, 0] == 0
+
+    def test_statistics(self, tmp_path):
+        tcfname = str(tmp_path / 'stats.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcfname)
+        tcfile = TCFileRI3D(tcfname)
+        stats = tcfile.statistics(2, bins=256, workers=2)
+        data = tcfile[2]
+        assert (stats.count, stats.min, stats.max) == (data.size, data.min(), data.max())
+        assert np.isclose(stats.mean, data.mean(dtype=np.float64))
+        assert np.isclose(stats.std, data.std(dtype=np.float64))
+        assert stats.histogram.sum() == data.size
+        assert abs(stats.percentile(50) - np.median(data)) <= np.diff(stats.bin_edges)[0]
+
+        # later queries are served from the summary next to the file
+        assert os.path.exists(tcfname + '.stats.json')
+        tcfile._map_slabs = None
+        assert tcfile.statistics(2, bins=256).to_dict() == stats.to_dict()
+
+    def test_timepoint_attrs(self, tmp_path):
+        tcfname = str(tmp_path / 'live.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcfname)
+        tcfile = TCFileRI3D(tcfname, live=True)
+        attrs = tcfile.get_timepoint_attrs()
+        with h5py.File(tcfname, 'r') as tcf_io:
+            for name in ('PositionX', 'Time', 'RIMax'):
+                expected = [tcf_io[tcfile._data_path(i)].attrs[name][0] for i in range(len(tcfile))]
+                assert np.array_equal(attrs[name], expected)
+        assert attrs['RecordingTime'].dtype.kind == 'U'
+        with pytest.raises(KeyError):
+            tcfile.get_timepoint_attrs(['Missing'])
+
+        # appended images are read on the next call
+        length = len(tcfile)
+        with h5py.File(tcfname, 'r+') as tcf_io:
+            tcf_io.copy(tcf_io[f'/Data/3D/{length - 1:06d}'], f'/Data/3D/{length:06d}')
+            del tcf_io[f'/Data/3D/{length:06d}'].attrs['PositionX']
+            tcf_io[f'/Data/3D/{length:06d}'].attrs['Time'] = np.array([1e3])
+        tcfile.refresh()
+        attrs = tcfile.get_timepoint_attrs(['PositionX', 'Time'])
+        assert np.isnan(attrs['PositionX'][-1]) and attrs['Time'][-1] == 1e3
+        assert np.array_equal(attrs['Time'][:-1], tcfile.get_timepoint_attrs()['Time'][:-1])
+
+    def test_tiled_format(self, tmp_path):
+        tcfname = str(tmp_path / 'tiled.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcfname)
+        with h5py.File(tcfname, 'r+') as tcf_io:
+            truth = tcf_io['/Data/3D/000000'][()]
+            del tcf_io['/Data/3D/000000']
+            group = tcf_io.create_group('/Data/3D/000000')
+            group.attrs['ScalarType'] = np.array([0])
+            # a full-resolution tile padded beyond its last voxel, and a tile sampled every other voxel
+            # overlapping it along X
+            tiles = {'TILE_000': (1, 0, 47, np.pad(truth[..., :48], ((0, 0), (0, 0), (0, 4)))),
+                     'TILE_001': (2, 40, 95, truth[::2, ::2, 40::2])}
+            for name, (step, first, last, data) in tiles.items():
+                tile = group.create_dataset(name, data=data)
+                tile.attrs['SamplingStep'] = np.array([step])
+                for axis, offset, last_idx in zip('ZYX', (0, 0, first), (39, 99, last)):
+                    tile.attrs[f'DataIndexOffsetPoint{axis}'] = np.array([offset])
+                    tile.attrs[f'DataIndexLastPoint{axis}'] = np.array([last_idx])
+        upsampled = truth[::2, ::2, 40::2].astype(np.float32)
+        for axis in range(3):
+            upsampled = np.repeat(upsampled, 2, axis=axis)
+        expected = np.concatenate([truth[..., :40], (truth[..., 40:48] + upsampled[..., :8]) / 2, upsampled[..., 8:]], axis=2) / 1e4
+
+        tcfile = TCFileRI3D(tcfname)
+        with pytest.warns(UserWarning):
+            data = tcfile[0]
+        assert np.allclose(data, expected)
+        region = (slice(2, 30), slice(10, 90, 3), slice(41, 70))
+        assert np.allclose(tcfile.read(0, region), expected[region])
+        with pytest.warns(UserWarning):
+            lazy = tcfile.__getitem__(0, array_type='dask')
+        assert lazy.chunksize == (40, 100, 56)
+        assert np.allclose(lazy[region].compute(), expected[region])
+
+        # exported tiles keep their values when the crop starts within a subsampled voxel
+        from TCFile import export_subset
+        export_subset(tcfname, str(tmp_path / 'crop.TCF'), imgtypes=['3D'], time=0, region=region[:1] + (slice(10, 90), slice(41, 70)))
+        assert np.allclose(TCFileRI3D(str(tmp_path / 'crop.TCF')).read(0), expected[region[:1] + (slice(10, 90), slice(41, 70))])
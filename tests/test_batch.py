@@ -0,0 +1,65 @@
+import numpy as np
+import h5py
+from TCFile import read_many, clear_reader_cache
+from TCFile.TCFile_class import TCFileRI3D
+from . import SAMPLE_TCF_FILE
+
+
+class TestReadMany:
+    """Test suite for read_many function."""
+
+    def test_stream(self):
+        """Test that every file is yielded once with its data."""
+        expected = TCFileRI3D(SAMPLE_TCF_FILE).read(1, (slice(0, 3),))
+        results = list(read_many([SAMPLE_TCF_FILE] * 3, '3D', 1, region=(slice(0, 3),), workers=2))
+        assert sorted(result.index for result in results) == [0, 1, 2]
+        for result in results:
+            assert result.error is None
+            np.testing.assert_array_equal(result.data, expected)
+
+    def test_stack(self):
+        """Test stacked output."""
+        stacked, errors = read_many([SAMPLE_TCF_FILE, SAMPLE_TCF_FILE], '3D', -1, stack=True)
+        assert errors == {}
+        assert stacked.shape == (2, *TCFileRI3D(SAMPLE_TCF_FILE).data_shape)
+        np.testing.assert_array_equal(stacked[1], TCFileRI3D(SAMPLE_TCF_FILE)[-1])
+
+    def test_errors(self, tmp_path):
+        """Test that failing files do not abort the batch."""
+        paths = [SAMPLE_TCF_FILE, str(tmp_path / 'missing.TCF'), SAMPLE_TCF_FILE]
+        stacked, errors = read_many(paths, '3D', 0, region=(slice(0, 1),), stack=True)
+        assert list(errors) == [1]
+        assert np.all(stacked[1] == 0)
+        np.testing.assert_array_equal(stacked[2], stacked[0])
+
+    def test_reader_cache(self, tmp_path, monkeypatch):
+        """Test that readers evicted from the cache are closed."""
+        import shutil
+        from TCFile import batch
+        monkeypatch.setattr(batch, '_MAX_CACHED_READERS', 2)
+        monkeypatch.setattr(batch, '_readers', type(batch._readers)())
+        created, closed = [], []
+        create_reader = batch._create_reader
+
+        def create_tracked_reader(*args):
+            reader = create_reader(*args)
+            close = reader.close
+            reader.close = lambda: closed.append(reader) or close()
+            created.append(reader)
+            return reader
+
+        monkeypatch.setattr(batch, '_create_reader', create_tracked_reader)
+        paths = []
+        for i in range(4):
+            paths.append(str(tmp_path / f'{i}.TCF'))
+            shutil.copy(SAMPLE_TCF_FILE, paths[-1])
+        _, errors = read_many(paths, '2DMIP', 0, workers=4, stack=True)
+        assert errors == {}
+        assert len(batch._readers) == 2 and not batch._reader_users
+        cached = list(batch._readers.values())
+        assert all((reader in closed) != (reader in cached) for reader in created)
+        # the cached readers do not keep their file locked
+        with h5py.File(cached[0].tcfname, 'r+'):
+            pass
+        clear_reader_cache()
+        assert not batch._readers and all(reader in closed for reader in created)
@@ -0,0 +1,51 @@
+import os
+import time
+from TCFile import DiskChunkCache, TCFZarrStore
+from . import SAMPLE_TCF_FILE
+
+
+class TestDiskChunkCache:
+
+    def test_set_get(self, tmp_path):
+        cache = DiskChunkCache(str(tmp_path))
+        key = DiskChunkCache.make_key(('data.TCF', 1, 2), 'RI3D/0/0.0.0.0')
+        assert cache.get(key) is None
+        cache.set(key, b'chunk')
+        assert cache.get(key) == b'chunk'
+        # entries persist across instances
+        assert DiskChunkCache(str(tmp_path)).get(key) == b'chunk'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_eviction(self, tmp_path):
+        cache = DiskChunkCache(str(tmp_path), max_nbytes=300)
+        keys = [DiskChunkCache.make_key(i) for i in range(3)]
+        for key in keys:
+            cache.set(key, bytes(100))
+            time.sleep(0.01)
+        # the oldest entry becomes the most recently used one
+        os.utime(cache._path(keys[0]))
+        cache.set(DiskChunkCache.make_key(3), bytes(100))
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None
+        assert cache.nbytes <= 270
+
+    def test_overwrite(self, tmp_path):
+        cache = DiskChunkCache(str(tmp_path), max_nbytes=300)
+        key = DiskChunkCache.make_key(0)
+        for size in (100, 200, 150, 250):
+            cache.set(key, bytes(size))
+        # rewriting an entry counts its new size only, so nothing is evicted
+        assert cache._nbytes == 250
+        assert cache.get(key) == bytes(250)
+
+    def test_store(self, tmp_path):
+        store = TCFZarrStore(SAMPLE_TCF_FILE, chunk_cache=str(tmp_path))
+        key = f'{store.available_groups[0]}/0/0.0.0.0'
+        data = store[key]
+        assert store.chunk_cache.misses == 1
+
+        # a new session is served from the cache without decoding
+        cached_store = TCFZarrStore(SAMPLE_TCF_FILE, chunk_cache=str(tmp_path))
+        cached_store._read_chunk = None
+        assert cached_store[key] == data
+        assert cached_store.chunk_cache.hits == 1
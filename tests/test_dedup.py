@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import h5py
+import numpy as np
+import pytest
+from TCFile import export_subset, TCFZarrStore
+from TCFile.TCFile_class import TCFileRI3D, TCFileRI2DMIP
+from . import SAMPLE_TCF_FILE
+
+
+@pytest.fixture
+def static_timelapse(tmp_path):
+    # a timelapse in which every tomogram is the first one
+    tcfname = str(tmp_path / 'static.TCF')
+    shutil.copy(SAMPLE_TCF_FILE, tcfname)
+    with h5py.File(tcfname, 'r+') as tcf_io:
+        for t in range(1, tcf_io['/Data/3D'].attrs['DataCount'][0]):
+            data_path = f'/Data/3D/{t:06d}'
+            attrs = dict(tcf_io[data_path].attrs)
+            del tcf_io[data_path]
+            tcf_io.copy(tcf_io['/Data/3D/000000'], data_path)
+            tcf_io[data_path].attrs.update(attrs)
+    return tcfname
+
+
+class TestDedupExport:
+
+    def test_export(self, static_timelapse, tmp_path):
+        output_path = str(tmp_path / 'static.tcfd')
+        export_subset(static_timelapse, output_path)
+        with open(os.path.join(output_path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        source, exported = TCFileRI3D(static_timelapse), TCFileRI3D(output_path)
+        # the chunks of the tomograms are stored once
+        chunks = manifest['datasets']['/Data/3D/000001']
+        assert manifest['chunk_count'] - manifest['stored_chunk_count'] >= (len(source) - 1) * len(chunks)
+        assert chunks == manifest['datasets']['/Data/3D/000000']
+
+        assert len(exported) == len(source)
+        for t in range(len(source)):
+            assert np.array_equal(exported[t], source[t])
+        region = (slice(3, 9), slice(None, None, 3), slice(10, 40, 2))
+        assert np.array_equal(exported.read(1, region), source.read(1, region))
+        assert np.array_equal(TCFileRI2DMIP(output_path)[0], TCFileRI2DMIP(static_timelapse)[0])
+
+    def test_zarr_store(self, static_timelapse, tmp_path):
+        output_path = str(tmp_path / 'static.tcfd')
+        export_subset(static_timelapse, output_path, imgtypes=['3D'])
+        source, exported = TCFZarrStore(static_timelapse), TCFZarrStore(output_path)
+        assert exported['RI3D/0/.zarray'] == source['RI3D/0/.zarray']
+        assert exported['RI3D/0/2.0.0.0'] == source['RI3D/0/2.0.0.0']
+
+    def test_reexport(self, tmp_path):
+        output_path = str(tmp_path / 'sample.tcfd')
+        export_subset(SAMPLE_TCF_FILE, output_path, format='dedup', time=slice(0, 2))
+        # raw chunks are copied from the chunk store
+        export_subset(output_path, str(tmp_path / 'copy.TCF'))
+        assert np.array_equal(TCFileRI3D(str(tmp_path / 'copy.TCF'))[1], TCFileRI3D(SAMPLE_TCF_FILE)[1])
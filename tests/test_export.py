@@ -0,0 +1,70 @@
+import os
+import shutil
+import subprocess
+import sys
+import h5py
+import numpy as np
+import pytest
+from TCFile import export_subset, TCFZarrStore
+from TCFile.TCFile_class import TCFileRI3D, TCFileFL3D
+from . import SAMPLE_TCF_FILE
+
+REGION = (slice(16, 32), slice(64, 100), slice(0, 64))
+
+
+class TestExport:
+
+    def test_export_tcf(self, tmp_path):
+        output_path = str(tmp_path / 'subset.TCF')
+        export_subset(SAMPLE_TCF_FILE, output_path, time=slice(2, 8, 2), region=REGION, channels=[1])
+        tcfile, exported = TCFileRI3D(SAMPLE_TCF_FILE), TCFileRI3D(output_path)
+        assert len(exported) == 3
+        assert list(exported.data_shape) == [16, 36, 64]
+        assert exported.dt == tcfile.dt * 2
+        for i, t in enumerate(range(2, 8, 2)):
+            assert np.array_equal(exported[i], tcfile[t][REGION])
+        # fluorescence keeps the same field of view and time window
+        fl = TCFileFL3D(output_path, channel=0)
+        assert fl.max_channels == 1
+        assert len(fl) == 2
+        assert TCFZarrStore(output_path).available_groups == ['RI3D', 'FL3D/CH0']
+
+    def test_export_aligned_chunks(self, tmp_path):
+        output_path = str(tmp_path / 'subset.TCF')
+        region = (slice(16, 32), slice(0, 64), slice(0, 64))
+        export_subset(SAMPLE_TCF_FILE, output_path, imgtypes=['3D'], region=region)
+        tcfile, exported = TCFileRI3D(SAMPLE_TCF_FILE), TCFileRI3D(output_path)
+        assert all(np.array_equal(exported[t], tcfile[t][region]) for t in range(len(tcfile)))
+
+    def test_export_tcf_workers(self, tmp_path):
+        serial, parallel = str(tmp_path / 'serial.TCF'), str(tmp_path / 'parallel.TCF')
+        export_subset(SAMPLE_TCF_FILE, serial, time=slice(0, 4), region=REGION)
+        # slabs are decoded by worker processes and written in order
+        export_subset(SAMPLE_TCF_FILE, parallel, time=slice(0, 4), region=REGION, workers=2)
+        for imgtype in (TCFileRI3D, TCFileFL3D):
+            expected, exported = imgtype(serial), imgtype(parallel)
+            assert len(exported) == len(expected)
+            assert all(np.array_equal(exported[t], expected[t]) for t in range(len(expected)))
+
+    def test_missing_imgtypes_optimized(self, tmp_path):
+        tcf_path, output_path = str(tmp_path / 'ri.TCF'), str(tmp_path / 'subset.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcf_path)
+        with h5py.File(tcf_path, 'r+') as tcf_io:
+            del tcf_io['Data']['3DFL']
+        # missing image types are skipped without relying on assertions, which python -O strips
+        code = f'from TCFile import export_subset; export_subset({tcf_path!r}, {output_path!r}, imgtypes=["3D", "3DFL"], time=slice(0, 1))'
+        subprocess.run([sys.executable, '-O', '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)), check=True)
+        with h5py.File(output_path, 'r') as tcf_io:
+            assert list(tcf_io['Data']) == ['3D']
+
+    def test_export_ome_zarr(self, tmp_path):
+        zarr = pytest.importorskip('zarr')
+        output_path = str(tmp_path / 'subset.zarr')
+        export_subset(SAMPLE_TCF_FILE, output_path, time=slice(2, 8, 2), region=REGION, workers=4)
+        root = zarr.open_group(output_path, mode='r')
+        assert root['RI3D/0'].shape == (3, 16, 36, 64)
+        assert np.array_equal(root['RI3D/0'][1], TCFileRI3D(SAMPLE_TCF_FILE)[4][REGION])
+        transforms = root['RI3D'].attrs['multiscales'][0]['datasets'][0]['coordinateTransformations']
+        assert transforms[1]['translation'][1:] == [16 * 0.9, 64 * 0.2, 0.0]
+        with pytest.raises(ValueError):
+            export_subset(SAMPLE_TCF_FILE, output_path, imgtypes=['BF'])
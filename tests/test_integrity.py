@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import h5py
+import numpy as np
+import pytest
+from TCFile import create_manifest, verify
+from TCFile.integrity import main, _chunk_infos
+from . import SAMPLE_TCF_FILE
+
+
+@pytest.fixture
+def tcfname(tmp_path):
+    tcfname = str(tmp_path / 'archive.TCF')
+    shutil.copy(SAMPLE_TCF_FILE, tcfname)
+    return tcfname
+
+
+class TestIntegrity:
+
+    def test_manifest(self, tcfname):
+        result = create_manifest(tcfname, workers=1)
+        assert result.ok
+        with open(tcfname + '.manifest.json') as f:
+            manifest = json.load(f)
+        assert manifest == result.manifest
+        with h5py.File(tcfname, 'r') as tcf_io:
+            dataset = tcf_io['/Data/3D/000000']
+            assert len(manifest['datasets']['/Data/3D/000000']['hashes']) == dataset.id.get_num_chunks()
+        # datasets without chunks are hashed as a whole
+        assert list(manifest['datasets']['/Data/BF/000000']['hashes']) == ['']
+
+        # verified in worker processes
+        assert verify(tcfname, workers=2).ok
+
+    def test_corrupt_chunk(self, tcfname):
+        create_manifest(tcfname, workers=1)
+        with h5py.File(tcfname, 'r') as tcf_io:
+            info = tcf_io['/Data/3D/000003'].id.get_chunk_info(1)
+        with open(tcfname, 'r+b') as f:
+            f.seek(info.byte_offset + 100)
+            content = f.read(8)
+            f.seek(info.byte_offset + 100)
+            f.write(bytes(b ^ 0xFF for b in content))
+        result = verify(tcfname, workers=1)
+        assert [(p.path, p.chunk, p.kind) for p in result.problems] == [
+            ('/Data/3D/000003', ','.join(map(str, info.chunk_offset)), 'mismatch')]
+
+    def test_changed_datasets(self, tcfname):
+        create_manifest(tcfname, workers=1)
+        with h5py.File(tcfname, 'r+') as tcf_io:
+            del tcf_io['/Data/2DMIP/000001']
+            tcf_io['/Data/BF/000001'][0, 0, 0] += 1
+            tcf_io.create_dataset('/Data/extra', data=np.zeros(4))
+        kinds = {(p.path, p.kind) for p in verify(tcfname, workers=1).problems}
+        assert kinds == {('/Data/2DMIP/000001', 'missing'), ('/Data/BF/000001', 'mismatch'),
+                         ('/Data/extra', 'unexpected')}
+
+    def test_truncated_file(self, tcfname):
+        create_manifest(tcfname, workers=1)
+        os.truncate(tcfname, os.path.getsize(tcfname) - 4096)
+        result = verify(tcfname, workers=1)
+        assert not result.ok and result.problems[0].kind == 'corrupt'
+
+    def test_command(self, tcfname, capsys):
+        assert main(['--write', '--workers', '1', tcfname]) == 0
+        assert main(['--workers', '1', tcfname]) == 0
+        assert 'OK' in capsys.readouterr().out
+        os.remove(tcfname + '.manifest.json')
+        assert main(['--workers', '1', tcfname]) == 1
+
+
+def test_chunk_infos_without_chunk_iter():
+    class DatasetID:
+        # h5py older than 3.8 or built against HDF5 older than 1.12.3
+        def __init__(self, dsid):
+            self.get_num_chunks, self.get_chunk_info = dsid.get_num_chunks, dsid.get_chunk_info
+
+    with h5py.File(SAMPLE_TCF_FILE, 'r') as tcf_io:
+        dsid = tcf_io['/Data/3D/000000'].id
+        assert _chunk_infos(DatasetID(dsid)) == _chunk_infos(dsid)
+        assert len(_chunk_infos(dsid)) == dsid.get_num_chunks()
@@ -0,0 +1,113 @@
+import threading
+import numpy as np
+from TCFile import MemoryBudget, BufferPool, TCFPatchSampler, get_memory_budget
+from TCFile.TCFile_class import TCFileRI3D
+from . import SAMPLE_TCF_FILE
+
+
+class LRUCache:
+
+    def __init__(self, budget, name, priority):
+        self.entries = []
+        self.consumer = budget.register(name, self.evict, priority)
+
+    def add(self, nbytes):
+        self.entries.append(nbytes)
+        self.consumer.charge(nbytes)
+
+    def evict(self, nbytes):
+        freed = 0
+        while freed < nbytes and self.entries:
+            freed += self.entries.pop(0)
+        self.consumer.release(freed)
+        return freed
+
+
+class TestMemoryBudget:
+
+    def test_priority_eviction(self):
+        budget = MemoryBudget(limit=1000)
+        low = LRUCache(budget, 'low', priority=0)
+        high = LRUCache(budget, 'high', priority=1)
+        high.add(400)
+        low.add(400)
+        low.add(100)
+        # the lower priority cache is evicted first
+        high.add(300)
+        assert low.entries == [100]
+        assert high.entries == [400, 300]
+        assert budget.usage() == {'low': 100, 'high': 700, 'reserved': 0}
+        assert budget.nbytes <= budget.limit
+
+    def test_unregister(self):
+        budget = MemoryBudget(limit=1000)
+        cache = LRUCache(budget, 'cache', 0)
+        cache.add(100)
+        del cache
+        assert budget.nbytes == 0
+
+    def test_backpressure(self):
+        budget = MemoryBudget(limit=1000)
+        assert budget.reserve(800)
+        # a second reservation waits until the first one is returned
+        assert not budget.reserve(800, timeout=0.01)
+        threading.Timer(0.05, budget.unreserve, (800,)).start()
+        assert budget.reserve(800, timeout=5)
+        budget.unreserve(800)
+        assert budget.nbytes == 0
+
+    def test_buffer_pool(self):
+        budget = MemoryBudget(limit=1000)
+        pool = BufferPool(budget)
+        buffer = pool.acquire((10, 10), np.uint16)
+        pool.release(buffer)
+        assert budget.usage()['buffer pool'] == 200
+        assert pool.acquire((10, 10), np.uint16) is buffer
+        assert budget.usage()['buffer pool'] == 0
+
+        # idle buffers are the first memory evicted
+        pool.release(buffer)
+        LRUCache(budget, 'cache', 0).add(900)
+        assert budget.usage()['buffer pool'] == 0
+
+    def test_buffer_pool_limits(self):
+        budget = MemoryBudget(limit=1000)
+        pool = BufferPool(budget)
+        # the pool evicts its own least recently released buffers beyond the limit
+        buffers = [pool.acquire((10 + i, 10), np.uint16) for i in range(5)]
+        for buffer in buffers:
+            pool.release(buffer)
+        assert budget.usage()['buffer pool'] <= 1000
+        assert pool.acquire((14, 10), np.uint16) is buffers[-1]
+
+        pool = BufferPool(MemoryBudget(), max_buffers=2, max_idle_nbytes=500, max_buffer_nbytes=300)
+        for shape in ((10,), (11,), (12,)):
+            pool.release(pool.acquire(shape, np.uint8))
+        assert pool._count == 2
+        pool.release(pool.acquire((200, 2), np.uint8))
+        assert pool._nbytes <= 500
+        # large buffers are not pooled
+        large = pool.acquire((400,), np.uint8)
+        pool.release(large)
+        assert pool.acquire((400,), np.uint8) is not large
+
+    def test_reader_chunk_cache(self):
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE, profile='z-slab')
+        expected = tcfile[0]
+        assert np.array_equal(tcfile.read(0), expected)
+        assert tcfile._memory.nbytes > 0
+        # the budget closes the datasets of the reader to release their chunk caches
+        assert tcfile._evict_datasets(1) > 0
+        assert tcfile._memory.nbytes == 0
+        assert np.array_equal(tcfile.read(0), expected)
+        tcfile.close()
+        assert tcfile._memory.nbytes == 0
+
+    def test_patch_sampler(self):
+        sampler = TCFPatchSampler([SAMPLE_TCF_FILE], (4, 16, 16), num_patches=4, batch_size=2)
+        batches = list(sampler)
+        assert len(batches) == 2
+        assert sampler._memory.nbytes == sampler._cache_size > 0
+        assert get_memory_budget().usage()['reserved'] == 0
+        sampler.close()
+        assert sampler._memory.nbytes == 0
@@ -0,0 +1,73 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+from TCFile import TCFPatchSampler
+from TCFile.TCFile_class import TCFileRI3D
+from . import SAMPLE_TCF_FILE
+
+
+class TestTCFPatchSampler:
+    """Test suite for TCFPatchSampler class."""
+
+    def test_random_patches(self):
+        """Test that random patches match the corresponding region of the volume."""
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE)
+        sampler = TCFPatchSampler([SAMPLE_TCF_FILE], (2, 8, 16, 16), num_patches=5, batch_size=2, seed=3)
+        assert len(sampler) == 3
+
+        for index in range(len(sampler)):
+            batch = sampler[index]
+            assert batch.flags.c_contiguous
+            assert batch.dtype == np.float32
+            for patch, (_, t, z, y, x) in zip(batch, sampler.batch_locations(index)):
+                t = int(t)
+                expected = np.stack([tcfile[t + dt][z:z + 8, y:y + 16, x:x + 16] for dt in range(2)])
+                np.testing.assert_array_equal(patch, expected)
+
+    def test_grid_patches(self):
+        """Test that grid mode covers the whole volume."""
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE)
+        patch_shape = tuple(tcfile.data_shape)
+        sampler = TCFPatchSampler([SAMPLE_TCF_FILE], patch_shape, mode='grid', batch_size=4, dtype=np.float64)
+        assert sampler.num_patches == len(tcfile)
+        assert sampler[0].shape == (4,) + patch_shape
+        np.testing.assert_array_equal(sampler[0][1], tcfile[1])
+
+    def test_iteration(self):
+        """Test that prefetching iteration yields every batch in order."""
+        sampler = TCFPatchSampler([SAMPLE_TCF_FILE], (4, 8, 8), num_patches=7, batch_size=3)
+        batches = list(sampler)
+        assert len(batches) == len(sampler)
+        for index, batch in enumerate(batches):
+            np.testing.assert_array_equal(batch, sampler[index])
+
+    def test_concurrent_decoding(self):
+        """Test that threads sharing chunks decode each of them once."""
+        sampler = TCFPatchSampler([SAMPLE_TCF_FILE], (4, 8, 8), mode='grid', batch_size=4)
+        reader = sampler._readers[0]
+        read, decoded = reader.read, []
+
+        def read_unlocked(key, region=None):
+            decoded.append((key, str(region)))
+            return read(key, region)
+        reader.read = read_unlocked
+        with ThreadPoolExecutor(4) as executor:
+            batches = list(executor.map(sampler.__getitem__, [0] * 4))
+        for batch in batches[1:]:
+            np.testing.assert_array_equal(batch, batches[0])
+        assert len(decoded) == len(set(decoded)) == len(sampler._cache)
+        assert not sampler._decoding
+
+    def test_pickle(self):
+        """Test that the sampler can be sent to DataLoader workers."""
+        sampler = TCFPatchSampler([SAMPLE_TCF_FILE], (4, 8, 8), num_patches=4, batch_size=2)
+        sampler[0]
+        restored = pickle.loads(pickle.dumps(sampler))
+        assert len(restored._cache) == 0
+        np.testing.assert_array_equal(restored[1], sampler[1])
+
+    def test_invalid_patch_shape(self):
+        """Test that patches larger than the data are rejected."""
+        with pytest.raises(ValueError):
+            TCFPatchSampler([SAMPLE_TCF_FILE], (10**6, 8, 8), num_patches=1)
@@ -0,0 +1,47 @@
+import os
+import shutil
+import subprocess
+import sys
+import h5py
+import numpy as np
+from PIL import Image
+from TCFile import make_preview, generate_previews
+from TCFile.TCFile_class import TCFileRI2DMIP
+from . import SAMPLE_TCF_FILE
+
+
+class TestPreview:
+
+    def test_make_preview(self):
+        preview = make_preview(SAMPLE_TCF_FILE, size=32)
+        assert preview.dtype == np.uint8
+        assert max(preview.shape) <= 32
+        # 2DMIP is preferred and downsampled by block averaging
+        mip = TCFileRI2DMIP(SAMPLE_TCF_FILE)[0]
+        assert preview.shape == (mip.shape[0] // 4, mip.shape[1] // 4)
+        assert make_preview(SAMPLE_TCF_FILE, size=32, imgtype='BF').shape[-1] == 3
+        assert make_preview(SAMPLE_TCF_FILE, size=32, imgtype='3D').shape == preview.shape
+
+    def test_generate_previews(self, tmp_path):
+        output_dir = str(tmp_path / 'previews')
+        results = sorted(generate_previews([SAMPLE_TCF_FILE, 'missing.TCF'], output_dir, size=32, workers=1))
+        assert results[0].error is None and results[1].error is not None
+        assert np.array_equal(np.asarray(Image.open(results[0].output)), make_preview(SAMPLE_TCF_FILE, size=32))
+
+        # cached previews are returned without being generated again
+        mtime = os.stat(results[0].output).st_mtime_ns
+        cached, = generate_previews([SAMPLE_TCF_FILE], output_dir, size=32)
+        assert cached.output == results[0].output
+        assert os.stat(cached.output).st_mtime_ns == mtime
+
+    def test_missing_imgtypes_optimized(self, tmp_path):
+        tcf_path = str(tmp_path / 'bf.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcf_path)
+        with h5py.File(tcf_path, 'r+') as tcf_io:
+            for imgtype in ('2DMIP', '3D', '3DFL'):
+                del tcf_io['Data'][imgtype]
+        # missing image types are skipped without relying on assertions, which python -O strips
+        code = f'from TCFile import make_preview; print(make_preview({tcf_path!r}, size=32).shape[-1])'
+        output = subprocess.run([sys.executable, '-O', '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        assert output.split()[-1] == '3'
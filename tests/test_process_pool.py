@@ -0,0 +1,61 @@
+import json
+import pytest
+import numpy as np
+from TCFile import TCFProcessPool, TCFZarrStore
+from TCFile.TCFile_class import TCFileRI3D
+from . import SAMPLE_TCF_FILE
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with TCFProcessPool(2) as pool:
+        yield pool
+
+
+class TestTCFProcessPool:
+    """Test suite for TCFProcessPool class."""
+
+    def test_read(self, pool):
+        """Test that regions decoded by workers match local reads."""
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE)
+        region = (slice(1, 4), slice(None), slice(3, 11))
+        np.testing.assert_array_equal(pool.read(tcfile, 0, region), tcfile.read(0, region))
+
+    def test_map(self, pool):
+        """Test reading several timepoints at once."""
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE)
+        results = pool.map(tcfile, [0, -1], (slice(0, 2),))
+        np.testing.assert_array_equal(results[1], tcfile[-1][0:2])
+
+    def test_reader_backend(self, pool):
+        """Test that readers route reads and projections through the pool."""
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE, pool=pool)
+        np.testing.assert_array_equal(tcfile.read(1), TCFileRI3D(SAMPLE_TCF_FILE)[1])
+        np.testing.assert_allclose(tcfile.project(1, 'x', 'mean'), TCFileRI3D(SAMPLE_TCF_FILE)[1].mean(2), rtol=1e-6)
+        with pytest.raises(IndexError):
+            tcfile.read(len(tcfile))
+
+    def test_store_backend(self, pool):
+        """Test that the store decodes chunks through the pool."""
+        store = TCFZarrStore(SAMPLE_TCF_FILE, pool=pool)
+        group_name = store.available_groups[0]
+        zarray = json.loads(store[f'{group_name}/0/.zarray'])
+        assert len(store[f'{group_name}/0/0.0.0.0']) == np.prod(zarray['chunks']) * 4
+        assert store[f'{group_name}/0/0.0.0.0'] == TCFZarrStore(SAMPLE_TCF_FILE)[f'{group_name}/0/0.0.0.0']
+
+    def test_closed_pool(self, monkeypatch):
+        """Test that shared memory blocks are released when a read cannot be scheduled."""
+        import TCFile.process_pool
+        blocks = []
+
+        class TrackedSharedMemory(TCFile.process_pool.SharedMemory):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                blocks.append(self.name)
+        monkeypatch.setattr(TCFile.process_pool, 'SharedMemory', TrackedSharedMemory)
+        closed = TCFProcessPool(1)
+        closed.close()
+        with pytest.raises(RuntimeError):
+            closed.submit(TCFileRI3D(SAMPLE_TCF_FILE), 0)
+        with pytest.raises(FileNotFoundError):
+            TCFile.process_pool.SharedMemory(name=blocks[0])
@@ -0,0 +1,99 @@
+import gzip
+import json
+import socket
+import urllib.error
+import urllib.request
+import numpy as np
+import pytest
+import zarr
+from TCFile import TCFZarrServer, TCFZarrStore
+from TCFile.server import _parse_range, _store_names
+from . import SAMPLE_TCF_FILE
+
+
+@pytest.fixture
+def server():
+    store = TCFZarrStore(SAMPLE_TCF_FILE)
+    server = TCFZarrServer({'sample': store}, port=0).start_background()
+    yield server
+    server.stop()
+    store.close()
+
+
+def request(url, method='GET', **headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method=method, headers=headers)) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+class TestTCFZarrServer:
+
+    def test_zarr_client(self, server):
+        store = server.stores['sample']
+        root = zarr.open_group(server.url('sample'), mode='r', zarr_format=2)
+        remote = root['RI3D/0']
+        local = store._get_tcfile('RI3D')
+        assert remote.shape == (len(local), *local.data_shape)
+        assert np.array_equal(remote[0], local[0])
+        assert root['FL3D/CH0/0'].shape[0] == len(store._get_tcfile('FL3D/CH0'))
+
+    def test_listing_and_missing_keys(self, server):
+        status, _, body = request(f'http://{server.host}:{server.port}/')
+        assert status == 200 and json.loads(body) == {'stores': ['sample']}
+        assert request(f'{server.url("sample")}/RI3D/0/99.0.0.0')[0] == 404
+        assert request(f'{server.url("other")}/.zgroup')[0] == 404
+        assert request(f'{server.url("sample")}/.zgroup', method='PUT')[0] == 405
+
+        status, _, body = request(f'{server.url("sample")}/.zmetadata')
+        metadata = json.loads(body)['metadata']
+        assert 'RI3D/0/.zarray' in metadata
+
+    def test_large_body(self, server):
+        # the declared body is refused without being read
+        with socket.create_connection((server.host, server.port)) as sock:
+            sock.sendall(b'POST /sample/.zgroup HTTP/1.1\r\nHost: x\r\nContent-Length: 1000000000\r\n\r\n')
+            response = sock.makefile('rb').read()
+        assert response.startswith(b'HTTP/1.1 413')
+        status, _, _ = request(f'{server.url("sample")}/.zgroup', method='POST', **{'Content-Length': '0'})
+        assert status == 405
+
+    def test_range(self, server):
+        url = f'{server.url("sample")}/RI3D/0/0.0.0.0'
+        _, _, full = request(url)
+        status, headers, body = request(url, Range='bytes=100-199')
+        assert status == 206 and body == full[100:200]
+        assert headers['Content-Range'] == f'bytes 100-199/{len(full)}'
+        assert request(url, Range='bytes=-10')[2] == full[-10:]
+        assert request(url, Range=f'bytes={len(full)}-')[0] == 416
+
+    def test_validation(self, server):
+        url = f'{server.url("sample")}/RI3D/0/.zarray'
+        status, headers, _ = request(url)
+        assert status == 200 and headers['Last-Modified']
+        assert request(url, **{'If-None-Match': headers['ETag']})[0] == 304
+        assert request(url, **{'If-Modified-Since': headers['Last-Modified']})[0] == 304
+        assert request(url, method='HEAD')[2] == b''
+
+    def test_gzip(self, server):
+        url = f'{server.url("sample")}/RI3D/0/0.0.0.0'
+        _, headers, full = request(url)
+        assert 'Content-Encoding' not in headers
+        status, headers, body = request(url, **{'Accept-Encoding': 'gzip'})
+        assert headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(body) == full
+        assert 'Content-Encoding' not in request(url, **{'Accept-Encoding': 'gzip;q=0'})[1]
+
+
+def test_parse_range():
+    assert _parse_range('bytes=0-9', 100) == (0, 10)
+    assert _parse_range('bytes=90-', 100) == (90, 100)
+    assert _parse_range('bytes=-200', 100) == (0, 100)
+    assert _parse_range('bytes=100-', 100) is None
+    with pytest.raises(ValueError):
+        _parse_range('bytes=0-1,5-6', 100)
+
+
+def test_store_names():
+    assert list(_store_names(['a/cell.TCF', 'b/cell.TCF', 'c.TCF'])) == ['cell', 'cell-2', 'c']
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from TCFile.TCFile_class import TCFileRI3D, TCFileFL3D
+from . import SAMPLE_TCF_FILE
+
+xr = pytest.importorskip('xarray')
+from TCFile.xarray_backend import TCFBackendEntrypoint
+
+
+class TestTCFBackend:
+
+    def test_open_dataset(self):
+        ds = xr.open_dataset(SAMPLE_TCF_FILE, engine=TCFBackendEntrypoint)
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE)
+        assert ds['RI3D'].dims == ('t', 'z', 'y', 'x')
+        assert ds['RI3D'].shape == (len(tcfile), *tcfile.data_shape)
+        assert np.allclose(np.diff(ds['t']), tcfile.dt)
+        assert np.allclose(ds['x'][1], tcfile.data_resolution[-1])
+        assert 'FL3D_CH0' in ds and 'BF' in ds
+        assert TCFBackendEntrypoint().guess_can_open(SAMPLE_TCF_FILE)
+        ds.close()
+
+    def test_lazy_indexing(self):
+        ds = xr.open_dataset(SAMPLE_TCF_FILE, engine=TCFBackendEntrypoint)
+        tcfile = TCFileRI3D(SAMPLE_TCF_FILE)
+        expected = np.stack([tcfile[1], tcfile[3]])[:, 5, 10:20:3][..., [4, 2, 9]]
+        assert np.array_equal(ds['RI3D'].isel(t=[1, 3], z=5, y=slice(10, 20, 3), x=[4, 2, 9]).values, expected)
+        assert np.array_equal(ds['RI3D'].isel(t=2, x=slice(None, None, -1)).values, tcfile[2][..., ::-1])
+        fl = TCFileFL3D(SAMPLE_TCF_FILE, channel=1)
+        assert np.array_equal(ds['FL3D_CH1'].sel(t_fl=fl.dt).values, fl[1])
+
+    def test_drop_variables(self):
+        ds = xr.open_dataset(SAMPLE_TCF_FILE, engine=TCFBackendEntrypoint, drop_variables=['BF'], channels=[1])
+        assert set(ds.data_vars) == {'RI3D', 'RI2DMIP', 'FL3D_CH1'}
@@ -1,10 +1,40 @@
 import json
+import os
+import shutil
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import h5py
 import pytest
 import numpy as np
 from TCFile import TCFZarrStore
 from . import SAMPLE_TCF_FILE
 
 
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler serving byte ranges, standing in for an object store."""
+    requests = 0
+
+    def do_GET(self):
+        RangeRequestHandler.requests += 1
+        with open(self.translate_path(self.path), 'rb') as f:
+            content = f.read()
+        start, stop = 0, len(content) - 1
+        if 'Range' in self.headers:
+            start, stop = (int(v) if v else None for v in self.headers['Range'][len('bytes='):].split('-'))
+            stop = len(content) - 1 if stop is None else min(stop, len(content) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{stop}/{len(content)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(stop - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        self.wfile.write(content[start:stop + 1])
+
+    def log_message(self, format, *args):
+        pass
+
+
 class TestTCFZarrStore:
     """Test suite for TCFZarrStore class."""
 
@@ -293,6 +323,80 @@ class TestTCFZarrStore:
         with pytest.raises(KeyError):
             store[f'{group_name}/1/.zarray']
 
+    def test_access_profile(self):
+        """Test that chunk cache settings do not change chunk data."""
+        store = TCFZarrStore(SAMPLE_TCF_FILE, profile='z-slab', rdcc_nbytes=8 * 2**20)
+        group_name = store.available_groups[0]
+        assert store[f'{group_name}/0/0.0.0.0'] == TCFZarrStore(SAMPLE_TCF_FILE)[f'{group_name}/0/0.0.0.0']
+
+    def test_refresh(self, tmp_path):
+        """Test that appended timepoints only invalidate the affected metadata."""
+        tcf_path = str(tmp_path / 'live.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcf_path)
+        store = TCFZarrStore(tcf_path, live=True)
+        group_name = store.available_groups[0]
+        length = json.loads(store[f'{group_name}/0/.zarray'])['shape'][0]
+        zattrs = store[f'{group_name}/.zattrs']
+        assert all(len(new_keys) == 0 for new_keys in store.refresh().values())
+
+        data_path = store._get_tcfile(group_name).get_data_location(-1)
+        with h5py.File(tcf_path, 'r+') as f:
+            f.copy(f[data_path], data_path[:-6] + f'{length:06d}')
+        assert list(store.refresh()[group_name]) == [length]
+        assert json.loads(store[f'{group_name}/0/.zarray'])['shape'][0] == length + 1
+        assert store[f'{group_name}/.zattrs'] is zattrs
+
+    def test_remote(self):
+        """Test that a store over HTTP matches the local store with few range requests."""
+        pytest.importorskip('fsspec')
+        pytest.importorskip('aiohttp')
+        directory, filename = os.path.split(os.path.abspath(SAMPLE_TCF_FILE))
+        handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            RangeRequestHandler.requests = 0
+            store = TCFZarrStore(f'http://127.0.0.1:{server.server_port}/{filename}')
+            assert store.available_groups == TCFZarrStore(SAMPLE_TCF_FILE).available_groups
+            group_name = store.available_groups[0]
+            assert store[f'{group_name}/0/0.0.0.0'] == TCFZarrStore(SAMPLE_TCF_FILE)[f'{group_name}/0/0.0.0.0']
+            # readers fetch the file in a few large blocks instead of one request per HDF5 read
+            assert RangeRequestHandler.requests <= 2 * len(store.available_groups) + 2
+            store.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_voxel_size(self):
+        """Test that a resampled store reports the new shape and voxel size."""
+        store = TCFZarrStore(SAMPLE_TCF_FILE, voxel_size=0.3)
+        tcfile = store._get_tcfile('RI3D')
+        assert json.loads(store['RI3D/0/.zarray'])['shape'] == [len(tcfile)] + tcfile.data_shape
+        scale = json.loads(store['RI3D/.zattrs'])['multiscales'][0]['datasets'][0]['coordinateTransformations'][0]['scale']
+        assert scale[1:] == [0.3, 0.3, 0.3]
+        chunk = np.frombuffer(store['RI3D/0/0.0.0.0'], dtype=np.float32)
+        assert np.allclose(chunk.reshape(64, 67, 64), tcfile.read(0, (slice(0, 64),)))
+
+    def test_fl_on_ri(self):
+        """Test that FL channels are served on the RI grid."""
+        store = TCFZarrStore(SAMPLE_TCF_FILE, fl_on_ri=True)
+        assert 'FL3D_RI/CH1' in store.available_groups
+        ri_shape = json.loads(store['RI3D/0/.zarray'])['shape']
+        assert json.loads(store['FL3D_RI/CH1/0/.zarray'])['shape'][1:] == ri_shape[1:]
+        chunk = np.frombuffer(store['FL3D_RI/CH1/0/0.0.0.0'], dtype=np.float32)
+        assert np.array_equal(chunk.reshape(ri_shape[1:]), store._get_tcfile('FL3D/CH1').on_ri_grid()[0])
+
+    def test_omero_window(self, tmp_path):
+        """Test that the omero window is published from the stored range or the statistics."""
+        tcf_path = str(tmp_path / 'stats.TCF')
+        shutil.copy(SAMPLE_TCF_FILE, tcf_path)
+        window = json.loads(TCFZarrStore(tcf_path)['RI3D/.zattrs'])['omero']['channels'][0]['window']
+        assert window['start'] < window['end']
+        store = TCFZarrStore(tcf_path, statistics=True)
+        window = json.loads(store['FL3D/CH0/.zattrs'])['omero']['channels'][0]['window']
+        assert window['min'] <= window['start'] <= window['end'] <= window['max']
+        assert os.path.exists(tcf_path + '.stats.json')
+
     def test_close_method(self):
         """Test that close method works."""
         store = TCFZarrStore(SAMPLE_TCF_FILE)